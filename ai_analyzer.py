@@ -1,23 +1,96 @@
 import requests
 import json
 import re
-from typing import Any, Optional
+import threading
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Any, Optional
 
-try:
-    import json5
-    HAS_JSON5 = True
-except ImportError:
-    HAS_JSON5 = False
+# json5 只在 AI 响应不是合法 JSON 时才需要，首次使用时再导入
+HAS_JSON5 = find_spec('json5') is not None
 
 from logger import logger
 from config import Config
-from openai import OpenAI
+from llm_cache import cached_completion
+from metrics import AI_FALLBACKS, source_label
+import drain
+
+if TYPE_CHECKING:
+    # OpenAI SDK 导入耗时较长（约占应用导入时间的一半），在首次创建客户端时再导入
+    from openai import OpenAI
 
 # 类型别名
 WebhookData = dict[str, Any]
 AnalysisResult = dict[str, Any]
 ForwardResult = dict[str, Any]
 
+# 预编译的 JSON 修复 / 文本提取规则（gunicorn preload 时在 master 中编译一次，由所有 worker 共享）
+_LINE_COMMENT_RE = re.compile(r'//.*?$', re.MULTILINE)
+_BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+_LEADING_COMMA_RE = re.compile(r'([{\[])\s*,')
+_IMPORTANCE_HIGH_RE = re.compile(r'importance["\s:]+high', re.IGNORECASE)
+_IMPORTANCE_LOW_RE = re.compile(r'importance["\s:]+low', re.IGNORECASE)
+_HIGH_KEYWORDS_RE = re.compile(r'(高|critical|严重)')
+_LOW_KEYWORDS_RE = re.compile(r'(低|info|正常)')
+_SUMMARY_RE = re.compile(r'summary["\s:]+["\']([^"\']+)["\']', re.IGNORECASE)
+_ALERT_KEYWORDS_RE = re.compile(r'(告警|错误|异常|故障)')
+_EVENT_TYPE_RE = re.compile(r'event_type["\s:]+["\']([^"\']+)["\']', re.IGNORECASE)
+_ACTIONS_RE = re.compile(r'(?:操作|action)[^:]*[:：]\s*["\']?([^"\'}\],]+)', re.IGNORECASE)
+_RISKS_RE = re.compile(r'(?:风险|risk)[^:]*[:：]\s*["\']?([^"\'}\],]+)', re.IGNORECASE)
+_IMPACT_SCOPE_RE = re.compile(r'impact_scope["\s:]+["\']([^"\']+)["\']', re.IGNORECASE)
+
+# 复用的出站客户端（连接池在请求之间共享，避免每次重新建立 TCP/TLS 连接）
+_clients_lock = threading.Lock()
+_openai_client: Optional['OpenAI'] = None
+_http_session: Optional[requests.Session] = None
+
+
+def get_openai_client() -> 'OpenAI':
+    """获取共享的 OpenAI 客户端（内部 httpx 连接池线程安全）"""
+    global _openai_client
+    if _openai_client is None:
+        with _clients_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(
+                    api_key=Config.OPENAI_API_KEY,
+                    base_url=Config.OPENAI_API_URL,
+                    max_retries=Config.OPENAI_MAX_RETRIES
+                )
+    return _openai_client
+
+
+def get_http_session() -> requests.Session:
+    """获取共享的转发 HTTP 会话（连接池大小 HTTP_POOL_MAXSIZE）"""
+    global _http_session
+    if _http_session is None:
+        with _clients_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=10,
+                    pool_maxsize=Config.HTTP_POOL_MAXSIZE
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _http_session = session
+    return _http_session
+
+
+def reset_clients(close: bool = True) -> None:
+    """
+    丢弃共享客户端（下次使用时重新创建）
+
+    配置变更后调用时关闭旧连接；fork 之后在子进程中调用时传 close=False，
+    只丢弃从父进程继承的连接池，不操作父进程仍在使用的 socket。
+    """
+    global _openai_client, _http_session
+    with _clients_lock:
+        _openai_client = None
+        if close and _http_session is not None:
+            _http_session.close()
+        _http_session = None
+
 
 def fix_json_format(json_str: str) -> str:
     """修复常见的 JSON 格式错误"""
@@ -34,6 +107,7 @@ def fix_json_format(json_str: str) -> str:
     # 如果有 json5 库，使用它来解析（支持尾随逗号、单引号、注释等）
     if HAS_JSON5:
         try:
+            import json5
             parsed = json5.loads(json_str)
             # 转换回标准 JSON
             return json.dumps(parsed, ensure_ascii=False)
@@ -43,12 +117,12 @@ def fix_json_format(json_str: str) -> str:
     # 兖底: 简单的正则修复
     try:
         # 移除注释
-        json_str = re.sub(r'//.*?$', '', json_str, flags=re.MULTILINE)
-        json_str = re.sub(r'/\*.*?\*/', '', json_str, flags=re.DOTALL)
+        json_str = _LINE_COMMENT_RE.sub('', json_str)
+        json_str = _BLOCK_COMMENT_RE.sub('', json_str)
         # 修复尾随逗号
-        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+        json_str = _TRAILING_COMMA_RE.sub(r'\1', json_str)
         # 修复起始逗号
-        json_str = re.sub(r'([{\[])\s*,', r'\1', json_str)
+        json_str = _LEADING_COMMA_RE.sub(r'\1', json_str)
         
         json.loads(json_str)
         logger.debug("JSON 格式修复成功")
@@ -61,6 +135,7 @@ def fix_json_format(json_str: str) -> str:
 def extract_from_text(text: str, source: str) -> AnalysisResult:
     """从 AI 响应文本中提取关键信息（兖底策略）"""
     logger.info("使用文本提取策略解析 AI 响应")
+    AI_FALLBACKS.labels(source=source_label(source), reason='text_extract').inc()
     
     result = {
         'source': source,
@@ -73,41 +148,41 @@ def extract_from_text(text: str, source: str) -> AnalysisResult:
     
     try:
         # 提取重要性
-        if re.search(r'importance["\s:]+high', text, re.IGNORECASE):
+        if _IMPORTANCE_HIGH_RE.search(text):
             result['importance'] = 'high'
-        elif re.search(r'importance["\s:]+low', text, re.IGNORECASE):
+        elif _IMPORTANCE_LOW_RE.search(text):
             result['importance'] = 'low'
-        elif re.search(r'(高|critical|严重)', text):
+        elif _HIGH_KEYWORDS_RE.search(text):
             result['importance'] = 'high'
-        elif re.search(r'(低|info|正常)', text):
+        elif _LOW_KEYWORDS_RE.search(text):
             result['importance'] = 'low'
         
         # 提取摘要
-        summary_match = re.search(r'summary["\s:]+["\']([^"\']+)["\']', text, re.IGNORECASE)
+        summary_match = _SUMMARY_RE.search(text)
         if summary_match:
             result['summary'] = summary_match.group(1)
-        elif re.search(r'(告警|错误|异常|故障)', text):
+        elif _ALERT_KEYWORDS_RE.search(text):
             result['summary'] = '检测到系统告警或异常，需要关注'
         else:
             result['summary'] = 'Webhook 事件已接收，AI 分析结果解析不完整'
         
         # 提取事件类型
-        event_match = re.search(r'event_type["\s:]+["\']([^"\']+)["\']', text, re.IGNORECASE)
+        event_match = _EVENT_TYPE_RE.search(text)
         if event_match:
             result['event_type'] = event_match.group(1)
         
         # 提取建议操作
-        actions_match = re.findall(r'(?:操作|action)[^:]*[:：]\s*["\']?([^"\'}\],]+)', text, re.IGNORECASE)
+        actions_match = _ACTIONS_RE.findall(text)
         if actions_match:
             result['actions'] = [a.strip() for a in actions_match if a.strip()]
         
         # 提取风险
-        risks_match = re.findall(r'(?:风险|risk)[^:]*[:：]\s*["\']?([^"\'}\],]+)', text, re.IGNORECASE)
+        risks_match = _RISKS_RE.findall(text)
         if risks_match:
             result['risks'] = [r.strip() for r in risks_match if r.strip()]
         
         # 提取影响范围
-        impact_match = re.search(r'impact_scope["\s:]+["\']([^"\']+)["\']', text, re.IGNORECASE)
+        impact_match = _IMPACT_SCOPE_RE.search(text)
         if impact_match:
             result['impact_scope'] = impact_match.group(1)
         
@@ -120,21 +195,39 @@ def extract_from_text(text: str, source: str) -> AnalysisResult:
         return result
 
 
-def analyze_webhook_with_ai(webhook_data: WebhookData) -> AnalysisResult:
-    """使用 AI 分析 webhook 数据"""
-    # 检查是否启用 AI 分析
+def ai_unavailable_reason() -> Optional[str]:
+    """
+    AI 分析不可用的原因（需要降级为规则分析时返回降级原因，否则返回 None）
+    
+    Flask 和 ASGI 两条处理链路共用。
+    """
     if not Config.ENABLE_AI_ANALYSIS:
         logger.info("AI 分析功能已禁用，使用基础规则分析")
-        source = webhook_data.get('source', 'unknown')
-        parsed_data = webhook_data.get('parsed_data', {})
-        return analyze_with_rules(parsed_data, source)
-    
-    # 检查 API Key
-    if not Config.OPENAI_API_KEY:
+        return 'disabled'
+    # 回放模式只读缓存，不需要 API Key
+    if not Config.OPENAI_API_KEY and Config.LLM_CACHE_MODE != 'replay':
         logger.warning("OpenAI API Key 未配置，降级为规则分析")
-        source = webhook_data.get('source', 'unknown')
-        parsed_data = webhook_data.get('parsed_data', {})
-        return analyze_with_rules(parsed_data, source)
+        return 'no_api_key'
+    # 停机 drain 期间剩余时间不足以完成 AI 调用
+    left = drain.remaining()
+    if left is not None and left < drain.MIN_AI_SECONDS:
+        logger.warning("worker 正在停机，剩余时间不足，降级为规则分析")
+        return 'draining'
+    return None
+
+
+def fallback_to_rules(webhook_data: WebhookData, reason: str) -> AnalysisResult:
+    """记录降级原因并使用规则分析"""
+    source = webhook_data.get('source', 'unknown')
+    AI_FALLBACKS.labels(source=source_label(source), reason=reason).inc()
+    return analyze_with_rules(webhook_data.get('parsed_data', {}), source)
+
+
+def analyze_webhook_with_ai(webhook_data: WebhookData) -> AnalysisResult:
+    """使用 AI 分析 webhook 数据"""
+    reason = ai_unavailable_reason()
+    if reason:
+        return fallback_to_rules(webhook_data, reason)
     
     try:
         # 提取关键信息
@@ -144,28 +237,19 @@ def analyze_webhook_with_ai(webhook_data: WebhookData) -> AnalysisResult:
         # 使用真实的 OpenAI API 分析
         analysis = analyze_with_openai(parsed_data, source)
         
-        logger.info(f"AI 分析完成: {source}")
+        logger.info("AI 分析完成: %s", source, extra={'sampled': True})
         return analysis
         
     except Exception as e:
         logger.error(f"AI 分析失败: {str(e)}，降级为规则分析", exc_info=True)
         # 如果 AI 分析失败，降级为规则分析
-        source = webhook_data.get('source', 'unknown')
-        parsed_data = webhook_data.get('parsed_data', {})
-        return analyze_with_rules(parsed_data, source)
+        return fallback_to_rules(webhook_data, 'error')
 
 
-def analyze_with_openai(data: dict[str, Any], source: str) -> AnalysisResult:
-    """使用 OpenAI API 分析 webhook 数据"""
-    try:
-        # 初始化 OpenAI 客户端
-        client = OpenAI(
-            api_key=Config.OPENAI_API_KEY,
-            base_url=Config.OPENAI_API_URL
-        )
-        
-        # 构建分析提示词
-        user_prompt = f"""请分析以下 webhook 事件：
+def build_completion_request(data: dict[str, Any], source: str) -> dict[str, Any]:
+    """构建 chat-completions 请求参数（同时作为 LLM 响应缓存的键）"""
+    # 构建分析提示词
+    user_prompt = f"""请分析以下 webhook 事件：
 
 **来源**: {source}
 **数据内容**: 
@@ -222,83 +306,106 @@ def analyze_with_openai(data: dict[str, Any], source: str) -> AnalysisResult:
 3. 数组中最后一个元素后不要有逗号
 4. 所有字符串必须用双引号
 5. 直接返回 JSON，不要包含其他文本和解释"""
+    
+    return {
+        'model': Config.OPENAI_MODEL,
+        'messages': [
+            {"role": "system", "content": Config.AI_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        'temperature': 0.3,
+        'max_tokens': 1000
+    }
+
+
+def parse_ai_response(ai_response: str, source: str) -> AnalysisResult:
+    """从 AI 响应文本中解析分析结果（容错：修复 JSON、截取首个完整对象、文本提取）"""
+    ai_response = ai_response.strip()
+    logger.debug("AI 原始响应: %s", ai_response)
+    
+    # 提取 JSON
+    if '```json' in ai_response:
+        json_start = ai_response.find('```json') + 7
+        json_end = ai_response.find('```', json_start)
+        ai_response = ai_response[json_start:json_end].strip()
+    elif '```' in ai_response:
+        json_start = ai_response.find('```') + 3
+        json_end = ai_response.find('```', json_start)
+        ai_response = ai_response[json_start:json_end].strip()
+    
+    logger.debug("提取的 JSON: %s", ai_response)
+    
+    # 尝试修复常见的 JSON 格式错误
+    ai_response = fix_json_format(ai_response)
+    
+    try:
+        analysis_result = json.loads(ai_response)
+    except json.JSONDecodeError as e:
+        # 记录详细的错误信息
+        logger.error(f"JSON 解析失败: {str(e)}")
+        logger.error(f"问题位置: 第 {e.lineno} 行, 第 {e.colno} 列")
+        logger.error(f"错误内容: {ai_response}")
         
-        # 调用 OpenAI API
-        logger.info(f"调用 OpenAI API 分析 webhook: {source}")
-        response = client.chat.completions.create(
-            model=Config.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": Config.AI_SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1000
-        )
-        
-        # 解析响应
-        ai_response = response.choices[0].message.content
-        if ai_response is None:
-            raise ValueError("AI 返回空响应")
-        ai_response = ai_response.strip()
-        logger.debug(f"AI 原始响应: {ai_response}")
-        
-        # 提取 JSON
-        if '```json' in ai_response:
-            json_start = ai_response.find('```json') + 7
-            json_end = ai_response.find('```', json_start)
-            ai_response = ai_response[json_start:json_end].strip()
-        elif '```' in ai_response:
-            json_start = ai_response.find('```') + 3
-            json_end = ai_response.find('```', json_start)
-            ai_response = ai_response[json_start:json_end].strip()
-        
-        logger.debug(f"提取的 JSON: {ai_response}")
-        
-        # 尝试修复常见的 JSON 格式错误
-        ai_response = fix_json_format(ai_response)
+        # 尝试提取部分有效的 JSON
+        # 找到第一个完整的对象
+        brace_count = 0
+        valid_end = -1
+        for i, char in enumerate(ai_response):
+            if char == '{':
+                brace_count += 1
+            elif char == '}':
+                brace_count -= 1
+                if brace_count == 0:
+                    valid_end = i + 1
+                    break
         
-        try:
-            analysis_result = json.loads(ai_response)
-        except json.JSONDecodeError as e:
-            # 记录详细的错误信息
-            logger.error(f"JSON 解析失败: {str(e)}")
-            logger.error(f"问题位置: 第 {e.lineno} 行, 第 {e.colno} 列")
-            logger.error(f"错误内容: {ai_response}")
-            
-            # 尝试提取部分有效的 JSON
-            # 找到第一个完整的对象
-            brace_count = 0
-            valid_end = -1
-            for i, char in enumerate(ai_response):
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        valid_end = i + 1
-                        break
-            
-            if valid_end > 0:
-                logger.info(f"尝试提取前 {valid_end} 个字符作为有效 JSON")
-                try:
-                    analysis_result = json.loads(ai_response[:valid_end])
-                    logger.info("成功提取部分 JSON")
-                except:
-                    # 如果仍然失败，尝试从文本中提取关键信息
-                    logger.warning("JSON 提取失败，尝试从文本中解析关键信息")
-                    analysis_result = extract_from_text(ai_response, source)
-            else:
-                # 如果找不到完整对象，尝试从文本中提取关键信息
-                logger.warning("未找到完整的 JSON 对象，尝试从文本中解析关键信息")
+        if valid_end > 0:
+            logger.info(f"尝试提取前 {valid_end} 个字符作为有效 JSON")
+            try:
+                analysis_result = json.loads(ai_response[:valid_end])
+                logger.info("成功提取部分 JSON")
+            except:
+                # 如果仍然失败，尝试从文本中提取关键信息
+                logger.warning("JSON 提取失败，尝试从文本中解析关键信息")
                 analysis_result = extract_from_text(ai_response, source)
+        else:
+            # 如果找不到完整对象，尝试从文本中提取关键信息
+            logger.warning("未找到完整的 JSON 对象，尝试从文本中解析关键信息")
+            analysis_result = extract_from_text(ai_response, source)
+    
+    # 确保必需字段存在
+    if 'source' not in analysis_result:
+        analysis_result['source'] = source
+    if 'importance' not in analysis_result:
+        analysis_result['importance'] = 'medium'
+    
+    return analysis_result
+
+
+def analyze_with_openai(data: dict[str, Any], source: str) -> AnalysisResult:
+    """使用 OpenAI API 分析 webhook 数据"""
+    try:
+        completion_request = build_completion_request(data, source)
         
-        # 确保必需字段存在
-        if 'source' not in analysis_result:
-            analysis_result['source'] = source
-        if 'importance' not in analysis_result:
-            analysis_result['importance'] = 'medium'
+        def fetch_completion() -> str:
+            # 调用 OpenAI API
+            logger.info("调用 OpenAI API 分析 webhook: %s", source, extra={'sampled': True})
+            client = get_openai_client()
+            if drain.is_draining():
+                # 停机期间不再重试，避免多次超时累加超过 drain 截止时间（共享同一连接池）
+                client = client.with_options(max_retries=0)
+            response = client.chat.completions.create(
+                **completion_request,
+                timeout=drain.bounded_timeout(Config.OPENAI_TIMEOUT)
+            )
+            content = response.choices[0].message.content
+            if content is None:
+                raise ValueError("AI 返回空响应")
+            return content
         
-        return analysis_result
+        # 经过 LLM 响应缓存（record/replay 模式下读写本地缓存）
+        ai_response = cached_completion(completion_request, fetch_completion)
+        return parse_ai_response(ai_response, source)
         
     except json.JSONDecodeError as e:
         logger.error(f"AI 响应 JSON 解析失败: {str(e)}")
@@ -359,6 +466,60 @@ def analyze_with_rules(data: dict[str, Any], source: str) -> AnalysisResult:
     return analysis
 
 
+def build_forward_request(
+    webhook_data: WebhookData,
+    analysis_result: AnalysisResult,
+    target_url: str
+) -> tuple[dict[str, Any], dict[str, str]]:
+    """构建转发请求体和请求头（Flask 和 ASGI 两条处理链路共用）"""
+    # 检查是否是飞书 webhook（含本地模拟服务的 /open-apis/bot/ 路径）
+    is_feishu = 'feishu.cn' in target_url or 'lark' in target_url or '/open-apis/bot/' in target_url
+    
+    if is_feishu:
+        # 构建飞书消息格式
+        forward_data = build_feishu_message(webhook_data, analysis_result)
+    else:
+        # 构建普通转发数据
+        forward_data = {
+            'original_data': webhook_data.get('parsed_data', {}),
+            'original_source': webhook_data.get('source', 'unknown'),
+            'original_timestamp': webhook_data.get('timestamp'),
+            'ai_analysis': analysis_result,
+            'processed_by': 'webhook-analyzer',
+            'client_ip': webhook_data.get('client_ip')
+        }
+    
+    # 发送到远程服务器
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    
+    if not is_feishu:
+        headers['X-Webhook-Source'] = f"analyzed-{webhook_data.get('source', 'unknown')}"
+        headers['X-Analysis-Importance'] = analysis_result.get('importance', 'unknown')
+    
+    return forward_data, headers
+
+
+def forward_result_from_response(response: Any, target_url: str) -> ForwardResult:
+    """将转发响应（requests / httpx 的 Response）转换为转发结果"""
+    if 200 <= response.status_code < 300:
+        logger.info("成功转发到远程服务器: %s (状态码: %s)", target_url, response.status_code,
+                    extra={'sampled': True})
+        return {
+            'status': 'success',
+            'response': response.json() if response.content else {},
+            'status_code': response.status_code
+        }
+    else:
+        logger.warning(f"转发失败,状态码: {response.status_code}")
+        return {
+            'status': 'failed',
+            'status_code': response.status_code,
+            'response': response.text
+        }
+
+
 def forward_to_remote(
     webhook_data: WebhookData, 
     analysis_result: AnalysisResult, 
@@ -377,54 +538,16 @@ def forward_to_remote(
         target_url = Config.FORWARD_URL
     
     try:
-        # 检查是否是飞书 webhook
-        is_feishu = 'feishu.cn' in target_url or 'lark' in target_url
+        forward_data, headers = build_forward_request(webhook_data, analysis_result, target_url)
         
-        if is_feishu:
-            # 构建飞书消息格式
-            forward_data = build_feishu_message(webhook_data, analysis_result)
-        else:
-            # 构建普通转发数据
-            forward_data = {
-                'original_data': webhook_data.get('parsed_data', {}),
-                'original_source': webhook_data.get('source', 'unknown'),
-                'original_timestamp': webhook_data.get('timestamp'),
-                'ai_analysis': analysis_result,
-                'processed_by': 'webhook-analyzer',
-                'client_ip': webhook_data.get('client_ip')
-            }
-        
-        # 发送到远程服务器
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        
-        if not is_feishu:
-            headers['X-Webhook-Source'] = f"analyzed-{webhook_data.get('source', 'unknown')}"
-            headers['X-Analysis-Importance'] = analysis_result.get('importance', 'unknown')
-        
-        logger.info(f"转发数据到 {target_url}")
-        response = requests.post(
+        logger.info("转发数据到 %s", target_url, extra={'sampled': True})
+        response = get_http_session().post(
             target_url,
             json=forward_data,
             headers=headers,
-            timeout=10
+            timeout=drain.bounded_timeout(10)
         )
-        
-        if 200 <= response.status_code < 300:
-            logger.info(f"成功转发到远程服务器: {target_url} (状态码: {response.status_code})")
-            return {
-                'status': 'success',
-                'response': response.json() if response.content else {},
-                'status_code': response.status_code
-            }
-        else:
-            logger.warning(f"转发失败,状态码: {response.status_code}")
-            return {
-                'status': 'failed',
-                'status_code': response.status_code,
-                'response': response.text
-            }
+        return forward_result_from_response(response, target_url)
             
     except requests.exceptions.Timeout:
         logger.error(f"转发超时: {target_url}")
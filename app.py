@@ -1,21 +1,45 @@
 import os
+import queue
 import time
+import hmac
+import logging
 import socket
+from functools import wraps
 from contextlib import contextmanager
 from flask import Flask, request, jsonify, render_template, Response
 from datetime import datetime, timedelta
 from dotenv import set_key
-from typing import Optional, Generator
+from typing import Any, Callable, Optional, Generator
 from sqlalchemy.exc import IntegrityError
 
 from config import Config
-from logger import logger
+from logger import logger, restart_logging
 from utils import (
     verify_signature, save_webhook_data, get_client_ip, 
-    get_all_webhooks, generate_alert_hash, check_duplicate_alert
+    get_all_webhooks, generate_alert_hash, check_duplicate_alert,
+    update_forward_status, decide_forward, resolve_fields, resolve_filters, get_webhook_by_id, COUNT_MODES,
+    get_webhook_changes, build_search_text
 )
-from ai_analyzer import analyze_webhook_with_ai, forward_to_remote
-from models import WebhookEvent, ProcessingLock, session_scope, get_session, test_db_connection
+from ai_analyzer import (
+    analyze_webhook_with_ai, forward_to_remote, reset_clients,
+    get_openai_client, get_http_session
+)
+from concurrency import cooperative_sleep
+from metrics import (
+    observe_stage, source_label, render_metrics,
+    REQUEST_LATENCY, REQUESTS, DUPLICATES, FORWARDS, INFLIGHT, LOCK_WAITERS
+)
+from change_feed import feed as change_feed, format_event, parse_cursor
+from partitions import start_maintenance_thread
+from search import SearchUnavailable, search_webhooks
+from models import (
+    WebhookEvent, ProcessingLock, session_scope, get_session, test_db_connection,
+    dispose_engine_after_fork, warmup_pool, release_locks_by_worker, WEBHOOK_SUMMARY_FIELDS
+)
+import drain
+import profiler
+import query_stats
+import tracing
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -25,9 +49,151 @@ _WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
 
 # 分布式锁配置
 _LOCK_TTL_SECONDS = 120  # 锁过期时间（秒），防止崩溃后死锁
-_LOCK_WAIT_SECONDS = 3   # 等待锁的时间（秒）
+_LOCK_WAIT_SECONDS = 3   # 等待锁的最长时间（秒）
+_LOCK_POLL_INTERVAL = 0.2  # 等待期间检查锁是否释放的间隔（秒）
 _LOCK_RETRY_TIMES = 2    # 重试次数
 
+# 停机 drain 期间拒绝新 webhook 时建议发送方重试的间隔（秒）
+_DRAIN_RETRY_AFTER_SECONDS = 5
+
+# 增量查询单次最多返回的事件数
+_MAX_CHANGES_PAGE_SIZE = 500
+
+# 管理页面推送：浏览器断线重连间隔（毫秒）和连接时最多补发的批次数（超出时让客户端重新加载列表）
+_SSE_RETRY_MS = 3000
+_SSE_CATCHUP_BATCHES = 4
+
+# worker 预热状态（/ready 接口使用）
+_readiness = {'ready': False, 'error': None, 'warmup': {}}
+
+
+def preload_shared_state() -> None:
+    """
+    构建只读共享状态（gunicorn preload 时在 master 中执行一次，fork 后由 worker 共享）
+
+    规则正则在导入 ai_analyzer 时已预编译，这里编译管理页面模板。
+    OpenAI SDK 在模块中延迟导入，启用 AI 分析时在这里导入，fork 后 worker 共享已加载的模块。
+    """
+    app.jinja_env.get_template('dashboard.html')
+    if Config.ENABLE_AI_ANALYSIS and Config.OPENAI_API_KEY:
+        import openai  # noqa: F401
+
+
+def reinit_after_fork() -> None:
+    """
+    fork 之后在 worker 中重置进程相关状态（gunicorn post_fork 调用）
+
+    preload 时 master 已导入应用：worker 标识需要按子进程 PID 重新生成，
+    继承的数据库连接池和出站客户端连接池需要丢弃，后台日志线程需要重新启动。
+    """
+    global _WORKER_ID
+    _WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+    dispose_engine_after_fork()
+    reset_clients(close=False)
+    restart_logging()
+
+
+def warmup_worker() -> bool:
+    """
+    预热 worker：建立 DB_POOL_WARMUP 个数据库连接并创建出站客户端
+
+    gunicorn 在 worker 开始接收请求前调用（post_worker_init），完成后 /ready 返回 200。
+    """
+    start = time.perf_counter()
+    try:
+        warmup = {'db_connections': warmup_pool(Config.DB_POOL_WARMUP) if Config.DB_POOL_WARMUP > 0 else 0}
+        if Config.ENABLE_AI_ANALYSIS and Config.OPENAI_API_KEY:
+            get_openai_client()
+        if Config.ENABLE_FORWARD:
+            get_http_session()
+        warmup['partition_maintenance'] = start_maintenance_thread()
+        warmup['duration_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    except Exception as e:
+        logger.error(f"worker 预热失败: {str(e)}", exc_info=True)
+        _readiness.update(ready=False, error=str(e))
+        return False
+
+    _readiness.update(ready=True, error=None, warmup=warmup)
+    logger.info(f"worker 预热完成: {warmup}")
+    return True
+
+
+@app.before_request
+def _start_request_trace() -> None:
+    """开始追踪当前请求和 SQL 统计"""
+    tracing.start_trace(request.method, request.path)
+    query_stats.start(f"{request.method} {request.path}")
+
+
+@app.after_request
+def _finish_request_trace(response: Response) -> Response:
+    """结束追踪：写入 Server-Timing 响应头，记录慢请求，检查查询预算"""
+    trace = tracing.end_trace()
+    if trace is None:
+        query_stats.finish()
+        return response
+    
+    trace.query_stats = query_stats.current()
+    trace.finish(response.status_code)
+    response.headers['Server-Timing'] = trace.server_timing()
+    tracing.slow_requests.offer(trace)
+    
+    if trace.duration * 1000 >= Config.SLOW_REQUEST_THRESHOLD_MS:
+        stages = ', '.join(
+            f"{name}={total * 1000:.0f}ms" + (f"x{count}" if count > 1 else '')
+            for name, (total, count) in trace.summary().items()
+        )
+        logger.warning(
+            f"慢请求: {trace.method} {trace.path} 耗时 {trace.duration * 1000:.0f}ms, "
+            f"trace_id={trace.trace_id}, 阶段: {stages}"
+        )
+    
+    # QUERY_BUDGET_MODE=raise 时超出预算会抛出 QueryBudgetExceeded
+    query_stats.finish()
+    return response
+
+
+def require_admin(view: Callable) -> Callable:
+    """
+    管理接口鉴权：请求头 X-Admin-Secret 必须与 WEBHOOK_SECRET 一致
+    
+    未配置 WEBHOOK_SECRET 时管理接口一律拒绝访问。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        secret = Config.WEBHOOK_SECRET
+        provided = request.headers.get('X-Admin-Secret', '')
+        if not secret:
+            return jsonify({'success': False, 'error': '管理接口需要配置 WEBHOOK_SECRET'}), 403
+        if not hmac.compare_digest(provided.encode('utf-8'), secret.encode('utf-8')):
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _wait_for_lock_release(alert_hash: str) -> bool:
+    """
+    等待其他 worker 释放处理锁（轮询，最长 _LOCK_WAIT_SECONDS 秒）
+    
+    锁释放后立即返回，不再固定等待；gevent 模式下等待期间只挂起当前 greenlet。
+    
+    Returns:
+        bool: 锁已释放返回 True，等待超时返回 False
+    """
+    deadline = time.monotonic() + _LOCK_WAIT_SECONDS
+    while True:
+        with session_scope() as session:
+            held = session.query(ProcessingLock.alert_hash).filter(
+                ProcessingLock.alert_hash == alert_hash
+            ).first() is not None
+        if not held:
+            return True
+        
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        cooperative_sleep(min(_LOCK_POLL_INTERVAL, remaining))
+
 
 def _cleanup_expired_locks() -> int:
     """
@@ -54,6 +220,22 @@ def _cleanup_expired_locks() -> int:
         return 0
 
 
+def release_worker_locks() -> int:
+    """
+    释放当前 worker 持有的处理锁（gunicorn worker_exit 调用）
+
+    正常情况下锁在请求结束时释放；worker 在处理中途退出时显式清理，其他 worker 不必等到锁过期。
+    """
+    try:
+        released = release_locks_by_worker(_WORKER_ID)
+    except Exception as e:
+        logger.error(f"释放 worker 处理锁失败: {e}")
+        return 0
+    if released:
+        logger.warning(f"worker {_WORKER_ID} 退出时释放了 {released} 个处理锁")
+    return released
+
+
 @contextmanager
 def processing_lock(alert_hash: str) -> Generator[bool, None, None]:
     """
@@ -64,29 +246,30 @@ def processing_lock(alert_hash: str) -> Generator[bool, None, None]:
     Yields:
         bool: True 表示成功获取锁，False 表示已有其他 worker 在处理
     """
-    # 先清理过期锁
-    _cleanup_expired_locks()
-    
     session = get_session()
     lock_acquired = False
     
     try:
-        # 尝试插入锁记录
-        lock = ProcessingLock(
-            alert_hash=alert_hash,
-            created_at=datetime.now(),
-            worker_id=_WORKER_ID
-        )
-        session.add(lock)
-        session.commit()
+        with observe_stage('lock_acquire'):
+            # 先清理过期锁
+            _cleanup_expired_locks()
+            
+            # 尝试插入锁记录
+            lock = ProcessingLock(
+                alert_hash=alert_hash,
+                created_at=datetime.now(),
+                worker_id=_WORKER_ID
+            )
+            session.add(lock)
+            session.commit()
         lock_acquired = True
-        logger.debug(f"获取处理锁成功: hash={alert_hash[:16]}..., worker={_WORKER_ID}")
+        logger.debug("获取处理锁成功: hash=%s..., worker=%s", alert_hash[:16], _WORKER_ID)
         yield True
         
     except IntegrityError:
         # 主键冲突，说明已有其他 worker 在处理
         session.rollback()
-        logger.info(f"告警正由其他 worker 处理中: hash={alert_hash[:16]}...")
+        logger.info("告警正由其他 worker 处理中: hash=%s...", alert_hash[:16])
         yield False
         
     except Exception as e:
@@ -102,7 +285,7 @@ def processing_lock(alert_hash: str) -> Generator[bool, None, None]:
                     ProcessingLock.alert_hash == alert_hash
                 ).delete()
                 session.commit()
-                logger.debug(f"释放处理锁: hash={alert_hash[:16]}...")
+                logger.debug("释放处理锁: hash=%s...", alert_hash[:16])
             except Exception as e:
                 logger.error(f"释放锁失败: {e}")
                 session.rollback()
@@ -110,28 +293,62 @@ def processing_lock(alert_hash: str) -> Generator[bool, None, None]:
 
 
 def handle_webhook_process(source: Optional[str] = None) -> tuple[Response, int]:
-    """通用 Webhook 处理逻辑"""
+    """通用 Webhook 处理逻辑（记录请求耗时和处理中请求数）"""
+    # 如果未在路由中指定 source，尝试从 Header 获取
+    if source is None:
+        source = request.headers.get('X-Webhook-Source', 'unknown')
+    
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.source = source
+    
+    # 停机 drain 期间不再接收新的 webhook，由发送方重试到其他实例
+    if drain.is_draining():
+        REQUESTS.labels(source=source_label(source), status='503').inc()
+        response = jsonify({
+            'success': False,
+            'error': 'Service draining',
+            'message': 'worker 正在停机，请稍后重试'
+        })
+        response.headers['Retry-After'] = str(_DRAIN_RETRY_AFTER_SECONDS)
+        return response, 503
+    
+    start = time.perf_counter()
+    INFLIGHT.inc()
+    status_code = 500
+    try:
+        response, status_code = _process_webhook(source)
+        return response, status_code
+    finally:
+        INFLIGHT.dec()
+        label = source_label(source)
+        REQUEST_LATENCY.labels(source=label).observe(time.perf_counter() - start)
+        REQUESTS.labels(source=label, status=str(status_code)).inc()
+
+
+def _process_webhook(source: str) -> tuple[Response, int]:
+    """Webhook 处理流水线"""
     try:
         # 获取请求信息
         client_ip = get_client_ip(request)
         signature = request.headers.get('X-Webhook-Signature', '')
         
-        # 如果未在路由中指定 source，尝试从 Header 获取
-        if source is None:
-            source = request.headers.get('X-Webhook-Source', 'unknown')
-        
         # 获取原始请求体
         payload = request.get_data()
         
         # 记录接收到的 webhook
-        logger.info(f"收到来自 {client_ip} 的 webhook 请求, 来源: {source}")
-        logger.debug(f"原始请求体: {payload.decode('utf-8', errors='ignore')[:500]}...")
-        logger.debug(f"请求头: {dict(request.headers)}")
+        logger.info("收到来自 %s 的 webhook 请求, 来源: %s", client_ip, source, extra={'sampled': True})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("原始请求体: %s...", payload[:500].decode('utf-8', errors='ignore'))
+            logger.debug("请求头: %s", dict(request.headers))
         
         # 验证签名
-        if signature and not verify_signature(payload, signature):
-            logger.warning(f"签名验证失败: IP={client_ip}, Source={source}")
-            return jsonify({'success': False, 'error': 'Invalid signature'}), 401
+        if signature:
+            with observe_stage('signature'):
+                signature_valid = verify_signature(payload, signature)
+            if not signature_valid:
+                logger.warning(f"签名验证失败: IP={client_ip}, Source={source}")
+                return jsonify({'success': False, 'error': 'Invalid signature'}), 401
         
         # 解析 JSON 数据
         try:
@@ -149,68 +366,80 @@ def handle_webhook_process(source: Optional[str] = None) -> tuple[Response, int]
         }
         
         # 去重检测
-        alert_hash = generate_alert_hash(data, source)
+        with observe_stage('hash'):
+            alert_hash = generate_alert_hash(data, source)
         
         # 使用数据库分布式锁防止多 worker 并发处理
         with processing_lock(alert_hash) as got_lock:
             if not got_lock:
                 # 已有其他 worker 在处理，等待后重新检测
-                logger.info(f"等待其他 worker 处理完成: hash={alert_hash[:16]}...")
-                time.sleep(_LOCK_WAIT_SECONDS)
-                is_duplicate, original_event = check_duplicate_alert(alert_hash)
+                logger.info("等待其他 worker 处理完成: hash=%s...", alert_hash[:16])
+                LOCK_WAITERS.inc()
+                try:
+                    with observe_stage('lock_wait'):
+                        _wait_for_lock_release(alert_hash)
+                finally:
+                    LOCK_WAITERS.dec()
+                with observe_stage('dedup_lookup'):
+                    is_duplicate, original_event = check_duplicate_alert(alert_hash)
                 
                 if is_duplicate and original_event:
                     # 其他 worker 已处理完，复用结果
-                    logger.info(f"复用其他 worker 的分析结果: 原始 ID={original_event.id}")
+                    logger.info("复用其他 worker 的分析结果: 原始 ID=%s", original_event.id)
                     analysis_result = original_event.ai_analysis or {}
                 else:
                     # 其他 worker 可能失败了，我们继续处理
                     logger.info("未找到已处理结果，重新处理...")
-                    analysis_result = analyze_webhook_with_ai(webhook_full_data)
+                    with observe_stage('ai'):
+                        analysis_result = analyze_webhook_with_ai(webhook_full_data)
             else:
                 # 成功获取锁，正常处理
-                is_duplicate, original_event = check_duplicate_alert(alert_hash)
+                with observe_stage('dedup_lookup'):
+                    is_duplicate, original_event = check_duplicate_alert(alert_hash)
                 
                 if is_duplicate and original_event:
-                    logger.info(f"检测到重复告警(hash={alert_hash[:16]}...)，复用 ID={original_event.id} 的分析结果")
+                    logger.info("检测到重复告警(hash=%s...)，复用 ID=%s 的分析结果", alert_hash[:16], original_event.id,
+                                extra={'sampled': True})
                     analysis_result = original_event.ai_analysis or {}
                 else:
                     logger.info("新告警，开始 AI 分析...")
-                    analysis_result = analyze_webhook_with_ai(webhook_full_data)
+                    with observe_stage('ai'):
+                        analysis_result = analyze_webhook_with_ai(webhook_full_data)
             
             # 保存数据（传递预先计算的哈希和检测结果，避免重复查询）
-            webhook_id, is_dup, original_id = save_webhook_data(
-                data=data, 
-                source=source,
-                raw_payload=payload,
-                headers=request.headers,
-                client_ip=client_ip,
-                ai_analysis=analysis_result,
-                forward_status='pending',
-                alert_hash=alert_hash,
-                is_duplicate=is_duplicate,
-                original_event=original_event
-            )
+            with observe_stage('db_save'):
+                webhook_id, is_dup, original_id, saved_at = save_webhook_data(
+                    data=data, 
+                    source=source,
+                    raw_payload=payload,
+                    headers=request.headers,
+                    client_ip=client_ip,
+                    ai_analysis=analysis_result,
+                    forward_status='pending',
+                    alert_hash=alert_hash,
+                    is_duplicate=is_duplicate,
+                    original_event=original_event
+                )
+        change_feed.notify()
         
-        # 转发逻辑判断
-        importance = analysis_result.get('importance', '').lower()
-        should_forward = False
-        skip_reason = None
+        if is_dup:
+            DUPLICATES.labels(source=source_label(source)).inc()
         
-        if importance == 'high':
-            if is_dup and not Config.FORWARD_DUPLICATE_ALERTS:
-                skip_reason = f'重复告警（原始 ID={original_id}），配置跳过转发'
-            else:
-                should_forward = True
-        else:
-            skip_reason = f'重要性为 {importance}，非高风险事件不自动转发'
+        # 转发逻辑判断
+        should_forward, skip_reason = decide_forward(analysis_result, is_dup, original_id)
         
         forward_result = {'status': 'skipped', 'reason': skip_reason}
         if should_forward:
             logger.info(f"开始自动转发高风险{'重复' if is_dup else ''}告警...")
-            forward_result = forward_to_remote(webhook_full_data, analysis_result)
+            with observe_stage('forward'):
+                forward_result = forward_to_remote(webhook_full_data, analysis_result)
         else:
-            logger.info(f"跳过自动转发: {skip_reason}")
+            logger.info("跳过自动转发: %s", skip_reason, extra={'sampled': True})
+        FORWARDS.labels(source=source_label(source), status=forward_result.get('status', 'unknown')).inc()
+        
+        # 回写转发结果（用于流量回放时对比转发决策）
+        update_forward_status(webhook_id, saved_at, forward_result.get('status', 'unknown'))
+        change_feed.notify()
             
         return jsonify({
             'success': True,
@@ -238,6 +467,110 @@ def health_check():
     }), 200
 
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    就绪检查接口：worker 预热完成后返回 200
+
+    gunicorn 下 worker 在 post_worker_init 中预热；未经过预热（其他 WSGI 服务器）或预热失败时
+    在这里执行预热，失败返回 503。停机 drain 期间返回 503。
+    """
+    if drain.is_draining():
+        return jsonify({'status': 'draining', 'worker': _WORKER_ID, 'remaining_seconds': drain.remaining()}), 503
+    if not _readiness['ready']:
+        warmup_worker()
+    status = 200 if _readiness['ready'] else 503
+    return jsonify({
+        'status': 'ready' if _readiness['ready'] else 'warming_up',
+        'worker': _WORKER_ID,
+        'warmup': _readiness['warmup'],
+        'error': _readiness['error']
+    }), status
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 指标接口（多 worker 下汇总所有进程）"""
+    body, content_type = render_metrics()
+    return Response(body, mimetype=None, content_type=content_type)
+
+
+@app.route('/api/admin/slow-requests', methods=['GET'])
+@require_admin
+def list_slow_requests() -> tuple[Response, int]:
+    """查看当前 worker 最慢的请求及各阶段耗时"""
+    if request.args.get('clear', 'false').lower() == 'true':
+        tracing.slow_requests.clear()
+        return jsonify({'success': True, 'message': '已清空'}), 200
+    
+    return jsonify({
+        'success': True,
+        'worker': _WORKER_ID,
+        'capacity': tracing.slow_requests.capacity,
+        'data': tracing.slow_requests.snapshot()
+    }), 200
+
+
+@app.route('/api/admin/profile/<kind>', methods=['POST'])
+@require_admin
+def start_profile(kind: str) -> tuple[Response, int]:
+    """
+    在处理本请求的 worker 内启动限时剖析（后台运行）
+    
+    cpu 参数: seconds, interval_ms；memory 参数: seconds, top, frames
+    """
+    body = request.get_json(silent=True)
+    if body is not None and not isinstance(body, dict):
+        return jsonify({'success': False, 'error': '请求体必须是 JSON 对象'}), 400
+    params = body or {}
+    params.update(request.args.to_dict())
+    try:
+        seconds = float(params.get('seconds', 10))
+        if kind == 'cpu':
+            options = {'interval_ms': float(params.get('interval_ms', 10))}
+        else:
+            options = {'top': int(params.get('top', 30)), 'frames': int(params.get('frames', 10))}
+        meta = profiler.start_profile(kind, seconds, **options)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except profiler.ProfilerBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    
+    return jsonify({
+        'success': True,
+        'worker': _WORKER_ID,
+        'data': meta,
+        'result_url': f"/api/admin/profile/{meta['profile_id']}"
+    }), 202
+
+
+@app.route('/api/admin/profile/<profile_id>', methods=['GET'])
+@require_admin
+def get_profile(profile_id: str) -> tuple[Response, int]:
+    """
+    获取剖析结果
+    
+    CPU 剖析默认返回折叠栈文本（flamegraph.pl / speedscope 可直接使用），?format=json 返回 JSON。
+    """
+    result = profiler.load_profile(profile_id)
+    if result is None:
+        return jsonify({'success': False, 'error': '剖析结果不存在'}), 404
+    if result['status'] == 'running':
+        return jsonify({'success': True, 'data': result}), 202
+    
+    if result['status'] == 'done' and result['kind'] == 'cpu' and request.args.get('format') != 'json':
+        return Response(profiler.folded_stacks(result['result']['samples']), mimetype='text/plain'), 200
+    return jsonify({'success': result['status'] == 'done', 'data': result}), 200
+
+
+@app.route('/api/admin/profile/stop', methods=['POST'])
+@require_admin
+def stop_profile() -> tuple[Response, int]:
+    """提前结束当前 worker 正在运行的剖析"""
+    stopped = profiler.stop_active_profile()
+    return jsonify({'success': stopped, 'worker': _WORKER_ID}), 200 if stopped else 404
+
+
 @app.route('/', methods=['GET'])
 def dashboard():
     """Webhook 数据展示页面"""
@@ -246,17 +579,50 @@ def dashboard():
 
 @app.route('/api/webhooks', methods=['GET'])
 def list_webhooks() -> tuple[Response, int]:
-    """获取 webhook 列表 API（支持游标分页）"""
+    """
+    获取 webhook 列表 API（支持过滤和游标分页）
+    
+    过滤参数（可任意组合）：source、importance、alert_hash、forward_status、
+    duplicate（true / false）、start / end（ISO 时间，按接收时间过滤）。
+    结果按接收时间倒序，翻页时把 pagination.next_cursor 作为 cursor 参数传回（keyset 分页）。
+    
+    fields 参数：full（默认，全部字段）、summary（不含原始请求体、请求头和解析后数据）
+    或逗号分隔的字段名；详情通过 /api/webhooks/<id> 获取。
+    count 参数：estimate（默认，估算总数）、exact（精确计数）或 none（不统计），
+    实际使用的方式在 pagination.total_type 中返回。
+    
+    增量模式：传入 since_id 和 / 或 updated_since（ISO 时间）时只返回 ID 更大的新事件和
+    此后更新过的事件（新事件按 ID 升序在前，更新按 updated_at 升序在后，不统计总数），
+    下一次调用的参数在 changes 中返回，has_more 为 true 时按返回的参数继续查询；过滤参数同样生效。
+    """
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 20, type=int)
-    cursor_id = request.args.get('cursor', None, type=int)  # 游标分页
+    cursor = request.args.get('cursor') or None  # 游标分页
+    
+    try:
+        fields = resolve_fields(request.args.get('fields'))
+        filters = resolve_filters(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if 'since_id' in request.args or 'updated_since' in request.args:
+        limit = request.args.get('page_size', _MAX_CHANGES_PAGE_SIZE, type=int)
+        return _list_webhook_changes(fields, min(limit, _MAX_CHANGES_PAGE_SIZE), filters)
+    
+    count_mode = request.args.get('count', 'estimate')
+    if count_mode not in COUNT_MODES:
+        return jsonify({'success': False, 'error': f"count 参数无效，可选值: {', '.join(COUNT_MODES)}"}), 400
     
     # 限制每页最大数量
     page_size = min(page_size, 100)
     
-    webhooks, total, next_cursor = get_all_webhooks(
-        page=page, page_size=page_size, cursor_id=cursor_id
-    )
+    try:
+        webhooks, total, next_cursor, total_type = get_all_webhooks(
+            page=page, page_size=page_size, cursor=cursor, fields=fields,
+            count_mode=count_mode, filters=filters
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
     return jsonify({
         'success': True,
@@ -265,12 +631,192 @@ def list_webhooks() -> tuple[Response, int]:
             'page': page,
             'page_size': page_size,
             'total': total,
-            'total_pages': (total + page_size - 1) // page_size if total > 0 else 0,
+            'total_pages': (total + page_size - 1) // page_size if total else (0 if total == 0 else None),
+            'total_type': total_type,  # exact / estimate / none
             'next_cursor': next_cursor  # 游标分页支持
         }
     }), 200
 
 
+def _list_webhook_changes(
+    fields: Optional[tuple[str, ...]],
+    limit: int,
+    filters: dict[str, Any]
+) -> tuple[Response, int]:
+    """增量查询（/api/webhooks?since_id=...&updated_since=...）"""
+    try:
+        since_id, updated_since = parse_cursor(
+            f"{request.args.get('since_id', '')}|{request.args.get('updated_since', '')}"
+        )
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since_id 应为整数，updated_since 应为 ISO 格式时间'}), 400
+    
+    webhooks, has_more, (since_id, updated_since) = get_webhook_changes(
+        since_id, updated_since, fields=fields, limit=limit, filters=filters
+    )
+    return jsonify({
+        'success': True,
+        'data': webhooks,
+        'changes': {
+            'since_id': since_id,
+            'updated_since': updated_since.isoformat() if updated_since else None,
+            'has_more': has_more
+        }
+    }), 200
+
+
+@app.route('/api/webhooks/stream', methods=['GET'])
+def stream_webhooks() -> Response:
+    """
+    推送 webhook 变化（Server-Sent Events，见 change_feed.py）
+    
+    连接时按 since_id / updated_since（或浏览器重连时的 Last-Event-ID）补发错过的变化，
+    之后推送本 worker 轮询到的新事件和更新（event: webhooks，data 为摘要字段列表）。
+    补发的变化过多时发送 event: reset，客户端应重新加载列表。连接最长 SSE_MAX_SECONDS 秒，
+    停机 drain 时立即结束，浏览器会自动重连。
+    
+    sync worker 同一时间只能处理一个请求，长连接会占满 worker，此时返回 503，
+    管理页面改用增量查询轮询。
+    """
+    if not request.environ.get('wsgi.multithread'):
+        return jsonify({
+            'success': False,
+            'error': 'Streaming unavailable',
+            'message': '当前 worker 不支持长连接（sync worker），请使用 /api/webhooks?since_id= 增量查询'
+        }), 503
+    if drain.is_draining():
+        return jsonify({'success': False, 'error': 'Service draining'}), 503
+    
+    try:
+        since_id, updated_since = parse_cursor(request.headers.get('Last-Event-ID') or (
+            f"{request.args.get('since_id', '')}|{request.args.get('updated_since', '')}"
+        ))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since_id 应为整数，updated_since 应为 ISO 格式时间'}), 400
+    
+    # 先订阅再补发，补发和推送之间的变化可能重复出现，客户端按 ID 覆盖即可
+    try:
+        subscriber = change_feed.subscribe()
+    except Exception as e:
+        logger.error(f"订阅 webhook 变化失败: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    def generate() -> Generator[str, None, None]:
+        nonlocal since_id, updated_since
+        try:
+            yield f"retry: {_SSE_RETRY_MS}\n\n"
+            if since_id is not None or updated_since is not None:
+                for _ in range(_SSE_CATCHUP_BATCHES):
+                    webhooks, has_more, (since_id, updated_since) = get_webhook_changes(
+                        since_id, updated_since, fields=WEBHOOK_SUMMARY_FIELDS, limit=_MAX_CHANGES_PAGE_SIZE
+                    )
+                    if webhooks:
+                        yield format_event('webhooks', webhooks, (since_id, updated_since))
+                    if not has_more:
+                        break
+                else:
+                    yield format_event('reset', {'reason': '错过的变化过多'})
+                    return
+            
+            deadline = time.monotonic() + Config.SSE_MAX_SECONDS
+            last_sent = time.monotonic()
+            while time.monotonic() < deadline and not drain.is_draining() and change_feed.is_subscribed(subscriber):
+                try:
+                    webhooks, cursor = subscriber.get(timeout=1.0)
+                except queue.Empty:
+                    if time.monotonic() - last_sent >= Config.SSE_HEARTBEAT_SECONDS:
+                        last_sent = time.monotonic()
+                        yield ": ping\n\n"
+                    continue
+                last_sent = time.monotonic()
+                yield format_event('webhooks', webhooks, cursor)
+        finally:
+            change_feed.unsubscribe(subscriber)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁止 nginx 缓冲
+    })
+
+
+@app.route('/api/webhooks/search', methods=['GET'])
+def search_webhook_events() -> tuple[Response, int]:
+    """
+    全文检索 AI 摘要、事件类型、标签、规则名和资源 ID（见 search.py）
+    
+    q 为关键词（多个关键词之间为 AND），结果按相关度倒序并附带 score；
+    支持列表接口的 fields 和过滤参数（如 start 限定时间范围），翻页时把 next_cursor 作为 cursor 传回。
+    """
+    page_size = min(request.args.get('page_size', 20, type=int), 100)
+    try:
+        fields = resolve_fields(request.args.get('fields'))
+        filters = resolve_filters(request.args)
+        webhooks, next_cursor = search_webhooks(
+            request.args.get('q', ''), page_size=page_size, cursor=request.args.get('cursor') or None,
+            fields=fields, filters=filters
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except SearchUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 501
+    except Exception as e:
+        logger.error(f"全文检索失败: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'data': webhooks,
+        'pagination': {'page_size': page_size, 'next_cursor': next_cursor}
+    }), 200
+
+
+@app.route('/api/archive/webhooks', methods=['GET'])
+def get_archived_webhooks() -> tuple[Response, int]:
+    """
+    查询已归档到 Parquet 的事件（见 archive.py），按接收时间倒序
+    
+    支持列表接口的 fields 和过滤参数（不支持 label.<name>），按 start / end 和 source 只读取对应的分区目录，
+    翻页时把 next_cursor 作为 cursor 传回。
+    """
+    # 按需导入：归档由 cron 执行，worker 启动时不加载 archive / pyarrow
+    from archive import ArchiveUnavailable, query_archive
+    
+    page_size = min(request.args.get('page_size', 20, type=int), 100)
+    try:
+        fields = resolve_fields(request.args.get('fields'))
+        filters = resolve_filters(request.args)
+        webhooks, next_cursor, _ = query_archive(
+            filters, fields, limit=page_size, cursor=request.args.get('cursor') or None
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except ArchiveUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 501
+    except Exception as e:
+        logger.error(f"查询归档事件失败: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'data': webhooks,
+        'pagination': {'page_size': page_size, 'next_cursor': next_cursor}
+    }), 200
+
+
+@app.route('/api/webhooks/<int:webhook_id>', methods=['GET'])
+def get_webhook_detail(webhook_id: int) -> tuple[Response, int]:
+    """获取单条 webhook 详情（含原始请求体、请求头和解析后数据）"""
+    try:
+        webhook = get_webhook_by_id(webhook_id)
+    except Exception as e:
+        logger.error(f"查询 webhook 详情失败: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    if webhook is None:
+        return jsonify({'success': False, 'error': 'Webhook not found'}), 404
+    return jsonify({'success': True, 'data': webhook}), 200
+
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """获取当前配置"""
@@ -363,6 +909,10 @@ def update_config():
         if errors:
             return jsonify({'success': False, 'error': '; '.join(errors)}), 400
         
+        # API 地址或密钥变更后重建共享的 OpenAI 客户端
+        if 'openai_api_key' in data or 'openai_api_url' in data:
+            reset_clients()
+        
         logger.info("配置已更新")
         return jsonify({'success': True, 'message': '配置更新成功'}), 200
         
@@ -385,7 +935,7 @@ def reanalyze_webhook(webhook_id: int) -> tuple[Response, int]:
             # 准备分析数据
             webhook_data = {
                 'source': webhook_event.source,
-                'parsed_data': webhook_event.parsed_data,
+                'parsed_data': webhook_event.get_field('parsed_data'),
                 'timestamp': webhook_event.timestamp.isoformat() if webhook_event.timestamp else None,
                 'client_ip': webhook_event.client_ip
             }
@@ -397,6 +947,7 @@ def reanalyze_webhook(webhook_id: int) -> tuple[Response, int]:
             # 更新数据库
             webhook_event.ai_analysis = analysis_result
             webhook_event.importance = analysis_result.get('importance')
+            webhook_event.search_text = build_search_text(webhook_event.get_field('parsed_data'), analysis_result)
             
             logger.info(f"重新分析完成: {analysis_result.get('importance', 'unknown')} - {analysis_result.get('summary', '')}")
             
@@ -425,7 +976,7 @@ def manual_forward_webhook(webhook_id: int) -> tuple[Response, int]:
             # 准备转发数据
             webhook_data = {
                 'source': webhook_event.source,
-                'parsed_data': webhook_event.parsed_data,
+                'parsed_data': webhook_event.get_field('parsed_data'),
                 'timestamp': webhook_event.timestamp.isoformat() if webhook_event.timestamp else None,
                 'client_ip': webhook_event.client_ip
             }
@@ -436,7 +987,7 @@ def manual_forward_webhook(webhook_id: int) -> tuple[Response, int]:
             logger.info(f"手动转发 webhook ID: {webhook_id} 到 {custom_url or Config.FORWARD_URL}")
             
             # 转发数据
-            analysis_result = webhook_event.ai_analysis or {}
+            analysis_result = webhook_event.get_field('ai_analysis') or {}
             forward_result = forward_to_remote(webhook_data, analysis_result, custom_url)
             
             # 更新转发状态
@@ -488,6 +1039,7 @@ if __name__ == '__main__':
     Config.validate()
     if not test_db_connection():
         logger.error("数据库连接失败，请检查配置")
+    warmup_worker()
     
     logger.info(f"启动 Webhook 服务: http://{Config.HOST}:{Config.PORT}")
     app.run(
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+过期事件归档到 Parquet 列式文件（冷存储）
+
+早于 ARCHIVE_AFTER_DAYS 天的事件按接收日期和来源写入 ARCHIVE_DIR 下的 Hive 风格分区目录，写入完成后从数据库删除：
+
+    archive/day=2026-10-19/source=prometheus/part-<最小 ID>-<最大 ID>.parquet
+
+- 每个文件内按 timestamp 排序，按 ARCHIVE_ROW_GROUP_SIZE 分行组并使用 ARCHIVE_COMPRESSION 压缩，
+  行组带 min/max 统计，查询时按 timestamp / importance 跳过不满足条件的行组
+- day / source 是目录分区，查询按时间范围和来源只打开对应的目录（分区裁剪）
+- 导出时紧凑存储的重复告警和请求体引用都还原为完整内容，归档文件不依赖数据库；
+  headers / parsed_data / ai_analysis 保存为 JSON 文本
+- 同一批事件重新导出时文件名相同（先写临时文件再替换），中途失败后重新执行不会产生重复文件
+
+pyarrow 随 requirements.txt 安装，只在归档和查询时导入。由 cron 执行：
+
+    python archive.py run [--days 30] [--dry-run]
+    python archive.py query --start 2026-01-01 --end 2026-02-01 --source prometheus --importance high
+    python archive.py status
+
+也可以通过 GET /api/archive/webhooks 查询（参数与列表接口相同，不支持标签过滤）。
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Optional
+from urllib.parse import quote
+
+from sqlalchemy import func, tuple_
+
+from compact_duplicates import materialize_expiring
+from config import Config
+from logger import logger
+from models import WEBHOOK_FIELDS, WebhookEvent, attach_references, delete_orphan_references, get_engine, session_scope
+from utils import decode_list_cursor, encode_list_cursor
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+# 以 JSON 文本保存的字段
+_JSON_FIELDS = frozenset(('headers', 'parsed_data', 'ai_analysis'))
+
+# 归档查询支持的过滤条件（不支持 label.<name>）
+ARCHIVE_FILTERS = ('source', 'importance', 'alert_hash', 'forward_status', 'duplicate', 'start', 'end')
+
+
+class ArchiveUnavailable(Exception):
+    """未安装 pyarrow"""
+
+
+def _pyarrow():
+    """
+    导入 pyarrow，返回 (pyarrow, pyarrow.dataset, pyarrow.parquet)
+
+    只在归档和查询时导入，worker 和其他脚本不承担 pyarrow 的导入开销。
+
+    Raises:
+        ArchiveUnavailable: 未安装 pyarrow
+    """
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ArchiveUnavailable("归档需要安装 pyarrow") from None
+    return pyarrow, pyarrow.dataset, pyarrow.parquet
+
+
+def archive_schema() -> 'pa.Schema':
+    """归档文件的列（source 在目录分区中）"""
+    pa, _, _ = _pyarrow()
+    types = {
+        'id': pa.int64(), 'is_duplicate': pa.int8(), 'duplicate_of': pa.int64(), 'duplicate_count': pa.int32(),
+        'timestamp': pa.timestamp('us'), 'created_at': pa.timestamp('us'), 'updated_at': pa.timestamp('us'),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in WEBHOOK_FIELDS if name != 'source'])
+
+
+def _open_dataset() -> 'ds.Dataset':
+    pa, ds, _ = _pyarrow()
+    partitioning = ds.partitioning(pa.schema([('day', pa.string()), ('source', pa.string())]), flavor='hive')
+    return ds.dataset(Config.ARCHIVE_DIR, format='parquet', partitioning=partitioning)
+
+
+def _event_row(event: WebhookEvent) -> dict[str, Any]:
+    row = {}
+    for name in WEBHOOK_FIELDS:
+        if name == 'source':
+            continue
+        value = event.get_field(name) if name in ('raw_payload', *_JSON_FIELDS) else getattr(event, name)
+        if name in _JSON_FIELDS and value is not None:
+            value = json.dumps(value, ensure_ascii=False)
+        row[name] = value
+    return row
+
+
+class _DayWriter:
+    """一天内各来源的 Parquet 写入器（每个来源一个文件，按批追加行组）"""
+
+    def __init__(self, day: datetime) -> None:
+        self.directory = os.path.join(Config.ARCHIVE_DIR, f"day={day:%Y-%m-%d}")
+        self.schema = archive_schema()
+        self.writers: dict[str, tuple[Any, str, list[int]]] = {}
+
+    def write(self, source: str, rows: list[dict[str, Any]]) -> None:
+        pa, _, pq = _pyarrow()
+        if source not in self.writers:
+            directory = os.path.join(self.directory, f"source={quote(source, safe='')}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{rows[0]['id']}.tmp")
+            writer = pq.ParquetWriter(path, self.schema, compression=Config.ARCHIVE_COMPRESSION)
+            self.writers[source] = (writer, path, [])
+        writer, _, ids = self.writers[source]
+        writer.write_table(pa.Table.from_pylist(rows, schema=self.schema), row_group_size=Config.ARCHIVE_ROW_GROUP_SIZE)
+        ids.extend(row['id'] for row in rows)
+
+    def close(self) -> tuple[list[str], list[int]]:
+        """关闭全部文件并改为正式文件名，返回 (文件路径, 已写入的事件 ID)"""
+        paths, exported = [], []
+        for writer, path, ids in self.writers.values():
+            writer.close()
+            final = os.path.join(os.path.dirname(path), f"part-{min(ids)}-{max(ids)}.parquet")
+            os.replace(path, final)
+            paths.append(final)
+            exported.extend(ids)
+        return paths, exported
+
+    def abort(self) -> None:
+        for writer, path, _ in self.writers.values():
+            writer.close()
+            os.remove(path)
+
+
+def _export_day(start: datetime, end: datetime, batch_size: int) -> tuple[list[str], list[int]]:
+    """导出 [start, end) 内的事件，按 (source, timestamp, id) 顺序分批读取"""
+    writer = _DayWriter(start)
+    position = None
+    try:
+        while True:
+            with session_scope() as session:
+                query = session.query(WebhookEvent).filter(
+                    WebhookEvent.timestamp >= start, WebhookEvent.timestamp < end
+                )
+                if position is not None:
+                    query = query.filter(
+                        tuple_(WebhookEvent.source, WebhookEvent.timestamp, WebhookEvent.id) > position
+                    )
+                events = query.order_by(
+                    WebhookEvent.source, WebhookEvent.timestamp, WebhookEvent.id
+                ).limit(batch_size).all()
+                if not events:
+                    break
+                attach_references(session, events)
+                batches: dict[str, list[dict[str, Any]]] = {}
+                for event in events:
+                    batches.setdefault(event.source, []).append(_event_row(event))
+                last = events[-1]
+                position = (last.source, last.timestamp, last.id)
+            for source, rows in batches.items():
+                writer.write(source, rows)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def _delete_events(start: datetime, end: datetime, ids: list[int], batch_size: int) -> int:
+    deleted = 0
+    for offset in range(0, len(ids), batch_size):
+        with session_scope() as session:
+            deleted += session.query(WebhookEvent).filter(
+                WebhookEvent.timestamp >= start,
+                WebhookEvent.timestamp < end,
+                WebhookEvent.id.in_(ids[offset:offset + batch_size])
+            ).delete(synchronize_session=False)
+    return deleted
+
+
+def archive_events(
+    days: Optional[int] = None,
+    now: Optional[datetime] = None,
+    batch_size: int = 5000,
+    dry_run: bool = False
+) -> dict[str, Any]:
+    """
+    把早于 days 天（默认 ARCHIVE_AFTER_DAYS）的事件按天导出到 Parquet 后从数据库删除
+
+    每天的文件全部写入完成后才删除这一天已导出的事件。删除前先把原始告警在这一天、自身更晚的
+    紧凑存储重复告警还原为完整副本（之后导出或仍留在数据库中时不依赖已删除的原始告警）。
+
+    Returns:
+        dict: days（处理的天数）、files（写入的文件）、archived（导出的事件数）、deleted（删除的事件数），
+            dry_run 时 archived 为待归档的事件数
+    """
+    _pyarrow()
+    days = Config.ARCHIVE_AFTER_DAYS if days is None else days
+    if days <= 0:
+        raise ValueError("归档天数需大于 0（设置 ARCHIVE_AFTER_DAYS 或传入 --days）")
+    cutoff = (now or datetime.now()) - timedelta(days=days)
+    result = {'days': 0, 'files': [], 'archived': 0, 'deleted': 0}
+
+    with session_scope() as session:
+        oldest = session.query(func.min(WebhookEvent.timestamp)).filter(WebhookEvent.timestamp < cutoff).scalar()
+        if dry_run:
+            result['archived'] = session.query(WebhookEvent).filter(WebhookEvent.timestamp < cutoff).count()
+    if oldest is None or dry_run:
+        return result
+
+    day = datetime.combine(oldest.date(), datetime.min.time())
+    while day < cutoff:
+        end = min(day + timedelta(days=1), cutoff)
+        paths, ids = _export_day(day, end, batch_size)
+        if ids:
+            # 删除前还原原始告警在这一天、自身在之后（下一天或保留在数据库中）的紧凑存储重复告警
+            materialize_expiring(get_engine(), end)
+            result['deleted'] += _delete_events(day, end, ids, batch_size)
+            result['files'] += paths
+            result['archived'] += len(ids)
+            result['days'] += 1
+            logger.info(f"已归档 {day:%Y-%m-%d} 的 {len(ids)} 条事件到 {len(paths)} 个文件")
+        day += timedelta(days=1)
+
+    if Config.PAYLOAD_STORE == 'blob' and result['deleted']:
+        with get_engine().begin() as conn:
+            delete_orphan_references(conn)
+    return result
+
+
+def _filter_expression(filters: dict[str, Any], position: Optional[tuple[datetime, int]]) -> Optional['ds.Expression']:
+    """过滤条件转换为 pyarrow 表达式：day / source 用于分区裁剪，其余按行组统计下推"""
+    _, ds, _ = _pyarrow()
+    unsupported = [name for name in filters if name not in ARCHIVE_FILTERS]
+    if unsupported:
+        raise ValueError(f"归档查询不支持的过滤条件: {', '.join(unsupported)}")
+    conditions = []
+    if 'start' in filters:
+        conditions += [ds.field('day') >= f"{filters['start']:%Y-%m-%d}", ds.field('timestamp') >= filters['start']]
+    if 'end' in filters:
+        conditions += [ds.field('day') <= f"{filters['end']:%Y-%m-%d}", ds.field('timestamp') < filters['end']]
+    for name in ('source', 'importance', 'alert_hash', 'forward_status'):
+        if name in filters:
+            conditions.append(ds.field(name) == filters[name])
+    if 'duplicate' in filters:
+        conditions.append(ds.field('is_duplicate') == (1 if filters['duplicate'] else 0))
+    if position is not None:
+        timestamp, webhook_id = position
+        conditions += [
+            ds.field('day') <= f"{timestamp:%Y-%m-%d}",
+            (ds.field('timestamp') < timestamp) | ((ds.field('timestamp') == timestamp) & (ds.field('id') < webhook_id)),
+        ]
+    return _and(*conditions)
+
+
+def _and(*conditions: Optional['ds.Expression']) -> Optional['ds.Expression']:
+    expression = None
+    for condition in conditions:
+        if condition is not None:
+            expression = condition if expression is None else expression & condition
+    return expression
+
+
+def query_archive(
+    filters: Optional[dict[str, Any]] = None,
+    fields: Optional[tuple[str, ...]] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> tuple[list[dict[str, Any]], Optional[str], int]:
+    """
+    查询归档事件，按接收时间倒序
+
+    按 day 分区从新到旧读取，取满一页后不再读取更早的分区；先只读取排序键，
+    再为本页的事件读取 fields 中的其余列。宽时间范围的第一页只读取最近几天的文件。
+
+    Args:
+        filters: resolve_filters 的结果（source / importance / alert_hash / forward_status / duplicate / start / end）
+        fields: 输出字段（resolve_fields 的结果），None 表示全部字段；只读取需要的列
+        limit: 最多返回的事件数
+        cursor: 上一页返回的 next_cursor
+
+    Returns:
+        tuple: (事件列表, 下一页游标, 读取的文件数)
+
+    Raises:
+        ArchiveUnavailable: 未安装 pyarrow
+        ValueError: 过滤条件或游标无效
+    """
+    _pyarrow()
+    if cursor and cursor.isdigit():
+        raise ValueError("cursor 无效")
+    position = decode_list_cursor(None, cursor) if cursor else None
+    expression = _filter_expression(filters or {}, position)
+    if not os.path.isdir(Config.ARCHIVE_DIR):
+        return [], None, 0
+
+    pa, ds, _ = _pyarrow()
+    dataset = _open_dataset()
+    names = list(WEBHOOK_FIELDS if fields is None else fields)
+    columns = names + [name for name in ('id', 'timestamp') if name not in names]
+    order = [('timestamp', 'descending'), ('id', 'descending')]
+
+    # 分区裁剪后按天从新到旧只读取排序键，凑够 limit + 1 条即停止（每个 day 分区内的事件都晚于更早的分区）
+    days: dict[str, int] = {}
+    for fragment in dataset.get_fragments(filter=expression):
+        day = ds.get_partition_keys(fragment.partition_expression)['day']
+        days[day] = days.get(day, 0) + 1
+    scanned, keys = [], []
+    for day in sorted(days, reverse=True):
+        scanned.append(day)
+        keys.append(dataset.to_table(columns=['id', 'timestamp'], filter=_and(expression, ds.field('day') == day)))
+        if sum(table.num_rows for table in keys) > limit:
+            break
+    if not keys:
+        return [], None, 0
+    page = pa.concat_tables(keys).sort_by(order).slice(0, limit + 1)
+    ids = page.column('id').to_pylist()
+
+    # 只为本页的事件读取其余列（fields=full 时不会读出整天的请求体）
+    table = dataset.to_table(columns=columns, filter=_and(
+        expression, ds.field('day').isin(scanned), ds.field('id').isin(ids[:limit])
+    )).sort_by(order)
+    files = sum(days[day] for day in scanned)
+
+    webhooks = []
+    for row in table.to_pylist():
+        webhook = {}
+        for name in names:
+            value = row[name]
+            if name in _JSON_FIELDS and value is not None:
+                value = json.loads(value)
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            webhook[name] = value
+        webhooks.append(webhook)
+
+    next_cursor = None
+    if len(ids) > limit:
+        last = page.slice(limit - 1, 1).to_pylist()[0]
+        next_cursor = encode_list_cursor(last['timestamp'], last['id'])
+    return webhooks, next_cursor, files
+
+
+def archive_status() -> list[dict[str, Any]]:
+    """各分区目录的文件数、事件数和文件大小"""
+    _, ds, _ = _pyarrow()
+    if not os.path.isdir(Config.ARCHIVE_DIR):
+        return []
+    partitions: dict[tuple[str, str], dict[str, Any]] = {}
+    dataset = _open_dataset()
+    for fragment in dataset.get_fragments():
+        values = ds.get_partition_keys(fragment.partition_expression)
+        key = (values.get('day'), values.get('source'))
+        entry = partitions.setdefault(key, {'day': key[0], 'source': key[1], 'files': 0, 'events': 0, 'bytes': 0})
+        entry['files'] += 1
+        entry['events'] += fragment.metadata.num_rows
+        entry['bytes'] += os.path.getsize(fragment.path)
+    return [partitions[key] for key in sorted(partitions)]
+
+
+def main() -> int:
+    from utils import resolve_fields, resolve_filters
+
+    parser = argparse.ArgumentParser(description='过期事件归档（Parquet）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help='归档早于指定天数的事件')
+    run.add_argument('--days', type=int, default=None, help='归档早于多少天的事件（默认 ARCHIVE_AFTER_DAYS）')
+    run.add_argument('--batch-size', type=int, default=5000, help='每批读取 / 删除的事件数')
+    run.add_argument('--dry-run', action='store_true', help='只统计待归档的事件数')
+    query = subparsers.add_parser('query', help='查询归档事件')
+    for name in ARCHIVE_FILTERS:
+        query.add_argument(f'--{name}', default=None)
+    query.add_argument('--fields', default='summary', help='full / summary / 逗号分隔的字段名')
+    query.add_argument('--limit', type=int, default=20)
+    subparsers.add_parser('status', help='查看归档分区')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'run':
+            result = archive_events(days=args.days, batch_size=args.batch_size, dry_run=args.dry_run)
+            if args.dry_run:
+                print(f"[dry-run] 待归档事件 {result['archived']} 条")
+            else:
+                print(f"归档 {result['days']} 天、{result['archived']} 条事件，写入 {len(result['files'])} 个文件，"
+                      f"删除 {result['deleted']} 条")
+        elif args.command == 'query':
+            filters = resolve_filters({name: getattr(args, name) for name in ARCHIVE_FILTERS if getattr(args, name)})
+            webhooks, next_cursor, files = query_archive(filters, resolve_fields(args.fields), limit=args.limit)
+            for webhook in webhooks:
+                print(json.dumps(webhook, ensure_ascii=False))
+            print(f"共 {len(webhooks)} 条（扫描 {files} 个文件）" + (f"，next_cursor={next_cursor}" if next_cursor else ''))
+        else:
+            for entry in archive_status():
+                print(f"{entry['day']}  {entry['source']:<20} {entry['files']:>3} 个文件 "
+                      f"{entry['events']:>8} 条 {entry['bytes'] / 1024:>10.1f} KB")
+    except (ArchiveUnavailable, ValueError) as e:
+        print(f"✗ {e}")
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Webhook 接收 ASGI 入口（asyncio）
+
+只提供 webhook 接收相关接口，处理流水线见 async_pipeline.py：
+- POST /webhook、POST /webhook/<source>
+- GET /health
+- GET /ready
+- GET /metrics
+
+管理界面和其他 API 仍由 Flask 应用（app:app）提供，两者共用同一个数据库，
+部署时由反向代理把 /webhook 路由到本服务：
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8001 --workers 2
+    python asgi_app.py
+"""
+import json
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+from werkzeug.datastructures import Headers
+
+import async_pipeline
+import query_stats
+import tracing
+from config import Config
+from logger import logger
+from metrics import INFLIGHT, REQUEST_LATENCY, REQUESTS, render_metrics, source_label
+from utils import get_client_ip
+
+# 启动预热状态（lifespan startup 完成后 /ready 返回 200）
+_readiness = {'ready': False, 'warmup': {}}
+
+
+class _RequestInfo:
+    """提供 utils.get_client_ip 所需的 headers / remote_addr 属性"""
+
+    def __init__(self, headers: Headers, remote_addr: Optional[str]):
+        self.headers = headers
+        self.remote_addr = remote_addr
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _send_response(
+    send,
+    status: int,
+    body: bytes,
+    content_type: str = 'application/json',
+    extra_headers: Optional[list[tuple[str, str]]] = None
+) -> None:
+    headers = [(b'content-type', content_type.encode('latin-1')), (b'content-length', str(len(body)).encode())]
+    for name, value in extra_headers or []:
+        headers.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _json_body(data: dict[str, Any]) -> bytes:
+    return json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+
+
+async def _handle_webhook(scope, receive, source: Optional[str]) -> tuple[int, dict[str, Any]]:
+    """与 app.handle_webhook_process 一致：记录请求耗时和处理中请求数"""
+    headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+    if source is None:
+        source = headers.get('X-Webhook-Source', 'unknown')
+
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.source = source
+
+    start = time.perf_counter()
+    INFLIGHT.inc()
+    status = 500
+    try:
+        payload = await _read_body(receive)
+        client = scope.get('client')
+        client_ip = get_client_ip(_RequestInfo(headers, client[0] if client else None))
+        status, body = await async_pipeline.process_webhook(source, payload, headers, client_ip)
+        return status, body
+    except Exception as e:
+        logger.error(f"处理 Webhook 时发生错误: {str(e)}", exc_info=True)
+        return 500, {'success': False, 'error': 'Internal server error'}
+    finally:
+        INFLIGHT.dec()
+        label = source_label(source)
+        REQUEST_LATENCY.labels(source=label).observe(time.perf_counter() - start)
+        REQUESTS.labels(source=label, status=str(status)).inc()
+
+
+async def _handle_http(scope, receive, send) -> None:
+    method = scope['method']
+    path = scope['path'].rstrip('/') or '/'
+
+    if path == '/health' and method == 'GET':
+        await _send_response(send, 200, _json_body({
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'service': 'webhook-receiver-asgi'
+        }))
+        return
+
+    if path == '/ready' and method == 'GET':
+        await _send_response(send, 200 if _readiness['ready'] else 503, _json_body({
+            'status': 'ready' if _readiness['ready'] else 'warming_up',
+            'warmup': _readiness['warmup']
+        }))
+        return
+
+    if path == '/metrics' and method == 'GET':
+        body, content_type = render_metrics()
+        await _send_response(send, 200, body, content_type)
+        return
+
+    if path == '/webhook' or path.startswith('/webhook/'):
+        if method != 'POST':
+            await _send_response(send, 405, _json_body({'success': False, 'error': 'Method not allowed'}))
+            return
+        source = path[len('/webhook/'):] if path != '/webhook' else None
+        if source is not None and '/' in source:
+            await _send_response(send, 404, _json_body({'success': False, 'error': 'Not found'}))
+            return
+
+        trace = tracing.start_trace(method, path)
+        query_stats.start(f"{method} {path}")
+        status, body = 500, {'success': False, 'error': 'Internal server error'}
+        try:
+            status, body = await _handle_webhook(scope, receive, source)
+        finally:
+            tracing.end_trace()
+            trace.query_stats = query_stats.current()
+            trace.finish(status)
+            tracing.slow_requests.offer(trace)
+        try:
+            query_stats.finish()
+        except query_stats.QueryBudgetExceeded as e:
+            # 与 Flask 链路一致：QUERY_BUDGET_MODE=raise 时超出预算返回 500
+            logger.error(str(e))
+            status, body = 500, {'success': False, 'error': str(e)}
+        await _send_response(send, status, _json_body(body), extra_headers=[('Server-Timing', trace.server_timing())])
+        return
+
+    await _send_response(send, 404, _json_body({
+        'success': False,
+        'error': 'Not found',
+        'message': '管理界面和其他 API 由 Flask 应用（app:app）提供'
+    }))
+
+
+async def _handle_lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await async_pipeline.init_async_db()
+                start = time.perf_counter()
+                connections = await async_pipeline.warmup_async_pool(Config.DB_POOL_WARMUP)
+                _readiness.update(ready=True, warmup={
+                    'db_connections': connections,
+                    'duration_ms': round((time.perf_counter() - start) * 1000, 2)
+                })
+                await send({'type': 'lifespan.startup.complete'})
+            except Exception as e:
+                logger.error(f"ASGI 服务启动失败: {str(e)}", exc_info=True)
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+        elif message['type'] == 'lifespan.shutdown':
+            # uvicorn 在处理中的请求结束（或 --timeout-graceful-shutdown 到期）后才发送 shutdown
+            await async_pipeline.release_worker_locks_async()
+            await async_pipeline.close_async_resources()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """ASGI 应用入口"""
+    if scope['type'] == 'lifespan':
+        await _handle_lifespan(receive, send)
+    elif scope['type'] == 'http':
+        await _handle_http(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    logger.info(f"启动 Webhook ASGI 服务: http://{Config.HOST}:{Config.PORT}")
+    uvicorn.run(app, host=Config.HOST, port=Config.PORT, log_level=Config.LOG_LEVEL.lower())
@@ -0,0 +1,481 @@
+"""
+asyncio 版 webhook 处理流水线（ASGI 入口见 asgi_app.py）
+
+与 Flask 链路共用的部分：
+- 告警哈希、转发决策、事件记录构建（utils）
+- 提示词构建、AI 响应解析、规则分析降级、飞书卡片和转发请求构建（ai_analyzer）
+- LLM 响应缓存、Prometheus 指标、请求追踪和 SQL 统计
+
+I/O 使用异步实现：SQLAlchemy AsyncEngine（asyncpg / aiosqlite）、AsyncOpenAI、httpx.AsyncClient，
+单个进程可以同时等待数千个慢 LLM 请求。
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Optional, Union
+
+import httpx
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+import drain
+import query_stats
+from ai_analyzer import (
+    ai_unavailable_reason, build_completion_request, build_forward_request, fallback_to_rules,
+    forward_result_from_response, parse_ai_response
+)
+from config import Config
+from llm_cache import cached_completion_async
+from logger import logger
+from metrics import DUPLICATES, FORWARDS, LOCK_WAITERS, instrument_engine, observe_stage, source_label
+from models import Base, ProcessingLock, WebhookEvent, attach_references
+from utils import (
+    build_webhook_event, decide_forward, generate_alert_hash, increment_duplicate_count, reference_inserts,
+    save_webhook_to_file, verify_signature
+)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# 类型别名
+WebhookData = dict[str, Any]
+AnalysisResult = dict[str, Any]
+ForwardResult = dict[str, Any]
+
+# Worker 标识（与 Flask worker 共用处理锁表）
+_WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-asgi"
+
+# 分布式锁配置（与 app.py 一致）
+_LOCK_TTL_SECONDS = 120
+_LOCK_WAIT_SECONDS = 3
+_LOCK_POLL_INTERVAL = 0.2
+
+# 异步驱动映射
+_ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+_openai_client: Optional['AsyncOpenAI'] = None
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def async_database_url(url: str) -> str:
+    """将同步数据库 URL 转换为异步驱动 URL（已指定异步驱动时原样返回）"""
+    scheme, sep, rest = url.partition('://')
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+def get_async_engine() -> AsyncEngine:
+    """获取异步数据库引擎（单例）"""
+    global _engine, _session_factory
+    if _engine is None:
+        url = Config.ASYNC_DATABASE_URL or async_database_url(Config.DATABASE_URL)
+        options: dict[str, Any] = {'echo': False, 'pool_pre_ping': True}
+        if not url.startswith('sqlite'):
+            options.update(
+                pool_size=Config.DB_POOL_SIZE,
+                max_overflow=Config.DB_MAX_OVERFLOW,
+                pool_recycle=Config.DB_POOL_RECYCLE,
+                pool_timeout=Config.DB_POOL_TIMEOUT
+            )
+        else:
+            options['connect_args'] = {'timeout': 30}
+        _engine = create_async_engine(url, **options)
+        _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
+        # 事件监听挂在底层同步引擎上
+        instrument_engine(_engine.sync_engine)
+        query_stats.instrument_engine(_engine.sync_engine)
+    return _engine
+
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncGenerator[AsyncSession, None]:
+    """异步事务上下文：正常退出提交，异常回滚"""
+    get_async_engine()
+    session = _session_factory()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+async def init_async_db() -> None:
+    """创建数据库表（已存在时跳过）"""
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def warmup_async_pool(size: int) -> int:
+    """预先建立数据库连接并放回连接池（与 models.warmup_pool 一致，不超过 DB_POOL_SIZE）"""
+    engine = get_async_engine()
+    connections = []
+    try:
+        for _ in range(min(size, Config.DB_POOL_SIZE)):
+            conn = await engine.connect()
+            connections.append(conn)
+            await conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            await conn.close()
+    return len(connections)
+
+
+def get_async_openai_client() -> 'AsyncOpenAI':
+    """获取共享的 AsyncOpenAI 客户端（OpenAI SDK 在首次使用时导入，与 ai_analyzer 一致）"""
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncOpenAI
+        _openai_client = AsyncOpenAI(
+            api_key=Config.OPENAI_API_KEY,
+            base_url=Config.OPENAI_API_URL,
+            max_retries=Config.OPENAI_MAX_RETRIES
+        )
+    return _openai_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """获取共享的转发 HTTP 客户端"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=Config.HTTP_POOL_MAXSIZE,
+                                max_keepalive_connections=Config.HTTP_POOL_MAXSIZE)
+        )
+    return _http_client
+
+
+async def close_async_resources() -> None:
+    """关闭共享客户端和数据库连接池（ASGI lifespan shutdown 时调用）"""
+    global _engine, _session_factory, _openai_client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _session_factory = None
+
+
+# ====== 处理锁 ======
+
+async def acquire_processing_lock(alert_hash: str) -> bool:
+    """插入处理锁记录（主键冲突说明已有其他 worker 在处理）"""
+    try:
+        async with async_session_scope() as session:
+            threshold = datetime.now() - timedelta(seconds=_LOCK_TTL_SECONDS)
+            result = await session.execute(delete(ProcessingLock).where(ProcessingLock.created_at < threshold))
+            if result.rowcount:
+                logger.warning(f"清理了 {result.rowcount} 个过期的处理锁")
+        async with async_session_scope() as session:
+            session.add(ProcessingLock(alert_hash=alert_hash, created_at=datetime.now(), worker_id=_WORKER_ID))
+        return True
+    except IntegrityError:
+        logger.info("告警正由其他 worker 处理中: hash=%s...", alert_hash[:16])
+        return False
+    except Exception as e:
+        logger.error(f"获取处理锁失败: {e}")
+        return False
+
+
+async def release_processing_lock(alert_hash: str) -> None:
+    try:
+        async with async_session_scope() as session:
+            await session.execute(delete(ProcessingLock).where(ProcessingLock.alert_hash == alert_hash))
+    except Exception as e:
+        logger.error(f"释放处理锁失败: {e}")
+
+
+async def release_worker_locks_async() -> int:
+    """释放当前进程持有的处理锁（lifespan shutdown 时调用，与 app.release_worker_locks 一致）"""
+    try:
+        async with async_session_scope() as session:
+            result = await session.execute(delete(ProcessingLock).where(ProcessingLock.worker_id == _WORKER_ID))
+    except Exception as e:
+        logger.error(f"释放 worker 处理锁失败: {e}")
+        return 0
+    if result.rowcount:
+        logger.warning(f"worker {_WORKER_ID} 退出时释放了 {result.rowcount} 个处理锁")
+    return result.rowcount
+
+
+async def wait_for_lock_release(alert_hash: str) -> bool:
+    """轮询等待处理锁释放（最长 _LOCK_WAIT_SECONDS 秒）"""
+    deadline = time.monotonic() + _LOCK_WAIT_SECONDS
+    while True:
+        async with async_session_scope() as session:
+            held = (await session.execute(
+                select(ProcessingLock.alert_hash).where(ProcessingLock.alert_hash == alert_hash)
+            )).first() is not None
+        if not held:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(_LOCK_POLL_INTERVAL, remaining))
+
+
+# ====== 去重和保存 ======
+
+async def check_duplicate_alert_async(alert_hash: str) -> tuple[bool, Optional[WebhookEvent]]:
+    """检查时间窗口内是否存在相同哈希的原始告警"""
+    try:
+        async with async_session_scope() as session:
+            time_threshold = datetime.now() - timedelta(hours=Config.DUPLICATE_ALERT_TIME_WINDOW)
+            original_event = (await session.execute(
+                select(WebhookEvent)
+                .where(
+                    WebhookEvent.alert_hash == alert_hash,
+                    WebhookEvent.timestamp >= time_threshold,
+                    WebhookEvent.is_duplicate == 0
+                )
+                .order_by(WebhookEvent.timestamp.desc())
+                .limit(1)
+            )).scalar_one_or_none()
+            if original_event is not None and Config.COMPACT_DUPLICATES:
+                # 会话关闭前加载请求体 / 请求头引用（紧凑存储计算差异时使用）
+                await session.run_sync(attach_references, [original_event])
+    except Exception as e:
+        logger.error(f"检查重复告警失败: {str(e)}")
+        return False, None
+
+    if original_event is None:
+        return False, None
+    logger.info("检测到重复告警: hash=%s, 原始告警ID=%s", alert_hash, original_event.id, extra={'sampled': True})
+    return True, original_event
+
+
+async def save_webhook_data_async(
+    data: WebhookData,
+    source: str,
+    raw_payload: bytes,
+    headers: dict[str, str],
+    client_ip: Optional[str],
+    ai_analysis: AnalysisResult,
+    alert_hash: str,
+    original_event: Optional[WebhookEvent] = None
+) -> tuple[Union[int, str], bool, Optional[int], Optional[datetime]]:
+    """保存事件（重复告警同时递增原始告警的重复计数），与 utils.save_webhook_data 语义一致"""
+    try:
+        async with async_session_scope() as session:
+            duplicate_count = None
+            if original_event is not None:
+                duplicate_count = (await session.execute(increment_duplicate_count(original_event))).scalar_one_or_none()
+            is_duplicate = duplicate_count is not None
+            webhook_event = build_webhook_event(
+                data, source, raw_payload, headers, client_ip, alert_hash,
+                ai_analysis=ai_analysis, original_event=original_event if is_duplicate else None
+            )
+            for statement in reference_inserts(webhook_event, session.bind.dialect.name):
+                await session.execute(statement)
+            session.add(webhook_event)
+            await session.flush()
+            webhook_id, timestamp = webhook_event.id, webhook_event.timestamp
+        logger.info("Webhook 数据已保存到数据库: ID=%s", webhook_id, extra={'sampled': True})
+
+        if Config.ENABLE_FILE_BACKUP:
+            await asyncio.to_thread(save_webhook_to_file, data, source, raw_payload, headers, client_ip,
+                                    original_event.ai_analysis if is_duplicate else ai_analysis)
+        return webhook_id, is_duplicate, original_event.id if is_duplicate else None, timestamp
+
+    except Exception as e:
+        logger.error(f"保存 webhook 数据到数据库失败: {str(e)}")
+        file_id = await asyncio.to_thread(save_webhook_to_file, data, source, raw_payload, headers, client_ip,
+                                          ai_analysis)
+        return file_id, False, None, None
+
+
+async def update_forward_status_async(
+    webhook_id: Union[int, str],
+    timestamp: Optional[datetime],
+    forward_status: str
+) -> None:
+    """按 (id, timestamp) 回写转发状态，与 utils.update_forward_status 语义一致"""
+    if not isinstance(webhook_id, int):
+        return
+    try:
+        async with async_session_scope() as session:
+            await session.execute(
+                update(WebhookEvent).where(
+                    WebhookEvent.id == webhook_id,
+                    WebhookEvent.timestamp == timestamp
+                ).values(forward_status=forward_status)
+            )
+    except Exception as e:
+        logger.error(f"更新转发状态失败: ID={webhook_id}, 错误: {str(e)}")
+
+
+# ====== AI 分析和转发 ======
+
+async def analyze_webhook_async(webhook_data: WebhookData) -> AnalysisResult:
+    """AI 分析（失败时降级为规则分析）"""
+    reason = ai_unavailable_reason()
+    if reason:
+        return fallback_to_rules(webhook_data, reason)
+
+    source = webhook_data.get('source', 'unknown')
+    try:
+        completion_request = build_completion_request(webhook_data.get('parsed_data', {}), source)
+
+        async def fetch_completion() -> str:
+            logger.info("调用 OpenAI API 分析 webhook: %s", source, extra={'sampled': True})
+            client = get_async_openai_client()
+            if drain.is_draining():
+                client = client.with_options(max_retries=0)
+            response = await client.chat.completions.create(
+                **completion_request,
+                timeout=drain.bounded_timeout(Config.OPENAI_TIMEOUT)
+            )
+            content = response.choices[0].message.content
+            if content is None:
+                raise ValueError("AI 返回空响应")
+            return content
+
+        ai_response = await cached_completion_async(completion_request, fetch_completion)
+        analysis = parse_ai_response(ai_response, source)
+        logger.info("AI 分析完成: %s", source, extra={'sampled': True})
+        return analysis
+    except Exception as e:
+        logger.error(f"AI 分析失败: {str(e)}，降级为规则分析", exc_info=True)
+        return fallback_to_rules(webhook_data, 'error')
+
+
+async def forward_to_remote_async(
+    webhook_data: WebhookData,
+    analysis_result: AnalysisResult,
+    target_url: Optional[str] = None
+) -> ForwardResult:
+    """转发分析结果（请求格式与 ai_analyzer.forward_to_remote 一致）"""
+    if not Config.ENABLE_FORWARD:
+        logger.info("转发功能已禁用")
+        return {'status': 'disabled', 'message': '转发功能已禁用'}
+
+    target_url = target_url or Config.FORWARD_URL
+    try:
+        forward_data, headers = build_forward_request(webhook_data, analysis_result, target_url)
+        logger.info("转发数据到 %s", target_url, extra={'sampled': True})
+        response = await get_async_http_client().post(
+            target_url, json=forward_data, headers=headers, timeout=drain.bounded_timeout(10)
+        )
+        return forward_result_from_response(response, target_url)
+    except httpx.TimeoutException:
+        logger.error(f"转发超时: {target_url}")
+        return {'status': 'timeout', 'message': '请求超时'}
+    except httpx.ConnectError:
+        logger.error(f"无法连接到远程服务器: {target_url}")
+        return {'status': 'connection_error', 'message': '无法连接到远程服务器'}
+    except Exception as e:
+        logger.error(f"转发失败: {str(e)}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
+
+
+# ====== 处理流水线 ======
+
+async def process_webhook(
+    source: str,
+    payload: bytes,
+    headers: Any,
+    client_ip: Optional[str]
+) -> tuple[int, dict[str, Any]]:
+    """
+    处理一条 webhook（与 app._process_webhook 流程一致）
+
+    Returns:
+        tuple: (HTTP 状态码, 响应 JSON)
+    """
+    logger.info("收到来自 %s 的 webhook 请求, 来源: %s", client_ip, source, extra={'sampled': True})
+
+    signature = headers.get('X-Webhook-Signature', '')
+    if signature:
+        with observe_stage('signature'):
+            signature_valid = verify_signature(payload, signature)
+        if not signature_valid:
+            logger.warning(f"签名验证失败: IP={client_ip}, Source={source}")
+            return 401, {'success': False, 'error': 'Invalid signature'}
+
+    try:
+        data = json.loads(payload)
+    except (ValueError, UnicodeDecodeError) as e:
+        logger.error(f"JSON 解析失败: {str(e)}")
+        return 400, {'success': False, 'error': 'Invalid JSON payload'}
+
+    webhook_full_data = {
+        'source': source,
+        'parsed_data': data,
+        'timestamp': datetime.now().isoformat(),
+        'client_ip': client_ip
+    }
+
+    with observe_stage('hash'):
+        alert_hash = generate_alert_hash(data, source)
+
+    with observe_stage('lock_acquire'):
+        got_lock = await acquire_processing_lock(alert_hash)
+    try:
+        if not got_lock:
+            logger.info("等待其他 worker 处理完成: hash=%s...", alert_hash[:16])
+            LOCK_WAITERS.inc()
+            try:
+                with observe_stage('lock_wait'):
+                    await wait_for_lock_release(alert_hash)
+            finally:
+                LOCK_WAITERS.dec()
+
+        with observe_stage('dedup_lookup'):
+            is_duplicate, original_event = await check_duplicate_alert_async(alert_hash)
+
+        if is_duplicate and original_event:
+            analysis_result = original_event.ai_analysis or {}
+        else:
+            with observe_stage('ai'):
+                analysis_result = await analyze_webhook_async(webhook_full_data)
+
+        with observe_stage('db_save'):
+            webhook_id, is_dup, original_id, saved_at = await save_webhook_data_async(
+                data, source, payload, dict(headers), client_ip, analysis_result, alert_hash,
+                original_event if is_duplicate else None
+            )
+    finally:
+        if got_lock:
+            await release_processing_lock(alert_hash)
+
+    if is_dup:
+        DUPLICATES.labels(source=source_label(source)).inc()
+
+    should_forward, skip_reason = decide_forward(analysis_result, is_dup, original_id)
+    forward_result = {'status': 'skipped', 'reason': skip_reason}
+    if should_forward:
+        with observe_stage('forward'):
+            forward_result = await forward_to_remote_async(webhook_full_data, analysis_result)
+    else:
+        logger.info("跳过自动转发: %s", skip_reason, extra={'sampled': True})
+    FORWARDS.labels(source=source_label(source), status=forward_result.get('status', 'unknown')).inc()
+
+    await update_forward_status_async(webhook_id, saved_at, forward_result.get('status', 'unknown'))
+
+    return 200, {
+        'success': True,
+        'message': 'Webhook processed successfully',
+        'timestamp': datetime.now().isoformat(),
+        'webhook_id': webhook_id,
+        'ai_analysis': analysis_result,
+        'forward_status': forward_result.get('status', 'unknown'),
+        'is_duplicate': is_dup,
+        'duplicate_of': original_id if is_dup else None
+    }
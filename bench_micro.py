@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+热点函数微基准测试
+
+对每个请求都会执行的辅助函数做微基准测试，语料按 small / large / huge-group 三档规模生成。
+结果可保存为 JSON 基线，compare 命令在任一函数退化超过阈值时以非零状态退出（可用于 CI）。
+
+    python bench_micro.py run                     # 只运行并打印
+    python bench_micro.py save                    # 运行并保存基线
+    python bench_micro.py compare --threshold 0.2 # 与基线对比，退化超过 20% 时失败
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime
+from typing import Any, Callable
+
+from bench_payloads import PayloadGenerator
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(_HERE, 'bench_baselines', 'micro.json')
+
+# 语料规模：(格式, Prometheus 分组告警数量)
+CORPUS_SIZES = {
+    'small': ('huawei', 1),
+    'large': ('prometheus', 50),
+    'huge-group': ('prometheus', 2000)
+}
+
+_SECRET = 'bench-secret'
+
+
+def build_corpus() -> dict[str, dict[str, Any]]:
+    """生成各规模语料"""
+    corpus = {}
+    for size, (kind, group_size) in CORPUS_SIZES.items():
+        source, payload, _ = PayloadGenerator(kinds=(kind,), group_size=group_size, seed=7).next()
+        raw = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        analysis = {
+            'source': source,
+            'event_type': 'metric_alert',
+            'importance': 'high',
+            'summary': 'CPU 使用率持续超过阈值，服务响应变慢',
+            'actions': [f'检查实例 {i} 的进程占用' for i in range(3 if size == 'small' else 20)],
+            'risks': ['服务可能不可用'],
+            'impact_scope': '订单服务全部实例',
+            'monitoring_suggestions': ['增加 CPU 使用率趋势告警']
+        }
+        analysis_text = json.dumps(analysis, ensure_ascii=False, indent=2)
+        corpus[size] = {
+            'source': source,
+            'payload': payload,
+            'raw': raw,
+            'signature': hmac.new(_SECRET.encode('utf-8'), raw, hashlib.sha256).hexdigest(),
+            'analysis': analysis,
+            # 带尾随逗号的 AI 响应，触发修复路径
+            'broken_json': analysis_text[:-2] + ',\n}',
+            # 非 JSON 的 AI 响应，触发文本提取兜底
+            'prose': analysis_text.replace('{', '').replace('}', '').replace('"', "'")
+        }
+    return corpus
+
+
+def build_cases(corpus: dict[str, dict[str, Any]]) -> dict[str, Callable[[], Any]]:
+    """构建 {用例名: 无参调用} 映射"""
+    from ai_analyzer import build_feishu_message, extract_from_text, fix_json_format
+    from models import WebhookEvent
+    from utils import generate_alert_hash, verify_signature
+
+    cases: dict[str, Callable[[], Any]] = {}
+    for size, item in corpus.items():
+        event = WebhookEvent(
+            id=1, source=item['source'], client_ip='10.0.0.1', timestamp=datetime.now(),
+            raw_payload=item['raw'].decode('utf-8'), headers={'Content-Type': 'application/json'},
+            parsed_data=item['payload'], alert_hash='0' * 64, ai_analysis=item['analysis'],
+            importance='high', forward_status='success', is_duplicate=0, duplicate_of=None,
+            duplicate_count=1, created_at=datetime.now(), updated_at=datetime.now()
+        )
+        webhook_data = {
+            'source': item['source'],
+            'parsed_data': item['payload'],
+            'timestamp': datetime.now().isoformat(),
+            'client_ip': '10.0.0.1'
+        }
+
+        cases[f'generate_alert_hash[{size}]'] = (
+            lambda item=item: generate_alert_hash(item['payload'], item['source']))
+        cases[f'fix_json_format[{size}]'] = lambda item=item: fix_json_format(item['broken_json'])
+        cases[f'extract_from_text[{size}]'] = lambda item=item: extract_from_text(item['prose'], item['source'])
+        cases[f'build_feishu_message[{size}]'] = (
+            lambda item=item, data=webhook_data: build_feishu_message(data, item['analysis']))
+        cases[f'WebhookEvent.to_dict[{size}]'] = lambda event=event: event.to_dict()
+        cases[f'verify_signature[{size}]'] = (
+            lambda item=item: verify_signature(item['raw'], item['signature'], _SECRET))
+    return cases
+
+
+def measure(func: Callable[[], Any], repeat: int = 5, min_time: float = 0.2) -> dict[str, float]:
+    """测量单次调用耗时（微秒），取多轮中的最小值以降低噪声"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    # autorange 以 0.2 秒为目标，按需放大迭代次数
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    timings = timer.repeat(repeat=repeat, number=number)
+    per_call = [t / number * 1e6 for t in timings]
+    return {
+        'per_call_us': round(min(per_call), 3),
+        'median_us': round(sorted(per_call)[len(per_call) // 2], 3),
+        'iterations': number
+    }
+
+
+def run_suite(filter_text: str = '') -> dict[str, Any]:
+    # 保留日志级别判断开销，但不输出到控制台/文件
+    service_logger = logging.getLogger('webhook_service')
+    service_logger.handlers = [logging.NullHandler()]
+    service_logger.propagate = False
+
+    cases = build_cases(build_corpus())
+    results = {}
+    for name, func in cases.items():
+        if filter_text and filter_text not in name:
+            continue
+        results[name] = measure(func)
+        print(f"{name:<40} {results[name]['per_call_us']:>12.2f} us")
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine()
+        },
+        'results': results
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    """返回退化超过阈值的用例说明列表"""
+    regressions = []
+    print(f"\n{'用例':<40} {'基线(us)':>12} {'当前(us)':>12} {'变化':>8}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f"{name:<40} {'-':>12} {result['per_call_us']:>12.2f} {'新增':>8}")
+            continue
+        ratio = result['per_call_us'] / base['per_call_us'] - 1 if base['per_call_us'] else 0.0
+        flag = ' ✗' if ratio > threshold else ''
+        print(f"{name:<40} {base['per_call_us']:>12.2f} {result['per_call_us']:>12.2f} {ratio:>+7.1%}{flag}")
+        if ratio > threshold:
+            regressions.append(f"{name}: {base['per_call_us']:.2f}us -> {result['per_call_us']:.2f}us ({ratio:+.1%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='热点函数微基准测试')
+    parser.add_argument('command', choices=('run', 'save', 'compare'))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件路径')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许的退化比例（默认 20%%）')
+    parser.add_argument('--filter', default='', help='只运行名称包含该字符串的用例')
+    args = parser.parse_args()
+
+    current = run_suite(args.filter)
+
+    if args.command == 'save':
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"\n基线已保存到 {args.baseline}")
+
+    elif args.command == 'compare':
+        if not os.path.exists(args.baseline):
+            print(f"基线文件不存在: {args.baseline}，请先运行 save")
+            return 2
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} 个用例退化超过 {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\n✓ 所有用例均未退化超过 {args.threshold:.0%}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+压测用合成告警数据生成器
+
+生成 Prometheus Alertmanager、华为云监控和通用格式的告警，
+支持控制重复告警比例（重复告警的去重关键字段相同，其余易变字段不同）。
+"""
+import hashlib
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+PAYLOAD_KINDS = ('prometheus', 'huawei', 'generic')
+
+_SEVERITIES = ('critical', 'warning', 'info')
+_NAMESPACES = ('prod', 'staging', 'infra', 'monitoring', 'payment')
+_SERVICES = ('api-gateway', 'order-service', 'user-service', 'payment-service', 'redis', 'postgres')
+_PROM_RULES = ('HighCPUUsage', 'HighMemoryUsage', 'PodCrashLooping', 'High5xxRate', 'DiskWillFillIn4Hours')
+_HUAWEI_RULES = (
+    ('CPU使用率告警', 'cpu_util'),
+    ('内存使用率告警', 'mem_util'),
+    ('4xxQPS告警', 'req_count_4xx'),
+    ('5xxQPS告警', 'req_count_5xx'),
+    ('磁盘使用率告警', 'disk_util')
+)
+_GENERIC_EVENTS = ('order.payment_failed', 'user.created', 'deploy.completed', 'job.failure', 'backup.finished')
+
+
+def _now_iso(offset_seconds: float = 0) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _fingerprint(labels: dict[str, str]) -> str:
+    key = ','.join(f"{k}={labels[k]}" for k in sorted(labels))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def _prometheus_identity(rng: random.Random, n: int) -> dict[str, Any]:
+    rule = rng.choice(_PROM_RULES)
+    namespace = rng.choice(_NAMESPACES)
+    service = rng.choice(_SERVICES)
+    return {
+        'rule': rule,
+        'severity': rng.choice(_SEVERITIES),
+        'namespace': namespace,
+        'service': service,
+        'pod': f"{service}-{n:05d}-{rng.randrange(16 ** 5):05x}",
+        'instance': f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}:9100"
+    }
+
+
+def make_prometheus_alert(identity: dict[str, Any], rng: random.Random, group_size: int = 1) -> dict[str, Any]:
+    """生成 Prometheus Alertmanager webhook（group_size 为分组内告警数量）"""
+    alerts = []
+    for i in range(group_size):
+        labels = {
+            'alertname': identity['rule'],
+            'severity': identity['severity'],
+            'internal_label_alert_level': identity['severity'],
+            'namespace': identity['namespace'],
+            'service': identity['service'],
+            'pod': identity['pod'] if i == 0 else f"{identity['pod']}-{i}",
+            'instance': identity['instance'],
+            'job': 'kubernetes-pods'
+        }
+        alerts.append({
+            'status': 'firing',
+            'labels': labels,
+            'annotations': {
+                'summary': f"{identity['rule']} on {labels['pod']}",
+                'description': f"当前值 {rng.uniform(80, 100):.2f}% 超过阈值 80%，持续 5 分钟",
+                'runbook_url': f"https://runbooks.example.com/{identity['rule']}"
+            },
+            'startsAt': _now_iso(-rng.randrange(60, 3600)),
+            'endsAt': '0001-01-01T00:00:00Z',
+            'generatorURL': f"http://prometheus:9090/graph?g0.expr={identity['rule']}",
+            'fingerprint': _fingerprint(labels)
+        })
+
+    common_labels = {k: v for k, v in alerts[0]['labels'].items() if k != 'pod'}
+    return {
+        'receiver': 'webhook-receiver',
+        'status': 'firing',
+        'alerts': alerts,
+        'groupLabels': {'alertname': identity['rule']},
+        'commonLabels': common_labels,
+        'commonAnnotations': {'summary': alerts[0]['annotations']['summary']},
+        'externalURL': 'http://alertmanager:9093',
+        'version': '4',
+        'groupKey': f"{{}}:{{alertname=\"{identity['rule']}\"}}",
+        'truncatedAlerts': 0,
+        'alertingRuleName': identity['rule']
+    }
+
+
+def _huawei_identity(rng: random.Random, n: int) -> dict[str, Any]:
+    rule_name, metric = rng.choice(_HUAWEI_RULES)
+    return {
+        'rule_name': rule_name,
+        'metric': metric,
+        'level': rng.choice(('critical', 'major', 'warning', 'info')),
+        'instance_id': f"i-{n:06d}{rng.randrange(16 ** 6):06x}",
+        'region': rng.choice(('cn-north-4', 'cn-east-3', 'ap-southeast-1'))
+    }
+
+
+def make_huawei_alert(identity: dict[str, Any], rng: random.Random) -> dict[str, Any]:
+    """生成华为云监控告警"""
+    threshold = rng.choice((80.0, 85.0, 90.0, 100.0))
+    return {
+        'Type': 'AlarmNotification',
+        'RuleName': identity['rule_name'],
+        'Level': identity['level'],
+        'MetricName': identity['metric'],
+        'CurrentValue': round(threshold * rng.uniform(1.0, 4.5), 2),
+        'Threshold': threshold,
+        'Resources': [{
+            'InstanceId': identity['instance_id'],
+            'Region': identity['region'],
+            'Dimensions': [{'name': 'instance_id', 'value': identity['instance_id']}]
+        }],
+        'AlarmTime': _now_iso(),
+        'AlarmId': f"al{rng.randrange(10 ** 12):012d}",
+        'Namespace': 'SYS.ECS'
+    }
+
+
+def _generic_identity(rng: random.Random, n: int) -> dict[str, Any]:
+    return {
+        'event': rng.choice(_GENERIC_EVENTS),
+        'service': rng.choice(_SERVICES),
+        'alert_id': f"alert-{n:06d}"
+    }
+
+
+def make_generic_event(identity: dict[str, Any], rng: random.Random) -> dict[str, Any]:
+    """生成通用格式事件"""
+    return {
+        'event': identity['event'],
+        'service': identity['service'],
+        'alert_id': identity['alert_id'],
+        'message': f"{identity['event']} 事件，请求 ID {rng.randrange(10 ** 9)}",
+        'user_id': rng.randrange(1, 10 ** 6),
+        'amount': round(rng.uniform(1, 5000), 2),
+        'timestamp': _now_iso()
+    }
+
+
+_IDENTITY_FACTORIES = {
+    'prometheus': _prometheus_identity,
+    'huawei': _huawei_identity,
+    'generic': _generic_identity
+}
+
+_SOURCES = {
+    'prometheus': 'prometheus',
+    'huawei': 'huawei-cloud',
+    'generic': 'generic'
+}
+
+
+class PayloadGenerator:
+    """
+    合成告警生成器
+
+    Args:
+        kinds: 参与生成的格式
+        duplicate_ratio: 重复告警比例（复用已生成告警的去重关键字段）
+        group_size: Prometheus 分组内告警数量
+        seed: 随机种子
+    """
+
+    def __init__(
+        self,
+        kinds: tuple[str, ...] = PAYLOAD_KINDS,
+        duplicate_ratio: float = 0.5,
+        group_size: int = 1,
+        seed: Optional[int] = None
+    ):
+        for kind in kinds:
+            if kind not in PAYLOAD_KINDS:
+                raise ValueError(f"不支持的告警格式: {kind}")
+        self.kinds = kinds
+        self.duplicate_ratio = duplicate_ratio
+        self.group_size = group_size
+        self.rng = random.Random(seed)
+        self._identities: list[tuple[str, dict[str, Any]]] = []
+        self._counter = 0
+
+    def next(self) -> tuple[str, dict[str, Any], bool]:
+        """
+        生成下一条告警
+
+        Returns:
+            tuple: (来源, 告警数据, 是否为预期重复)
+        """
+        expect_duplicate = bool(self._identities) and self.rng.random() < self.duplicate_ratio
+        if expect_duplicate:
+            kind, identity = self.rng.choice(self._identities)
+        else:
+            kind = self.rng.choice(self.kinds)
+            identity = _IDENTITY_FACTORIES[kind](self.rng, self._counter)
+            self._counter += 1
+            self._identities.append((kind, identity))
+
+        if kind == 'prometheus':
+            payload = make_prometheus_alert(identity, self.rng, self.group_size)
+        elif kind == 'huawei':
+            payload = make_huawei_alert(identity, self.rng)
+        else:
+            payload = make_generic_event(identity, self.rng)
+        return _SOURCES[kind], payload, expect_duplicate
@@ -0,0 +1,174 @@
+"""
+Webhook 变化推送（管理页面的 Server-Sent Events，见 /api/webhooks/stream）
+
+每个 worker 一个后台轮询线程：有订阅者时每 SSE_POLL_INTERVAL 秒执行一次增量查询
+（utils.get_webhook_changes），把新事件和已更新的事件（重复次数、转发状态等）广播给本 worker 的
+全部订阅者。N 个打开的管理页面只产生每个 worker 每个间隔一次走主键 / updated_at 索引的查询，
+不再是每 5 秒 N 次整页查询和计数；没有订阅者时轮询线程退出。
+
+本 worker 保存事件后调用 notify() 立即唤醒轮询；其他 worker 和 ASGI 接收服务写入的事件
+最迟一个轮询间隔后推送，不依赖数据库特定的通知机制（SQLite / PostgreSQL 行为一致）。
+gevent worker 下 threading / queue 已被 patch，轮询线程和订阅队列都不会阻塞其他请求。
+"""
+import json
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+
+from config import Config
+from logger import logger
+from models import WEBHOOK_SUMMARY_FIELDS, WebhookEvent, session_scope
+from utils import get_webhook_changes
+
+# 更新的回看窗口：updated_at 在事务提交前生成，提交较晚的更新可能早于已推送的最新时间
+_UPDATE_LAG = timedelta(seconds=2)
+
+# 每个订阅者最多积压的批次数，超出时断开该订阅者（客户端重连后按游标补发）
+_SUBSCRIBER_QUEUE_SIZE = 100
+
+# 单次增量查询最多返回的事件数
+_BATCH_LIMIT = 500
+
+Cursor = tuple[Optional[int], Optional[datetime]]
+
+
+def format_cursor(since_id: Optional[int], updated_since: Optional[datetime]) -> str:
+    """游标编码为 SSE 事件 ID：<since_id>|<updated_since>"""
+    return f"{since_id or ''}|{updated_since.isoformat() if updated_since else ''}"
+
+
+def parse_cursor(value: Optional[str]) -> Cursor:
+    """解析 format_cursor 生成的游标（浏览器重连时通过 Last-Event-ID 发回），格式错误时抛出 ValueError"""
+    if not value:
+        return None, None
+    since_id, _, updated_since = value.partition('|')
+    return (
+        int(since_id) if since_id else None,
+        datetime.fromisoformat(updated_since) if updated_since else None
+    )
+
+
+def format_event(event: str, data: object, cursor: Optional[Cursor] = None) -> str:
+    """生成一条 SSE 消息"""
+    lines = [f"event: {event}"]
+    if cursor is not None:
+        lines.append(f"id: {format_cursor(*cursor)}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class ChangeFeed:
+    """单个 worker 内的变化广播：一个轮询线程，多个订阅队列"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: set[queue.Queue] = set()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._since_id: Optional[int] = None
+        self._updated_since: Optional[datetime] = None
+        # 上一次增量查询被截断时的续查游标，取完之前不回到回看窗口
+        self._pending: Optional[Cursor] = None
+        # 回看窗口内已推送的 (id -> updated_at)，避免重复推送
+        self._recent: dict[int, str] = {}
+
+    def subscribe(self) -> queue.Queue:
+        """订阅变化，返回的队列中每一项为 (webhook 摘要列表, 游标)"""
+        subscriber = queue.Queue(maxsize=_SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def is_subscribed(self, subscriber: queue.Queue) -> bool:
+        """积压过多被断开的订阅者返回 False"""
+        return subscriber in self._subscribers
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def notify(self) -> None:
+        """本 worker 写入了事件，立即执行一次增量查询"""
+        if self._thread is not None:
+            self._wakeup.set()
+
+    def _start(self) -> None:
+        """从当前最新位置开始轮询（订阅前的变化由各连接按自己的游标补发）"""
+        with session_scope() as session:
+            self._since_id, self._updated_since = session.query(
+                func.max(WebhookEvent.id), func.max(WebhookEvent.updated_at)
+            ).one()
+        if self._since_id is None:
+            self._since_id = 0  # 空表：之后写入的事件都是新事件
+        self._pending = None
+        self._recent.clear()
+        self._thread = threading.Thread(target=self._run, name='webhook-change-feed', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(Config.SSE_POLL_INTERVAL)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"查询 webhook 变化失败: {str(e)}")
+
+    def poll(self) -> int:
+        """执行一次增量查询并广播，返回推送的事件数"""
+        if self._pending is not None:
+            since_id, updated_since = self._pending
+        else:
+            since_id = self._since_id
+            updated_since = self._updated_since - _UPDATE_LAG if self._updated_since else None
+        webhooks, has_more, cursor = get_webhook_changes(
+            since_id, updated_since, fields=WEBHOOK_SUMMARY_FIELDS, limit=_BATCH_LIMIT
+        )
+        self._pending = cursor if has_more else None
+        if cursor[0] is not None:
+            self._since_id = cursor[0]
+        fresh = [w for w in webhooks if self._recent.get(w['id']) != w['updated_at']]
+        for webhook in webhooks:
+            if webhook['updated_at']:
+                updated_at = datetime.fromisoformat(webhook['updated_at'])
+                if self._updated_since is None or updated_at > self._updated_since:
+                    self._updated_since = updated_at
+
+        for webhook in fresh:
+            self._recent[webhook['id']] = webhook['updated_at']
+        if self._updated_since is not None:
+            horizon = (self._updated_since - _UPDATE_LAG).isoformat()
+            self._recent = {k: v for k, v in self._recent.items() if v and v >= horizon}
+
+        if fresh:
+            self._publish(fresh, cursor)
+        if has_more:
+            self._wakeup.set()
+        return len(fresh)
+
+    def _publish(self, webhooks: list[dict], cursor: Cursor) -> None:
+        """cursor 为本批查询返回的游标（客户端重连时从这里补发，不会越过尚未推送的变化）"""
+        item = (webhooks, cursor)
+        with self._lock:
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.put_nowait(item)
+                except queue.Full:
+                    self._subscribers.discard(subscriber)
+                    logger.warning("管理页面推送积压过多，已断开该连接（客户端重连后补发）")
+
+
+# 每个 worker 一个实例（gunicorn preload 时轮询线程在 worker 中首次订阅才启动）
+feed = ChangeFeed()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+重复告警紧凑存储和请求体去重存储的维护工具
+
+COMPACT_DUPLICATES 开启后新的重复告警只保存与原始告警的差异（见 payload_delta.py），
+开启前写入的重复告警仍是完整副本，通过 backfill 逐批压缩；PAYLOAD_STORE=blob 后新事件的请求体和请求头集合
+改为引用（见 payload_store.py），已有事件通过 externalize 逐批转换：
+
+    python compact_duplicates.py backfill --dry-run   # 只统计可节省的空间
+    python compact_duplicates.py backfill             # 压缩已有的重复告警
+    python compact_duplicates.py externalize          # 已有事件的请求体 / 请求头改为引用
+    python compact_duplicates.py stats                # 查看紧凑存储的重复告警和 blob 数量
+
+紧凑存储的重复告警依赖原始告警还原，原始告警按 RETENTION_DAYS 被清理前，
+分区维护（partitions.run_maintenance）先调用 materialize_expiring 把仍在保留期内的重复告警还原为完整副本。
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.orm.attributes import flag_modified
+
+from config import Config
+from logger import logger
+from models import COMPACTED_FIELDS, PayloadBlob, WebhookEvent, attach_references, session_scope
+from utils import build_search_text, compact_event, save_references, store_references
+
+
+def stored_size(event: WebhookEvent) -> int:
+    """raw_payload / headers / parsed_data / ai_analysis / delta 列按 JSON 文本估算的字节数（不含数据库的压缩和行开销）"""
+    size = len(event.raw_payload.encode('utf-8')) if event.raw_payload is not None else 0
+    for name in ('headers', 'parsed_data', 'ai_analysis', 'delta'):
+        value = getattr(event, name)
+        if value is not None:
+            size += len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+    return size
+
+
+def _keep_updated_at(event: WebhookEvent) -> None:
+    """
+    只改变存储方式、内容不变：保留 updated_at（不触发 onupdate），增量查询和管理页面推送不会重新下发
+
+    需在修改其他列之前调用（写入 blob 的语句会触发 autoflush）。
+    """
+    flag_modified(event, 'updated_at')
+
+
+def _store(session: Session, event: WebhookEvent) -> None:
+    """PAYLOAD_STORE=blob 时把仍保存在行上的请求体 / 请求头改为引用"""
+    if Config.PAYLOAD_STORE == 'blob':
+        store_references(event)
+        save_references(session, event)
+
+
+def backfill(batch_size: int = 500, dry_run: bool = False, limit: Optional[int] = None) -> dict[str, int]:
+    """
+    按 ID 分批压缩已有的完整副本重复告警（每批一个事务）
+
+    原始告警已不存在的重复告警保持原样。压缩前为缺少检索文本的事件补充 search_text（压缩后无法直接从列生成）。
+
+    Returns:
+        dict: compacted（压缩的事件数）、skipped（原始告警不存在而跳过的事件数）、
+            bytes_before / bytes_after（压缩前后按 JSON 文本估算的字节数）
+    """
+    stats = {'compacted': 0, 'skipped': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_id = 0
+    while limit is None or stats['compacted'] + stats['skipped'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - stats['compacted'] - stats['skipped'])
+        with session_scope() as session:
+            events = session.query(WebhookEvent).options(undefer(WebhookEvent.search_text)).filter(
+                WebhookEvent.id > last_id,
+                WebhookEvent.is_duplicate == 1,
+                WebhookEvent.duplicate_of.isnot(None),
+                WebhookEvent.delta.is_(None)
+            ).order_by(WebhookEvent.id).limit(size).all()
+            if not events:
+                break
+            last_id = events[-1].id
+
+            originals = {
+                event.id: event for event in session.query(WebhookEvent).filter(
+                    WebhookEvent.id.in_({event.duplicate_of for event in events})
+                )
+            }
+            attach_references(session, events + list(originals.values()))
+            for event in events:
+                original = originals.get(event.duplicate_of)
+                if original is None:
+                    stats['skipped'] += 1
+                    continue
+                stats['bytes_before'] += stored_size(event)
+                if event.search_text is None:
+                    event.search_text = build_search_text(event.get_field('parsed_data'), event.get_field('ai_analysis'))
+                _keep_updated_at(event)
+                compact_event(event, original)
+                _store(session, event)
+                stats['bytes_after'] += stored_size(event)
+                stats['compacted'] += 1
+            if dry_run:
+                session.rollback()
+        logger.info(f"重复告警压缩进度: 已处理到 ID={last_id}, 压缩 {stats['compacted']} 条, 跳过 {stats['skipped']} 条")
+    return stats
+
+
+def externalize(batch_size: int = 500, dry_run: bool = False, limit: Optional[int] = None) -> dict[str, int]:
+    """
+    按 ID 分批把已有事件的请求体和请求头集合改为 payload_blobs / header_sets 引用（每批一个事务）
+
+    Returns:
+        dict: converted（转换的事件数）、bytes_before / bytes_after（转换前后按 JSON 文本估算的字节数，
+            after 包含本次新写入的 blob 和请求头集合，相同内容只计一次）
+    """
+    stats = {'converted': 0, 'bytes_before': 0, 'bytes_after': 0}
+    counted = set()
+    last_id = 0
+    while limit is None or stats['converted'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - stats['converted'])
+        with session_scope() as session:
+            events = session.query(WebhookEvent).filter(
+                WebhookEvent.id > last_id,
+                WebhookEvent.delta.is_(None),
+                WebhookEvent.payload_hash.is_(None),
+                WebhookEvent.header_hash.is_(None),
+                or_(WebhookEvent.raw_payload.isnot(None), WebhookEvent.headers.isnot(None))
+            ).order_by(WebhookEvent.id).limit(size).all()
+            if not events:
+                break
+            last_id = events[-1].id
+            for event in events:
+                stats['bytes_before'] += stored_size(event)
+                _keep_updated_at(event)
+                store_references(event)
+                save_references(session, event)
+                stats['bytes_after'] += stored_size(event)
+                for model, values in event._new_references:
+                    if values['hash'] not in counted:
+                        counted.add(values['hash'])
+                        stats['bytes_after'] += len(values['data']) if model is PayloadBlob else len(
+                            json.dumps(values['headers'], ensure_ascii=False).encode('utf-8')
+                        )
+                stats['converted'] += 1
+            if dry_run:
+                session.rollback()
+        logger.info(f"请求体引用转换进度: 已处理到 ID={last_id}, 转换 {stats['converted']} 条")
+    return stats
+
+
+def materialize(session: Session, events: Iterable[WebhookEvent]) -> int:
+    """把紧凑存储的重复告警还原为完整副本（原始告警即将被删除时调用）"""
+    events = [event for event in events if event.is_compact()]
+    attach_references(session, events)
+    for event in events:
+        values = {name: event.get_field(name) for name in COMPACTED_FIELDS}
+        _keep_updated_at(event)
+        for name, value in values.items():
+            setattr(event, name, value)
+        event.delta = None
+        _store(session, event)
+    session.flush()
+    return len(events)
+
+
+def materialize_expiring(bind: Any, cutoff: datetime, batch_size: int = 1000) -> int:
+    """
+    还原原始告警早于 cutoff（即将被保留策略删除）、自身仍在保留期内的紧凑存储重复告警
+
+    重复告警与原始告警的时间差不超过去重时间窗口，只需扫描 [cutoff, cutoff + DUPLICATE_ALERT_TIME_WINDOW) 范围
+    （分区表上只访问对应的分区）。bind 为正在执行维护的连接时在同一事务中完成，先还原再删除。
+
+    Returns:
+        int: 还原的事件数
+    """
+    upper = cutoff + timedelta(hours=Config.DUPLICATE_ALERT_TIME_WINDOW)
+    total = 0
+    with Session(bind=bind) as session:
+        last_id = 0
+        while True:
+            events = session.query(WebhookEvent).filter(
+                WebhookEvent.id > last_id,
+                WebhookEvent.timestamp >= cutoff,
+                WebhookEvent.timestamp < upper,
+                WebhookEvent.delta.isnot(None),
+                WebhookEvent.duplicate_of.in_(
+                    session.query(WebhookEvent.id).filter(WebhookEvent.timestamp < cutoff).scalar_subquery()
+                )
+            ).order_by(WebhookEvent.id).limit(batch_size).all()
+            if not events:
+                break
+            last_id = events[-1].id
+            total += materialize(session, events)
+        session.commit()
+    if total:
+        logger.info(f"原始告警即将过期，已还原 {total} 条紧凑存储的重复告警")
+    return total
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='重复告警紧凑存储和请求体去重存储维护')
+    parser.add_argument('command', choices=('backfill', 'externalize', 'stats'))
+    parser.add_argument('--batch-size', type=int, default=500, help='每批处理的事件数（每批一个事务）')
+    parser.add_argument('--limit', type=int, default=None, help='最多处理的事件数')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不写入')
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        with session_scope() as session:
+            duplicates = session.query(WebhookEvent).filter(WebhookEvent.is_duplicate == 1).count()
+            compact = session.query(WebhookEvent).filter(WebhookEvent.delta.isnot(None)).count()
+            referenced = session.query(WebhookEvent).filter(WebhookEvent.payload_hash.isnot(None)).count()
+            blobs, raw_bytes, stored_bytes = session.query(
+                func.count(PayloadBlob.hash), func.sum(PayloadBlob.size), func.sum(func.length(PayloadBlob.data))
+            ).one()
+        print(f"重复告警 {duplicates} 条，其中紧凑存储 {compact} 条")
+        print(f"引用 payload_blobs 的事件 {referenced} 条，blob {blobs} 个，"
+              f"压缩前 {raw_bytes or 0} 字节，压缩后 {stored_bytes or 0} 字节")
+        return 0
+
+    if args.command == 'externalize':
+        stats = externalize(batch_size=args.batch_size, dry_run=args.dry_run, limit=args.limit)
+        done = f"转换 {stats['converted']} 条事件"
+    else:
+        stats = backfill(batch_size=args.batch_size, dry_run=args.dry_run, limit=args.limit)
+        done = f"压缩 {stats['compacted']} 条重复告警，跳过 {stats['skipped']} 条（原始告警不存在）"
+    saved = stats['bytes_before'] - stats['bytes_after']
+    ratio = saved / stats['bytes_before'] * 100 if stats['bytes_before'] else 0.0
+    prefix = '[dry-run] ' if args.dry_run else ''
+    print(f"{prefix}{done}")
+    print(f"{prefix}负载列 {stats['bytes_before']} → {stats['bytes_after']} 字节，节省 {saved} 字节（{ratio:.1f}%）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+协作式并发（gevent）支持
+
+服务大部分时间在等待 OpenAI、飞书和数据库，gunicorn 使用 gevent worker
+（GUNICORN_WORKER_CLASS=gevent）时单个 worker 可以同时处理数百个请求：
+- gunicorn 在 worker 启动时 monkey patch 标准库（socket / ssl / time.sleep / threading），
+  requests、httpx（OpenAI SDK）和 SQLAlchemy 连接池的等待都会自动让出执行权
+- psycopg2 是 C 扩展，不受 monkey patch 影响，需要注册等待回调（见 make_psycopg2_green）
+
+未安装 gevent 或未 patch 时所有函数退化为普通的同步实现。gevent 只有在 worker 启动时
+monkey patch 之后才会被使用，这里不在导入时加载它（sync worker 和脚本不承担导入开销）。
+"""
+import sys
+import time
+
+from logger import logger
+
+_psycopg2_green = False
+
+
+def is_gevent_active() -> bool:
+    """当前进程是否运行在 gevent monkey patch 之下"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def cooperative_sleep(seconds: float) -> None:
+    """等待指定时间：gevent 模式下只挂起当前 greenlet，不阻塞 worker"""
+    if is_gevent_active():
+        import gevent
+        gevent.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def make_psycopg2_green() -> bool:
+    """
+    为 psycopg2 注册 gevent 等待回调，使查询等待期间让出执行权
+
+    Returns:
+        bool: 注册成功返回 True（未安装 psycopg2 或未启用 gevent 时返回 False）
+    """
+    global _psycopg2_green
+    if _psycopg2_green:
+        return True
+    if not is_gevent_active():
+        return False
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+
+    from gevent.socket import wait_read, wait_write
+
+    def _gevent_wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"psycopg2 poll 返回未知状态: {state}")
+
+    extensions.set_wait_callback(_gevent_wait_callback)
+    _psycopg2_green = True
+    logger.info("已为 psycopg2 注册 gevent 等待回调")
+    return True
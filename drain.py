@@ -0,0 +1,64 @@
+"""
+优雅停机（drain）
+
+gunicorn 回收 worker 或容器停止时，worker 收到 SIGTERM 后进入 drain 状态：
+- 新的 webhook 返回 503 + Retry-After，/ready 返回 503（负载均衡摘除该实例）
+- 处理中的请求需要在 DRAIN_TIMEOUT 内完成：AI 调用和转发的超时截断到 drain 截止时间，
+  剩余时间不足以完成 AI 调用时直接降级为规则分析，结果照常入库，不丢告警
+- worker 退出时按 worker 标识显式释放处理锁（gunicorn.conf.py 的 worker_exit / child_exit），
+  其他 worker 不必等到锁过期
+
+未进入 drain 状态时所有函数不改变原有行为。
+"""
+import threading
+import time
+from typing import Optional
+
+from config import Config
+from logger import logger
+
+# drain 期间剩余时间少于该值时不再发起 AI 调用
+MIN_AI_SECONDS = 2.0
+
+# 截断后的超时下限（秒），避免传入 0 或负数
+_MIN_TIMEOUT = 0.5
+
+_draining = threading.Event()
+_deadline: Optional[float] = None
+
+
+def begin_drain(timeout: Optional[float] = None) -> None:
+    """进入 drain 状态，处理中的请求需要在 timeout（默认 DRAIN_TIMEOUT）秒内完成"""
+    global _deadline
+    if _draining.is_set():
+        return
+    timeout = Config.DRAIN_TIMEOUT if timeout is None else timeout
+    _deadline = time.monotonic() + timeout
+    _draining.set()
+    logger.warning(f"worker 开始停机，停止接收新的 webhook，处理中的请求需在 {timeout}s 内完成")
+
+
+def is_draining() -> bool:
+    return _draining.is_set()
+
+
+def remaining() -> Optional[float]:
+    """距 drain 截止时间的剩余秒数（未进入 drain 状态时返回 None）"""
+    if _deadline is None:
+        return None
+    return max(0.0, _deadline - time.monotonic())
+
+
+def bounded_timeout(timeout: float) -> float:
+    """drain 期间把出站调用的超时截断到截止时间"""
+    left = remaining()
+    if left is None:
+        return timeout
+    return max(_MIN_TIMEOUT, min(timeout, left))
+
+
+def reset() -> None:
+    """退出 drain 状态（测试用）"""
+    global _deadline
+    _deadline = None
+    _draining.clear()
@@ -0,0 +1,126 @@
+"""
+gunicorn 配置
+
+    gunicorn -c gunicorn.conf.py app:app
+
+    # 协作式并发：单个 worker 同时处理最多 GUNICORN_WORKER_CONNECTIONS 个请求
+    GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py app:app
+
+preload 时应用在 master 中导入一次（只读状态由 worker 共享），fork 后由 post_fork 重置
+连接池等进程相关状态，worker 在 post_worker_init 中预热完成后才开始接收请求。
+
+worker 收到 SIGTERM 后进入 drain 状态（见 drain.py），处理中的请求在 DRAIN_TIMEOUT 内完成，
+退出时按 worker 标识释放处理锁；被强制结束的 worker 由 master 在 child_exit / on_exit 中清理。
+"""
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# 收到 SIGTERM 后等待处理中请求的最长时间，应大于 DRAIN_TIMEOUT 和 OPENAI_TIMEOUT
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '45'))
+
+# sync（默认）或 gevent；gevent 下 worker 启动时自动 monkey patch，psycopg2 等待回调见 concurrency.py
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# 在 master 中预先导入应用；gevent 需要在导入网络相关模块之前 monkey patch，默认不 preload
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true' if worker_class == 'sync' else 'false').lower() == 'true'
+
+
+def on_starting(server):
+    """master 启动时清空 Prometheus 多进程指标目录（避免残留上次运行的数据）"""
+    multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    """preload 时在 master 中构建共享的只读状态"""
+    if preload_app:
+        from app import preload_shared_state
+        preload_shared_state()
+
+
+def post_fork(server, worker):
+    """
+    gevent worker 在 post_fork 之后才 monkey patch
+
+    patch 会移除 select.epoll，而 trio（httpcore 会尝试导入，进而被 OpenAI SDK 间接导入）
+    在导入时就依赖 select.epoll，因此需要在 patch 之前预先导入。
+    """
+    if worker_class == 'gevent':
+        try:
+            import trio  # noqa: F401
+        except ImportError:
+            pass
+
+    # preload 时 worker 继承了 master 的连接池和日志线程状态，需要在子进程中重置
+    if preload_app:
+        from app import reinit_after_fork
+        reinit_after_fork()
+
+
+def post_worker_init(worker):
+    """worker 开始接收请求前预热数据库连接池和出站客户端，并接管 SIGTERM 进入 drain 状态"""
+    from app import warmup_worker
+    warmup_worker()
+
+    import drain
+
+    def handle_term(sig, frame):
+        drain.begin_drain()
+        worker.handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """worker 退出时释放其持有的处理锁"""
+    from app import release_worker_locks
+    release_worker_locks()
+
+
+def _release_worker_locks(server, pid: int) -> None:
+    """
+    在 master 中释放指定 worker 的处理锁
+
+    未 preload 时 master 没有导入应用，为避免影响之后 fork 的 gevent worker，在子进程中清理。
+    """
+    worker_id = f"{socket.gethostname()}-{pid}"  # 与 app._WORKER_ID 一致
+    try:
+        if preload_app:
+            from models import release_locks_by_worker
+            release_locks_by_worker(worker_id)
+        else:
+            subprocess.run(
+                [sys.executable, '-c',
+                 'import sys; from models import release_locks_by_worker; release_locks_by_worker(sys.argv[1])',
+                 worker_id],
+                timeout=30, check=False
+            )
+    except Exception as e:
+        server.log.error(f"清理 worker {worker_id} 的处理锁失败: {e}")
+
+
+def child_exit(server, worker):
+    """
+    worker 退出时清理其 live gauge 数据和处理锁
+
+    worker 被强制结束（超时、OOM）时不会执行 worker_exit，由 master 清理。
+    """
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
+    _release_worker_locks(server, worker.pid)
+
+
+def on_exit(server):
+    """master 停止时超过 graceful_timeout 的 worker 被 SIGKILL，master 退出前不会再回收它们，在这里清理处理锁"""
+    for pid in list(server.WORKERS):
+        _release_worker_locks(server, pid)
@@ -0,0 +1,241 @@
+"""
+LLM 响应缓存（内容寻址，本地 SQLite 持久化）
+
+以请求内容（模型、提示词、采样参数）的哈希作为键缓存 AI 原始响应文本，
+用于离线回放和压测，避免真实调用模型服务。
+
+支持三种模式（LLM_CACHE_MODE）：
+- passthrough: 直接调用模型服务，不读写缓存（默认）
+- record: 调用模型服务并记录响应
+- replay: 只从缓存读取，未命中时抛出 LLMCacheMiss（由上层降级为规则分析）
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from config import Config
+from logger import logger
+
+CACHE_MODES = ('passthrough', 'record', 'replay')
+
+
+class LLMCacheMiss(RuntimeError):
+    """回放模式下缓存未命中"""
+
+
+def make_cache_key(request: dict[str, Any]) -> str:
+    """根据请求内容生成缓存键（SHA256）"""
+    key_string = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key_string.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    基于 SQLite 的 LLM 响应缓存
+
+    按最近访问时间做 LRU 淘汰，同时限制条目数量和总字节数。
+    每个线程使用独立连接，fork 后自动重建连接。
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的连接（fork 后重新打开）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，命中时刷新访问时间"""
+        conn = self._connect()
+        row = conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?",
+            (time.time(), key)
+        )
+        return row[0]
+
+    def put(self, key: str, response: str, model: Optional[str] = None) -> None:
+        """写入缓存并按需淘汰"""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        conn = self._connect()
+        conn.execute(
+            """
+            INSERT INTO llm_cache (key, model, response, size, created_at, last_access, hits)
+            VALUES (?, ?, ?, ?, ?, ?, 0)
+            ON CONFLICT(key) DO UPDATE SET
+                response = excluded.response, size = excluded.size, last_access = excluded.last_access
+            """,
+            (key, model, response, size, now, now)
+        )
+        self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """按 LRU 淘汰超出条目数或字节数限制的缓存"""
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return 0
+
+        evicted = 0
+        rows = conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count -= 1
+            total_bytes -= size
+            evicted += 1
+
+        if evicted:
+            logger.debug("LLM 缓存淘汰 %d 条记录", evicted)
+        return evicted
+
+    def stats(self) -> dict[str, Any]:
+        """缓存统计信息"""
+        count, total_bytes, hits = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM llm_cache"
+        ).fetchone()
+        return {
+            'path': self.path,
+            'entries': count,
+            'bytes': total_bytes,
+            'hits': hits,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes
+        }
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._connect().execute("DELETE FROM llm_cache")
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """获取全局缓存实例（单例）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache(
+                    Config.LLM_CACHE_PATH,
+                    max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+                    max_bytes=Config.LLM_CACHE_MAX_MB * 1024 * 1024
+                )
+    return _cache
+
+
+def cached_completion(request: dict[str, Any], fetch: Callable[[], str], mode: Optional[str] = None) -> str:
+    """
+    按缓存模式获取 AI 响应文本
+
+    Args:
+        request: 参与缓存键计算的请求内容（model、messages、采样参数）
+        fetch: 实际调用模型服务并返回响应文本的函数
+        mode: 缓存模式，默认使用 Config.LLM_CACHE_MODE
+
+    Returns:
+        str: AI 原始响应文本
+    """
+    mode = (mode or Config.LLM_CACHE_MODE).lower()
+    if mode not in CACHE_MODES or mode == 'passthrough':
+        return fetch()
+
+    cache = get_llm_cache()
+    key = make_cache_key(request)
+
+    if mode == 'replay':
+        response = cache.get(key)
+        if response is None:
+            raise LLMCacheMiss(f"LLM 缓存未命中: key={key[:16]}...")
+        logger.debug("LLM 缓存命中: key=%s...", key[:16])
+        return response
+
+    # record 模式：始终调用真实服务并覆盖记录
+    response = fetch()
+    try:
+        cache.put(key, response, model=request.get('model'))
+    except sqlite3.Error as e:
+        logger.warning(f"写入 LLM 缓存失败: {e}")
+    return response
+
+
+async def cached_completion_async(
+    request: dict[str, Any],
+    fetch: Callable[[], Awaitable[str]],
+    mode: Optional[str] = None
+) -> str:
+    """cached_completion 的异步版本（缓存读写在线程池中执行，不阻塞事件循环）"""
+    mode = (mode or Config.LLM_CACHE_MODE).lower()
+    if mode not in CACHE_MODES or mode == 'passthrough':
+        return await fetch()
+
+    cache = get_llm_cache()
+    key = make_cache_key(request)
+
+    if mode == 'replay':
+        response = await asyncio.to_thread(cache.get, key)
+        if response is None:
+            raise LLMCacheMiss(f"LLM 缓存未命中: key={key[:16]}...")
+        logger.debug("LLM 缓存命中: key=%s...", key[:16])
+        return response
+
+    response = await fetch()
+    try:
+        await asyncio.to_thread(cache.put, key, response, request.get('model'))
+    except sqlite3.Error as e:
+        logger.warning(f"写入 LLM 缓存失败: {e}")
+    return response
+
+
+if __name__ == '__main__':
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command == 'stats':
+        print(json.dumps(get_llm_cache().stats(), indent=2, ensure_ascii=False))
+    elif command == 'clear':
+        get_llm_cache().clear()
+        print("LLM 缓存已清空")
+    else:
+        print("用法: python llm_cache.py [stats|clear]")
+        sys.exit(1)
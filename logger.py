@@ -1,6 +1,10 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from config import Config
 
 # 尝试导入结构化日志库
@@ -10,38 +14,100 @@ try:
 except ImportError:
     HAS_JSON_LOGGER = False
 
+# 可以推迟到后台线程格式化的参数类型（不可变，调用方之后修改不会影响日志内容）
+_IMMUTABLE_ARG_TYPES = (str, int, float, bool, type(None), bytes)
 
-def setup_logger():
-    """设置日志记录器（支持日志轮转和结构化日志）"""
-    
-    # 创建日志目录
-    log_dir = os.path.dirname(Config.LOG_FILE)
-    if log_dir and not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    # 创建 logger
-    logger = logging.getLogger('webhook_service')
-    logger.setLevel(getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO))
-    
-    # 避免重复添加 handler
-    if logger.handlers:
-        return logger
-    
+# 异步模式下的后台监听器
+_listener = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    高频日志采样
+
+    只对 extra={'sampled': True} 且级别不高于 INFO 的日志生效，按 LOG_SAMPLE_RATE 随机保留；
+    WARNING 及以上级别始终保留。
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sampled', False) or record.levelno > logging.INFO:
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    将日志记录放入队列，由 QueueListener 在后台线程完成格式化和写入
+
+    标准 QueueHandler.prepare 会在调用线程上格式化消息；这里只在参数可能被调用方修改时
+    （字典或非不可变类型）才提前合并消息，异常堆栈也在调用线程上展开（栈帧之后会失效）。
+    队列满时丢弃日志并计数，不阻塞请求线程。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and (
+            isinstance(record.args, dict)
+            or not all(isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in record.args)
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+
+        # 队列恢复后补记一条丢弃统计
+        if self.dropped:
+            with self._dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                notice = logging.LogRecord(
+                    record.name, logging.WARNING, __file__, 0,
+                    '日志队列已满，丢弃了 %d 条日志', (dropped,), None
+                )
+                try:
+                    self.queue.put_nowait(notice)
+                except queue.Full:
+                    with self._dropped_lock:
+                        self.dropped += dropped
+
+
+def _build_handlers() -> list[logging.Handler]:
+    """创建文件和控制台处理器"""
     # 标准日志格式（控制台）
     console_formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    
+
     # 文件处理器（支持轮转，最大 10MB，保留 5 个备份）
     file_handler = RotatingFileHandler(
-        Config.LOG_FILE, 
+        Config.LOG_FILE,
         maxBytes=10 * 1024 * 1024,  # 10MB
         backupCount=5,
-        encoding='utf-8'
+        encoding='utf-8',
+        delay=True  # 首次写入时才打开文件（只导入模块的脚本不创建日志文件）
     )
     file_handler.setLevel(logging.INFO)
-    
+
     # 文件使用结构化 JSON 日志（如果可用）
     if HAS_JSON_LOGGER:
         json_formatter = jsonlogger.JsonFormatter(
@@ -51,17 +117,79 @@ def setup_logger():
         file_handler.setFormatter(json_formatter)
     else:
         file_handler.setFormatter(console_formatter)
-    
+
     # 控制台处理器（保持可读格式）
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.DEBUG if Config.DEBUG else logging.INFO)
     console_handler.setFormatter(console_formatter)
-    
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+
+    return [file_handler, console_handler]
+
+
+def setup_logger():
+    """
+    设置日志记录器（支持日志轮转、结构化日志和异步写入）
+
+    LOG_ASYNC=true 时请求线程只把日志记录放入有界队列，
+    格式化、文件写入和轮转检查都由后台 QueueListener 线程完成。
+    """
+    global _listener
+
+    # 创建日志目录
+    log_dir = os.path.dirname(Config.LOG_FILE)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    # 创建 logger
+    logger = logging.getLogger('webhook_service')
+    logger.setLevel(getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO))
+
+    # 避免重复添加 handler
+    if logger.handlers:
+        return logger
+
+    logger.addFilter(SamplingFilter(Config.LOG_SAMPLE_RATE))
+    handlers = _build_handlers()
+
+    if Config.LOG_ASYNC:
+        queue_handler = DeferredQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+        _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        logger.addHandler(queue_handler)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
     return logger
 
 
+def stop_logging() -> None:
+    """停止后台日志线程并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def restart_logging() -> None:
+    """
+    fork 之后在子进程中重启后台日志线程
+
+    线程不会随 fork 复制，继承的队列中可能还有父进程尚未写出的日志（由父进程负责写出），
+    因此子进程换用新的队列并启动自己的 QueueListener。
+    """
+    global _listener
+    if _listener is None:
+        return
+    for handler in logging.getLogger('webhook_service').handlers:
+        if isinstance(handler, DeferredQueueHandler):
+            handler.queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+            handler._dropped_lock = threading.Lock()
+            _listener = QueueListener(handler.queue, *_listener.handlers, respect_handler_level=True)
+            _listener.start()
+            return
+
+
 # 创建全局 logger 实例
 logger = setup_logger()
@@ -0,0 +1,144 @@
+"""
+Prometheus 指标
+
+- 各处理阶段耗时直方图（签名校验、哈希、锁等待、去重查询、AI 分析、数据库保存、转发）
+- 按来源统计的重复告警、AI 降级和转发结果计数
+- 数据库连接池、处理中请求和锁等待队列的 Gauge
+
+阶段耗时同时记录到当前请求的追踪数据中（见 tracing.py）。
+
+gunicorn 多 worker 部署时需设置 PROMETHEUS_MULTIPROC_DIR（见 gunicorn.conf.py），
+各 worker 写入共享目录，/metrics 由任一 worker 汇总所有进程的数据。
+未安装 prometheus_client 时所有指标退化为空操作。
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Generator
+
+from tracing import record_span
+
+# 多进程模式：目录需在导入 prometheus_client 之前存在
+_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if _MULTIPROC_DIR:
+    os.makedirs(_MULTIPROC_DIR, exist_ok=True)
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    )
+    from prometheus_client import multiprocess
+    HAS_PROMETHEUS = True
+except ImportError:
+    HAS_PROMETHEUS = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _NoopMetric:
+    """prometheus_client 不可用时的空实现"""
+
+    def labels(self, *args, **kwargs) -> '_NoopMetric':
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+
+# 阶段耗时分桶：覆盖毫秒级本地操作到数十秒的 LLM 调用
+_STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+if HAS_PROMETHEUS:
+    STAGE_LATENCY = Histogram(
+        'webhook_stage_duration_seconds', 'Webhook 处理各阶段耗时', ['stage'], buckets=_STAGE_BUCKETS
+    )
+    REQUEST_LATENCY = Histogram(
+        'webhook_request_duration_seconds', 'Webhook 请求总耗时', ['source'], buckets=_STAGE_BUCKETS
+    )
+    REQUESTS = Counter('webhook_requests_total', 'Webhook 请求数', ['source', 'status'])
+    DUPLICATES = Counter('webhook_duplicates_total', '重复告警数', ['source'])
+    AI_FALLBACKS = Counter('webhook_ai_fallbacks_total', 'AI 分析降级次数', ['source', 'reason'])
+    FORWARDS = Counter('webhook_forwards_total', '转发结果', ['source', 'status'])
+    INFLIGHT = Gauge('webhook_inflight_requests', '处理中的 webhook 请求数', multiprocess_mode='livesum')
+    LOCK_WAITERS = Gauge('webhook_lock_waiters', '等待其他 worker 处理锁的请求数', multiprocess_mode='livesum')
+    DB_POOL_SIZE = Gauge('webhook_db_pool_size', '数据库连接池容量（含溢出）', multiprocess_mode='livesum')
+    DB_POOL_CHECKED_OUT = Gauge('webhook_db_pool_checked_out', '已借出的数据库连接数', multiprocess_mode='livesum')
+else:
+    STAGE_LATENCY = REQUEST_LATENCY = REQUESTS = DUPLICATES = AI_FALLBACKS = FORWARDS = _NoopMetric()
+    INFLIGHT = LOCK_WAITERS = DB_POOL_SIZE = DB_POOL_CHECKED_OUT = _NoopMetric()
+
+
+# 来源标签基数限制（来源来自 URL/Header，避免无限增长）
+_MAX_SOURCES = 100
+_known_sources: set[str] = set()
+_sources_lock = threading.Lock()
+
+
+def source_label(source: str) -> str:
+    """返回用于指标标签的来源名称，超出上限的新来源归为 other"""
+    source = (source or 'unknown')[:64]
+    if source in _known_sources:
+        return source
+    with _sources_lock:
+        if len(_known_sources) < _MAX_SOURCES:
+            _known_sources.add(source)
+            return source
+    return 'other'
+
+
+@contextmanager
+def observe_stage(stage: str) -> Generator[None, None, None]:
+    """记录处理阶段耗时（同时写入直方图和当前请求的追踪 span）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage=stage).observe(duration)
+        record_span(stage, start, duration)
+
+
+def instrument_engine(engine) -> None:
+    """监听连接池借出/归还事件，维护连接池 Gauge"""
+    if not HAS_PROMETHEUS:
+        return
+    from sqlalchemy import event
+
+    pool = engine.pool
+    size = getattr(pool, 'size', None)
+    if callable(size):
+        DB_POOL_SIZE.set(size() + max(getattr(pool, '_max_overflow', 0), 0))
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def _on_checkin(dbapi_conn, conn_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """生成 /metrics 响应内容"""
+    if not HAS_PROMETHEUS:
+        return b'# prometheus_client not installed\n', CONTENT_TYPE_LATEST
+    if _MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """worker 退出时清理其 live gauge 数据（gunicorn child_exit 钩子调用）"""
+    if HAS_PROMETHEUS and _MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
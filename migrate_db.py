@@ -3,10 +3,49 @@
 数据库迁移脚本：添加告警去重相关字段
 """
 from sqlalchemy import text
-from models import get_engine
+from models import HeaderSet, PayloadBlob, ensure_json_indexes, get_engine
+from partitions import setup_partitioning
+from search import backfill_search_text, ensure_search_index
 from logger import logger
 
 
+# 使用 JSONB 存储的列（与 models.JSONType 对应）
+_JSONB_COLUMNS = ('headers', 'parsed_data', 'ai_analysis')
+
+
+def migrate_json_to_jsonb(engine) -> None:
+    """
+    把 webhook_events 的 json 列转换为 jsonb（仅 PostgreSQL）
+
+    ALTER COLUMN TYPE 会重写整张表并持有排他锁，大表应在维护窗口执行。
+    jsonb 不保留对象键的原始顺序和重复键，原始请求体仍完整保存在 raw_payload 中。
+    """
+    with engine.connect() as conn:
+        for column in _JSONB_COLUMNS:
+            data_type = conn.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'webhook_events' AND column_name = :column"
+            ), {'column': column}).scalar()
+            if data_type != 'json':
+                logger.info(f"跳过迁移({column} 类型为 {data_type}): {column} 转换为 jsonb")
+                continue
+            try:
+                logger.info(f"执行迁移: {column} 转换为 jsonb")
+                conn.execute(text(
+                    f"ALTER TABLE webhook_events ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb"
+                ))
+                conn.commit()
+                logger.info(f"迁移完成: {column} 转换为 jsonb")
+            except Exception as e:
+                logger.error(f"迁移失败: {column} 转换为 jsonb, 错误: {str(e)}")
+                conn.rollback()
+                raise
+    
+    logger.info("创建告警标签 GIN 索引")
+    if ensure_json_indexes(engine):
+        logger.info("索引创建完成")
+
+
 def migrate_database():
     """执行数据库迁移"""
     engine = get_engine()
@@ -35,6 +74,29 @@ def migrate_database():
             'name': '添加 duplicate_count 字段',
             'check': "SELECT COUNT(*) FROM information_schema.columns WHERE table_name='webhook_events' AND column_name='duplicate_count'",
             'sql': "ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS duplicate_count INTEGER DEFAULT 1"
+        },
+        # 添加 search_text 字段（全文检索）
+        {
+            'name': '添加 search_text 字段',
+            'check': "SELECT COUNT(*) FROM information_schema.columns WHERE table_name='webhook_events' AND column_name='search_text'",
+            'sql': "ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS search_text TEXT"
+        },
+        # 添加 delta 字段（重复告警紧凑存储，已有重复告警通过 compact_duplicates.py backfill 压缩）
+        {
+            'name': '添加 delta 字段',
+            'check': "SELECT COUNT(*) FROM information_schema.columns WHERE table_name='webhook_events' AND column_name='delta'",
+            'sql': "ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS delta JSONB"
+        },
+        # 添加 payload_hash / header_hash 字段（PAYLOAD_STORE=blob，已有事件通过 compact_duplicates.py externalize 转换）
+        {
+            'name': '添加 payload_hash 字段',
+            'check': "SELECT COUNT(*) FROM information_schema.columns WHERE table_name='webhook_events' AND column_name='payload_hash'",
+            'sql': "ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS payload_hash VARCHAR(64)"
+        },
+        {
+            'name': '添加 header_hash 字段',
+            'check': "SELECT COUNT(*) FROM information_schema.columns WHERE table_name='webhook_events' AND column_name='header_hash'",
+            'sql': "ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS header_hash VARCHAR(64)"
         }
     ]
     
@@ -67,6 +129,33 @@ def migrate_database():
         except Exception as e:
             logger.warning(f"创建索引失败: {str(e)}")
         
+        # 为 updated_at 字段创建索引（增量查询和管理页面推送按更新时间查询）
+        try:
+            logger.info("创建 updated_at 索引")
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_webhook_events_updated_at ON webhook_events(updated_at)"))
+            conn.commit()
+            logger.info("索引创建完成")
+        except Exception as e:
+            logger.warning(f"创建索引失败: {str(e)}")
+        
+        # 列表按来源过滤时按时间倒序翻页使用的复合索引
+        try:
+            logger.info("创建 source + timestamp 复合索引")
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_source_timestamp ON webhook_events(source, timestamp)"))
+            conn.commit()
+            logger.info("索引创建完成")
+        except Exception as e:
+            logger.warning(f"创建索引失败: {str(e)}")
+        
+        # payload_hash 索引（清理不再被引用的 payload_blobs）
+        try:
+            logger.info("创建 payload_hash 索引")
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_payload_hash ON webhook_events(payload_hash)"))
+            conn.commit()
+            logger.info("索引创建完成")
+        except Exception as e:
+            logger.warning(f"创建索引失败: {str(e)}")
+        
         # 创建分布式锁表（用于多 worker 并发控制）
         try:
             logger.info("创建 processing_locks 表")
@@ -82,6 +171,28 @@ def migrate_database():
         except Exception as e:
             logger.warning(f"创建 processing_locks 表失败: {str(e)}")
     
+    # 请求体 blob 表和请求头集合表（PAYLOAD_STORE=blob）
+    for table in (PayloadBlob.__table__, HeaderSet.__table__):
+        table.create(engine, checkfirst=True)
+    logger.info("payload_blobs / header_sets 表已就绪")
+    
+    # PostgreSQL：json 列转换为 jsonb 并创建告警标签 GIN 索引
+    if engine.dialect.name == 'postgresql':
+        migrate_json_to_jsonb(engine)
+    
+    # PARTITION_INTERVAL 已设置时转换为按接收时间分区的分区表（复制期间锁表，见 partitions.py）
+    if setup_partitioning(engine, convert_existing=True):
+        logger.info("webhook_events 分区表已就绪")
+    
+    # 全文检索索引，并为已有事件生成检索文本（索引随回填增量更新）
+    try:
+        logger.info("创建全文检索索引")
+        backend = ensure_search_index(engine)
+        logger.info(f"全文检索索引创建完成: {backend or '当前数据库不支持'}")
+        logger.info(f"回填检索文本完成，共 {backfill_search_text()} 条")
+    except Exception as e:
+        logger.warning(f"创建全文检索索引失败: {str(e)}")
+    
     logger.info("数据库迁移全部完成！")
 
 
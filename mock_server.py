@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+本地模拟服务（压测用）
+
+同时模拟 OpenAI chat-completions 接口和飞书机器人 / 通用转发目标，
+支持可配置的延迟分布、错误率、畸形 JSON 比例和限流响应。
+
+启动后将被测服务指向本地：
+    OPENAI_API_URL=http://127.0.0.1:9100/v1
+    FORWARD_URL=http://127.0.0.1:9100/open-apis/bot/v2/hook/mock
+
+延迟分布格式（--llm-latency / --forward-latency）：
+    fixed:1.5              固定 1.5 秒
+    uniform:0.5,3          0.5~3 秒均匀分布
+    normal:2,0.5           均值 2 秒、标准差 0.5 秒（截断到 >=0）
+    lognormal:2,0.6        中位数 2 秒、对数标准差 0.6（长尾）
+    exponential:1.2        均值 1.2 秒的指数分布
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from flask import Flask, request, jsonify, Response
+
+app = Flask(__name__)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """解析延迟分布描述，返回采样函数（秒）"""
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',') if v.strip()] if params else []
+    kind = kind.strip().lower()
+
+    if kind == 'fixed':
+        return lambda: values[0] if values else 0.0
+    if kind == 'uniform':
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == 'normal':
+        mean, stddev = values
+        return lambda: max(0.0, random.gauss(mean, stddev))
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    if kind == 'exponential':
+        mean = values[0]
+        return lambda: random.expovariate(1.0 / mean)
+    raise ValueError(f"不支持的延迟分布: {spec}")
+
+
+class MockSettings:
+    """模拟服务行为配置"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.llm_latency_spec = args.llm_latency
+        self.forward_latency_spec = args.forward_latency
+        self.llm_latency = parse_latency(args.llm_latency)
+        self.forward_latency = parse_latency(args.forward_latency)
+        self.llm_error_rate = args.llm_error_rate
+        self.llm_malformed_rate = args.llm_malformed_rate
+        self.llm_rate_limit_rate = args.llm_rate_limit_rate
+        self.forward_error_rate = args.forward_error_rate
+        self.forward_rate_limit_rate = args.forward_rate_limit_rate
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'llm_latency': self.llm_latency_spec,
+            'forward_latency': self.forward_latency_spec,
+            'llm_error_rate': self.llm_error_rate,
+            'llm_malformed_rate': self.llm_malformed_rate,
+            'llm_rate_limit_rate': self.llm_rate_limit_rate,
+            'forward_error_rate': self.forward_error_rate,
+            'forward_rate_limit_rate': self.forward_rate_limit_rate
+        }
+
+
+class MockStats:
+    """请求计数（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = {}
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+
+settings: MockSettings  # 由 configure() 初始化
+stats = MockStats()
+
+
+def _mock_analysis(prompt: str) -> dict[str, Any]:
+    """根据提示词内容生成确定性的分析结果"""
+    lowered = prompt.lower()
+    if any(k in lowered for k in ('critical', 'error', 'p0', '严重', 'firing')):
+        importance = 'high'
+    elif any(k in lowered for k in ('warning', 'warn', '警告')):
+        importance = 'medium'
+    else:
+        importance = 'low'
+
+    digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+    return {
+        'source': 'mock',
+        'event_type': 'mock_alert',
+        'importance': importance,
+        'summary': f'模拟分析结果 {digest}',
+        'actions': ['检查相关服务状态', '查看监控面板'],
+        'risks': ['可能影响服务可用性'],
+        'impact_scope': '模拟影响范围',
+        'monitoring_suggestions': ['关注后续告警']
+    }
+
+
+def _malformed(analysis: dict[str, Any]) -> str:
+    """生成常见的畸形 JSON 响应（尾随逗号、注释、夹杂说明文字）"""
+    body = json.dumps(analysis, ensure_ascii=False, indent=2)
+    variant = random.choice(('trailing_comma', 'comment', 'prose', 'truncated'))
+    if variant == 'trailing_comma':
+        return body[:-2] + ',\n}'
+    if variant == 'comment':
+        return body.replace('\n', ' // 注释\n', 1)
+    if variant == 'prose':
+        return f"以下是分析结果：\n```json\n{body}\n```\n希望对你有帮助。"
+    return body[:len(body) // 2]
+
+
+def _rate_limited(message: str) -> Response:
+    response = jsonify({'error': {'message': message, 'type': 'rate_limit_error', 'code': 'rate_limit_exceeded'}})
+    response.status_code = 429
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+@app.route('/chat/completions', methods=['POST'])
+def chat_completions():
+    """模拟 OpenAI chat-completions 接口"""
+    stats.incr('llm_requests')
+    body = request.get_json(silent=True) or {}
+    time.sleep(settings.llm_latency())
+
+    roll = random.random()
+    if roll < settings.llm_rate_limit_rate:
+        stats.incr('llm_rate_limited')
+        return _rate_limited('Rate limit reached (mock)')
+    roll -= settings.llm_rate_limit_rate
+    if roll < settings.llm_error_rate:
+        stats.incr('llm_errors')
+        return jsonify({'error': {'message': 'Internal error (mock)', 'type': 'server_error'}}), 500
+
+    messages = body.get('messages', [])
+    prompt = messages[-1].get('content', '') if messages else ''
+    analysis = _mock_analysis(prompt)
+
+    if random.random() < settings.llm_malformed_rate:
+        stats.incr('llm_malformed')
+        content = _malformed(analysis)
+    else:
+        content = json.dumps(analysis, ensure_ascii=False)
+
+    stats.incr('llm_success')
+    return jsonify({
+        'id': f'chatcmpl-{uuid.uuid4().hex[:24]}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'mock-model'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop'
+        }],
+        'usage': {
+            'prompt_tokens': len(prompt) // 4,
+            'completion_tokens': len(content) // 4,
+            'total_tokens': (len(prompt) + len(content)) // 4
+        }
+    })
+
+
+def _forward_outcome() -> Optional[Response]:
+    """按配置返回转发目标的错误/限流响应，正常时返回 None"""
+    roll = random.random()
+    if roll < settings.forward_rate_limit_rate:
+        stats.incr('forward_rate_limited')
+        return _rate_limited('Too many requests (mock)')
+    roll -= settings.forward_rate_limit_rate
+    if roll < settings.forward_error_rate:
+        stats.incr('forward_errors')
+        response = jsonify({'code': 500, 'msg': 'internal error (mock)'})
+        response.status_code = 500
+        return response
+    return None
+
+
+@app.route('/open-apis/bot/v2/hook/<key>', methods=['POST'])
+def feishu_bot(key: str):
+    """模拟飞书机器人 webhook"""
+    stats.incr('feishu_requests')
+    body = request.get_json(silent=True) or {}
+    time.sleep(settings.forward_latency())
+
+    failure = _forward_outcome()
+    if failure is not None:
+        return failure
+
+    if body.get('msg_type') not in ('text', 'post', 'interactive', 'image', 'share_chat'):
+        stats.incr('feishu_bad_request')
+        return jsonify({'code': 19002, 'msg': 'params error, msg_type need'}), 400
+
+    stats.incr('feishu_success')
+    return jsonify({'StatusCode': 0, 'StatusMessage': 'success', 'code': 0, 'data': {}, 'msg': 'success'})
+
+
+@app.route('/webhook', methods=['POST'])
+def generic_forward_target():
+    """模拟通用转发目标"""
+    stats.incr('forward_requests')
+    time.sleep(settings.forward_latency())
+
+    failure = _forward_outcome()
+    if failure is not None:
+        return failure
+
+    stats.incr('forward_success')
+    return jsonify({'success': True})
+
+
+@app.route('/_mock/stats', methods=['GET'])
+def mock_stats():
+    """请求计数（压测脚本用于统计每请求 AI 调用次数）"""
+    return jsonify({'counters': stats.snapshot(), 'settings': settings.to_dict()})
+
+
+@app.route('/_mock/reset', methods=['POST'])
+def mock_reset():
+    """重置计数"""
+    stats.reset()
+    return jsonify({'success': True})
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='本地模拟 OpenAI / 飞书服务（压测用）')
+    parser.add_argument('--host', default=os.getenv('MOCK_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MOCK_PORT', '9100')))
+    parser.add_argument('--llm-latency', default=os.getenv('MOCK_LLM_LATENCY', 'lognormal:2,0.5'),
+                        help='AI 接口延迟分布')
+    parser.add_argument('--forward-latency', default=os.getenv('MOCK_FORWARD_LATENCY', 'uniform:0.05,0.3'),
+                        help='转发目标延迟分布')
+    parser.add_argument('--llm-error-rate', type=float, default=float(os.getenv('MOCK_LLM_ERROR_RATE', '0')),
+                        help='AI 接口 500 错误比例')
+    parser.add_argument('--llm-malformed-rate', type=float, default=float(os.getenv('MOCK_LLM_MALFORMED_RATE', '0')),
+                        help='AI 返回畸形 JSON 的比例')
+    parser.add_argument('--llm-rate-limit-rate', type=float, default=float(os.getenv('MOCK_LLM_RATE_LIMIT_RATE', '0')),
+                        help='AI 接口 429 限流比例')
+    parser.add_argument('--forward-error-rate', type=float, default=float(os.getenv('MOCK_FORWARD_ERROR_RATE', '0')),
+                        help='转发目标 500 错误比例')
+    parser.add_argument('--forward-rate-limit-rate', type=float,
+                        default=float(os.getenv('MOCK_FORWARD_RATE_LIMIT_RATE', '0')),
+                        help='转发目标 429 限流比例')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子（便于复现）')
+    return parser
+
+
+def configure(args: argparse.Namespace) -> None:
+    """应用命令行配置"""
+    global settings
+    if args.seed is not None:
+        random.seed(args.seed)
+    settings = MockSettings(args)
+
+
+# 默认配置（作为模块导入时使用）
+configure(build_arg_parser().parse_args([]))
+
+
+if __name__ == '__main__':
+    cli_args = build_arg_parser().parse_args()
+    configure(cli_args)
+    print(f"模拟服务启动: http://{cli_args.host}:{cli_args.port}")
+    print(f"  OPENAI_API_URL=http://{cli_args.host}:{cli_args.port}/v1")
+    print(f"  FORWARD_URL=http://{cli_args.host}:{cli_args.port}/open-apis/bot/v2/hook/mock")
+    app.run(host=cli_args.host, port=cli_args.port, threaded=True)
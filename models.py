@@ -3,10 +3,17 @@
 """
 from datetime import datetime
 from contextlib import contextmanager
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, Index, text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from typing import Any, Iterable, Optional
+import json
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, Index, LargeBinary, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import declarative_base, deferred, object_session, sessionmaker
 from config import Config
+from payload_delta import expand_field
+from payload_store import REFERENCE_GRACE, decompress, is_parsed_stub
+from concurrency import make_psycopg2_green
+from metrics import instrument_engine
+import query_stats
 import logging
 
 Base = declarative_base()
@@ -14,6 +21,17 @@ Base = declarative_base()
 # 模块 logger
 _logger = logging.getLogger(__name__)
 
+# JSON 列类型：PostgreSQL 上为 JSONB（二进制存储，路径访问不再重新解析文本，支持 GIN 索引和包含查询 @>），
+# 其他数据库为 JSON。已有 PostgreSQL 数据库通过 migrate_db.py 把 json 列转换为 jsonb。
+# Python 的 None 写入为 SQL NULL（而不是 JSON 的 null），紧凑存储的重复告警置空的列可以用 IS NULL 判断
+JSONType = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
+# 告警标签 GIN 索引（label.<name>=<value> 过滤使用 parsed_data -> 'alerts' 的包含查询，见 utils.apply_filters）
+_PG_JSON_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS idx_parsed_alert_labels "
+    "ON webhook_events USING GIN ((parsed_data -> 'alerts') jsonb_path_ops)"
+)
+
 # 全局数据库引擎（单例）
 _engine = None
 _session_factory = None
@@ -30,14 +48,19 @@ class WebhookEvent(Base):
     
     # 原始数据
     raw_payload = Column(Text)
-    headers = Column(JSON)
-    parsed_data = Column(JSON)
+    headers = Column(JSONType)
+    parsed_data = Column(JSONType)
+    
+    # PAYLOAD_STORE=blob 时请求体和请求头集合的引用（见 payload_store.py），此时 raw_payload 为 NULL、
+    # parsed_data 只有标签投影，headers 只有每次请求不同的字段，读取时由 get_field 还原
+    payload_hash = Column(String(64))
+    header_hash = Column(String(64))
     
     # 告警去重标识 (基于关键字段的哈希值)
     alert_hash = Column(String(64), index=True)
     
     # AI 分析结果
-    ai_analysis = Column(JSON)
+    ai_analysis = Column(JSONType)
     importance = Column(String(20), index=True)  # high, medium, low
     
     # 转发状态
@@ -49,35 +72,232 @@ class WebhookEvent(Base):
     duplicate_count = Column(Integer, default=1)  # 重复次数
     
     created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)  # 增量查询 / 推送游标
+    
+    # 紧凑存储的重复告警相对原始告警的差异（见 payload_delta.py），此时 raw_payload / headers / parsed_data /
+    # ai_analysis 为 NULL，读取时按 duplicate_of 指向的原始告警还原
+    delta = Column(JSONType)
+    
+    # 全文检索文本（AI 摘要、事件类型、标签、规则名、资源 ID，见 utils.build_search_text 和 search.py），
+    # 只用于建立索引，默认不加载、不在接口中返回
+    search_text = deferred(Column(Text))
     
     # 复合索引：优化去重查询性能
     __table_args__ = (
         Index('idx_hash_timestamp', 'alert_hash', 'timestamp'),
         Index('idx_importance_timestamp', 'importance', 'timestamp'),
+        Index('idx_source_timestamp', 'source', 'timestamp'),
         Index('idx_duplicate_lookup', 'alert_hash', 'is_duplicate', 'timestamp'),
+        Index('idx_payload_hash', 'payload_hash'),  # 清理不再被引用的 payload_blobs
     )
     
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            'id': self.id,
-            'source': self.source,
-            'client_ip': self.client_ip,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
-            'raw_payload': self.raw_payload,
-            'headers': self.headers,
-            'parsed_data': self.parsed_data,
-            'alert_hash': self.alert_hash,
-            'ai_analysis': self.ai_analysis,
-            'importance': self.importance,
-            'forward_status': self.forward_status,
-            'is_duplicate': self.is_duplicate,
-            'duplicate_of': self.duplicate_of,
-            'duplicate_count': self.duplicate_count,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> dict[str, Any]:
+        """
+        转换为字典
+
+        Args:
+            fields: 只输出这些字段（按列定义顺序），默认输出全部字段。
+                与 load_only 投影配合使用时只访问已加载的列，不会触发额外查询。
+        """
+        selected = WEBHOOK_FIELDS if fields is None else [name for name in WEBHOOK_FIELDS if name in fields]
+        result = {}
+        for name in selected:
+            value = self.get_field(name) if name in COMPACTED_FIELDS else getattr(self, name)
+            if name in _DATETIME_FIELDS and value is not None:
+                value = value.isoformat()
+            result[name] = value
+        return result
+    
+    def is_compact(self) -> bool:
+        """是否为紧凑存储的重复告警（delta 未加载时视为否）"""
+        return self.__dict__.get('delta') is not None
+    
+    def get_field(self, name: str) -> Any:
+        """
+        读取 raw_payload / headers / parsed_data / ai_analysis，还原 payload_blobs / header_sets 引用，
+        紧凑存储的重复告警按原始告警还原
+
+        引用和原始告警优先使用 attach_references 批量加载的结果，否则在当前会话中按需查询
+        （原始告警已被清理时还原为 None）。
+        """
+        getattr(self, name)  # 未加载的列按映射配置加载（raiseload 投影中访问未加载的列会报错）
+        row = StoredRow(self.__dict__, self._references())
+        if not self.is_compact():
+            return row.get(name)
+        if '_original_fields' not in self.__dict__:
+            session = object_session(self)
+            if session is not None:
+                attach_references(session, [self], fields=(name,))
+            else:
+                self._original_fields = {}
+        return expand_field(name, self.delta, row, self._original_fields)
+    
+    def _references(self) -> 'StoredReferences':
+        refs = self.__dict__.get('_refs')
+        if refs is None:
+            refs = self._refs = StoredReferences(object_session(self))
+        return refs
+
+
+# 紧凑存储的重复告警中由原始告警还原的字段
+COMPACTED_FIELDS = ('raw_payload', 'headers', 'parsed_data', 'ai_analysis')
+
+# 只用于内部索引 / 存储的字段（不在接口中返回）
+_INTERNAL_FIELDS = frozenset(('search_text', 'delta', 'payload_hash', 'header_hash'))
+
+# 还原 payload_blobs / header_sets 引用需要的列
+REFERENCE_FIELDS = ('payload_hash', 'header_hash')
+
+# WebhookEvent 的全部字段（按列定义顺序）
+WEBHOOK_FIELDS = tuple(
+    column.name for column in WebhookEvent.__table__.columns if column.name not in _INTERNAL_FIELDS
+)
+
+# 列表摘要视图字段：不含原始请求体、请求头和解析后数据（详情通过 /api/webhooks/<id> 获取）
+WEBHOOK_SUMMARY_FIELDS = (
+    'id', 'source', 'client_ip', 'timestamp', 'alert_hash', 'ai_analysis', 'importance',
+    'forward_status', 'is_duplicate', 'duplicate_of', 'duplicate_count', 'created_at', 'updated_at'
+)
+
+_DATETIME_FIELDS = frozenset(('timestamp', 'created_at', 'updated_at'))
+
+
+class PayloadBlob(Base):
+    """压缩后的请求体（按内容哈希去重，PAYLOAD_STORE=blob 时由 webhook_events.payload_hash 引用）"""
+    __tablename__ = 'payload_blobs'
+    
+    hash = Column(String(64), primary_key=True)  # 原始请求体的 SHA-256
+    codec = Column(String(10), nullable=False)  # zstd / zlib
+    size = Column(Integer, nullable=False)  # 压缩前字节数
+    data = Column(LargeBinary, nullable=False)
+    last_seen_at = Column(DateTime, default=datetime.now)  # 最近一次被新事件引用的时间（最多每小时刷新一次）
+
+
+class HeaderSet(Base):
+    """去掉每次请求不同的字段后的请求头集合（按内容哈希去重，由 webhook_events.header_hash 引用）"""
+    __tablename__ = 'header_sets'
+    
+    hash = Column(String(64), primary_key=True)
+    headers = Column(JSONType, nullable=False)
+    last_seen_at = Column(DateTime, default=datetime.now)
+
+
+class StoredReferences:
+    """一批事件共享的 payload_blobs / header_sets 缓存：prefetch 批量查询，未预取的引用在访问时查询"""
+    
+    def __init__(self, session) -> None:
+        self._session = session
+        self._payloads: dict[str, Optional[str]] = {}
+        self._header_sets: dict[str, Optional[dict]] = {}
+    
+    def prefetch(self, payload_hashes: Iterable[Optional[str]] = (), header_hashes: Iterable[Optional[str]] = ()) -> None:
+        payload_hashes = {h for h in payload_hashes if h and h not in self._payloads}
+        header_hashes = {h for h in header_hashes if h and h not in self._header_sets}
+        if self._session is None:
+            return
+        if payload_hashes:
+            rows = self._session.query(PayloadBlob.hash, PayloadBlob.codec, PayloadBlob.data).filter(
+                PayloadBlob.hash.in_(payload_hashes)
+            ).all()
+            self._payloads.update({row.hash: decompress(row.codec, row.data).decode('utf-8') for row in rows})
+            self._payloads.update({h: None for h in payload_hashes if h not in self._payloads})
+        if header_hashes:
+            rows = self._session.query(HeaderSet.hash, HeaderSet.headers).filter(HeaderSet.hash.in_(header_hashes)).all()
+            self._header_sets.update({row.hash: row.headers for row in rows})
+            self._header_sets.update({h: None for h in header_hashes if h not in self._header_sets})
+    
+    def payload(self, payload_hash: str) -> Optional[str]:
+        if payload_hash not in self._payloads:
+            self.prefetch(payload_hashes=(payload_hash,))
+        return self._payloads.get(payload_hash)
+    
+    def header_set(self, header_hash: str) -> Optional[dict]:
+        if header_hash not in self._header_sets:
+            self.prefetch(header_hashes=(header_hash,))
+        return self._header_sets.get(header_hash)
+
+
+class StoredRow:
+    """一行的 raw_payload / headers / parsed_data / ai_analysis，payload_blobs / header_sets 引用在读取时还原"""
+    
+    def __init__(self, values: dict[str, Any], refs: StoredReferences) -> None:
+        self._values = values
+        self._refs = refs
+    
+    def get(self, name: str) -> Any:
+        value = self._values.get(name)
+        payload_hash = self._values.get('payload_hash')
+        if name == 'raw_payload' and value is None and payload_hash:
+            return self._refs.payload(payload_hash)
+        if name == 'parsed_data' and payload_hash and is_parsed_stub(value):
+            raw = self.get('raw_payload')
+            return json.loads(raw) if raw is not None else None
+        if name == 'headers' and self._values.get('header_hash'):
+            return {**(self._refs.header_set(self._values['header_hash']) or {}), **(value or {})}
+        return value
+    
+    __getitem__ = get
+
+
+def load_columns(fields: Iterable[str]) -> list:
+    """
+    load_only 投影需要的列：包含可由原始告警 / 引用还原的字段时同时加载 delta、duplicate_of 和引用列，
+    parsed_data 可能由请求体解析得到，同时加载 raw_payload
+    """
+    names = list(fields)
+    if any(name in COMPACTED_FIELDS for name in names):
+        extra = ('delta', 'duplicate_of') + REFERENCE_FIELDS
+        if 'parsed_data' in names:
+            extra += ('raw_payload',)
+        names += [name for name in extra if name not in names]
+    return [getattr(WebhookEvent, name) for name in names]
+
+
+def attach_references(session, events: Iterable[WebhookEvent], fields: Optional[Iterable[str]] = None) -> None:
+    """
+    批量加载一批事件还原 fields（默认全部字段）需要的数据（避免 to_dict 逐条查询）：
+    紧凑存储的重复告警引用的原始告警一次查询，payload_blobs / header_sets 各一次查询
+    """
+    events = list(events)
+    fields = set(COMPACTED_FIELDS if fields is None else fields)
+    refs = StoredReferences(session)
+    originals = {}
+    compact = [event for event in events if event.is_compact() and '_original_fields' not in event.__dict__]
+    ids = {event.duplicate_of for event in compact if event.duplicate_of is not None}
+    if ids:
+        rows = session.query(
+            WebhookEvent.id, *(getattr(WebhookEvent, name) for name in COMPACTED_FIELDS + REFERENCE_FIELDS)
+        ).filter(WebhookEvent.id.in_(ids)).all()
+        originals = {row.id: StoredRow(row._asdict(), refs) for row in rows}
+    for event in compact:
+        event._original_fields = originals.get(event.duplicate_of, {})
+    for event in events:
+        event._refs = refs
+
+    rows = [event.__dict__ for event in events] + [row._values for row in originals.values()]
+    refs.prefetch(
+        payload_hashes=(row.get('payload_hash') for row in rows) if fields & {'raw_payload', 'parsed_data'} else (),
+        header_hashes=(row.get('header_hash') for row in rows) if 'headers' in fields else ()
+    )
+
+
+def delete_orphan_references(conn, now: Optional[datetime] = None) -> int:
+    """
+    删除不再被任何事件引用的 payload_blobs / header_sets（过期事件删除后调用），返回删除的 blob 数
+
+    只删除超过 REFERENCE_GRACE 未被引用的记录：写入事件时内容已存在的 blob 会刷新 last_seen_at
+    （见 utils.reference_inserts），正在写入、尚未提交的事件引用的 blob 不会被删除。
+    """
+    params = {'threshold': (now or datetime.now()) - REFERENCE_GRACE}
+    deleted = conn.execute(text(
+        "DELETE FROM payload_blobs WHERE last_seen_at < :threshold AND NOT EXISTS "
+        "(SELECT 1 FROM webhook_events WHERE webhook_events.payload_hash = payload_blobs.hash)"
+    ), params).rowcount
+    conn.execute(text(
+        "DELETE FROM header_sets WHERE last_seen_at < :threshold AND NOT EXISTS "
+        "(SELECT 1 FROM webhook_events WHERE webhook_events.header_hash = header_sets.hash)"
+    ), params)
+    return deleted
 
 
 class ProcessingLock(Base):
@@ -99,6 +319,14 @@ def get_engine():
     """获取数据库引擎（单例）"""
     global _engine
     if _engine is None:
+        connect_args = {}
+        if Config.DATABASE_URL.startswith('sqlite'):
+            # SQLite（本地压测用）：允许跨线程使用连接，写锁冲突时等待而不是立即报错
+            connect_args = {'check_same_thread': False, 'timeout': 30}
+        else:
+            # gevent worker 下让 psycopg2 查询等待期间让出执行权
+            make_psycopg2_green()
+        
         _engine = create_engine(
             Config.DATABASE_URL, 
             echo=False, 
@@ -106,11 +334,45 @@ def get_engine():
             pool_size=Config.DB_POOL_SIZE,  # 连接池大小
             max_overflow=Config.DB_MAX_OVERFLOW,  # 最大溢出连接
             pool_recycle=Config.DB_POOL_RECYCLE,  # 连接回收时间
-            pool_timeout=Config.DB_POOL_TIMEOUT  # 连接超时
+            pool_timeout=Config.DB_POOL_TIMEOUT,  # 连接超时
+            connect_args=connect_args
         )
+        instrument_engine(_engine)
+        query_stats.instrument_engine(_engine)
     return _engine
 
 
+def dispose_engine_after_fork() -> None:
+    """
+    fork 之后在子进程中丢弃继承的连接池
+
+    gunicorn preload 时 master 中可能已经创建过引擎和连接，close=False 只让子进程放弃这些连接
+    （不关闭父进程仍在使用的 socket），之后子进程按需建立自己的连接。
+    """
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+def warmup_pool(size: int) -> int:
+    """
+    预先建立数据库连接并放回连接池，避免 worker 的第一批请求承担建连开销
+
+    Returns:
+        int: 实际预热的连接数（不超过 DB_POOL_SIZE，超出部分归还时会被连接池关闭）
+    """
+    engine = get_engine()
+    connections = []
+    try:
+        for _ in range(min(size, Config.DB_POOL_SIZE)):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            connections.append(conn)
+    finally:
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
+
 def get_session():
     """获取数据库会话"""
     global _session_factory
@@ -133,10 +395,48 @@ def session_scope():
         session.close()
 
 
+def release_locks_by_worker(worker_id: str) -> int:
+    """
+    删除指定 worker 持有的处理锁（worker 退出时调用，其他 worker 不必等到锁过期）
+
+    Returns:
+        int: 释放的锁数量
+    """
+    with session_scope() as session:
+        return session.query(ProcessingLock).filter(ProcessingLock.worker_id == worker_id).delete()
+
+
+def ensure_json_indexes(engine) -> bool:
+    """
+    创建 JSONB 路径上的 GIN 索引（仅 PostgreSQL，幂等，init_db 和 migrate_db 调用）
+
+    Returns:
+        bool: 已创建（或已存在）返回 True；非 PostgreSQL 或列尚未迁移为 jsonb 时返回 False
+    """
+    if engine.dialect.name != 'postgresql':
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(_PG_JSON_INDEX_DDL))
+        return True
+    except Exception as e:
+        _logger.warning(f"创建告警标签 GIN 索引失败（parsed_data 需为 jsonb，执行 migrate_db.py）: {e}")
+        return False
+
+
 def init_db():
     """初始化数据库表"""
     engine = get_engine()
     Base.metadata.create_all(engine)
+    
+    ensure_json_indexes(engine)
+    
+    # PARTITION_INTERVAL 已设置时空表转换为分区表并创建分区（已有数据需执行 migrate_db.py）
+    from partitions import setup_partitioning
+    setup_partitioning(engine)
+    
+    from search import ensure_search_index
+    ensure_search_index(engine)
     print("数据库表初始化完成")
 
 
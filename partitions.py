@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+webhook_events 按接收时间分区和数据保留（仅 PostgreSQL 原生范围分区）
+
+PARTITION_INTERVAL=day / week 时 webhook_events 为 PARTITION BY RANGE (timestamp) 的分区表：
+- 每个分区一天（或从周一开始的一周），命名为 webhook_events_pYYYYMMDD（分区起始日期），
+  另有默认分区 webhook_events_default 兜底（维护任务中断、时间异常的事件不会写入失败）
+- 维护任务预先创建 PARTITION_PREMAKE 个未来分区；RETENTION_DAYS 到期的分区整体 DROP，
+  不产生 DELETE 的死元组和索引膨胀，每个分区的索引只覆盖该时间段的数据
+- 去重查询带 timestamp >= 时间窗口起点条件，规划器只扫描窗口内的分区（分区裁剪）
+
+主键为 (id, timestamp)（分区表的唯一约束必须包含分区键），id 仍由序列生成、全局唯一。
+未分区的数据库（含 SQLite）设置 RETENTION_DAYS 时按 ID 分批 DELETE 过期事件。
+
+维护任务由每个 worker 的后台线程每 PARTITION_MAINTENANCE_INTERVAL 秒执行一次（advisory lock 保证同一时间只有一个执行），
+也可以由 cron 执行：
+
+    python partitions.py maintain   # 创建未来分区、删除过期分区
+    python partitions.py status     # 查看分区和估算行数
+
+已有数据库通过 migrate_db.py 转换为分区表（见 partition_existing_table）。
+"""
+import argparse
+import re
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from compact_duplicates import materialize_expiring
+from config import Config
+from logger import logger
+from models import WebhookEvent, delete_orphan_references, ensure_json_indexes, get_engine, session_scope
+
+PARTITION_INTERVALS = ('day', 'week')
+
+_TABLE = WebhookEvent.__tablename__
+_LEGACY_TABLE = f'{_TABLE}_legacy'
+_DEFAULT_PARTITION = f'{_TABLE}_default'
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+# 维护任务的 advisory lock（多个 worker 同时执行时只有一个真正执行）
+_LOCK_KEY = zlib.crc32(b'webhook_events.partitions')
+
+# 创建 / 删除分区需要父表上的排他锁，等待超过该时间放弃（下一轮再试），避免长时间阻塞写入
+_DDL_LOCK_TIMEOUT = '5s'
+
+_maintenance_thread: Optional[threading.Thread] = None
+
+
+def period_start(moment: datetime, interval: str) -> datetime:
+    """moment 所在分区的起始时间（day 为当天零点，week 为周一零点）"""
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def next_period(start: datetime, interval: str) -> datetime:
+    return start + timedelta(days=7 if interval == 'week' else 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{_TABLE}_p{start:%Y%m%d}"
+
+
+def parse_bound(expr: str) -> Optional[tuple[datetime, datetime]]:
+    """解析 pg_get_expr(relpartbound) 的范围，默认分区和无法解析的范围返回 None"""
+    match = _BOUND_RE.search(expr)
+    if not match:
+        return None
+    return datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != 'postgresql':
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"
+    ), {'table': _TABLE}).scalar())
+
+
+def list_partitions(conn: Connection) -> list[tuple[str, Optional[datetime], Optional[datetime]]]:
+    """
+    Returns:
+        list: (分区名, 起始时间, 结束时间)，按起始时间排序，默认分区的时间为 None 且排在最后
+    """
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)"
+    ), {'table': _TABLE}).all()
+    partitions = []
+    for name, expr in rows:
+        bound = parse_bound(expr or '')
+        partitions.append((name, *(bound or (None, None))))
+    return sorted(partitions, key=lambda p: (p[1] is None, p[1] or datetime.min))
+
+
+def _infer_interval(partitions: list[tuple[str, Optional[datetime], Optional[datetime]]]) -> str:
+    """未配置 PARTITION_INTERVAL 时按最新分区的跨度沿用已有的分区粒度"""
+    ranged = [p for p in partitions if p[1] is not None]
+    if ranged and ranged[-1][2] - ranged[-1][1] >= timedelta(days=7):
+        return 'week'
+    return 'day'
+
+
+def _create_partition(conn: Connection, start: datetime, end: datetime) -> Optional[str]:
+    """创建一个分区，失败（默认分区中已有该时间段的事件、等待锁超时）时记录日志并返回 None"""
+    name = partition_name(start)
+    try:
+        with conn.begin_nested():
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {_TABLE} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d %H:%M:%S}') TO ('{end:%Y-%m-%d %H:%M:%S}')"
+            ))
+    except Exception as e:
+        logger.warning(f"创建分区 {name} 失败: {str(e)}")
+        return None
+    return name
+
+
+def ensure_partitions(
+    conn: Connection,
+    interval: Optional[str] = None,
+    premake: Optional[int] = None,
+    now: Optional[datetime] = None,
+    since: Optional[datetime] = None
+) -> list[str]:
+    """
+    创建从当前分区（或 since 所在分区）到之后 premake 个分区，以及默认分区
+
+    已有分区之后的时间段才会创建，和已有分区不重叠；维护任务中断期间写入默认分区的时间段不补建分区
+    （补建会与默认分区中的数据冲突），这些事件留在默认分区中，仍可正常查询并按保留期清理。
+
+    Returns:
+        list[str]: 新创建的分区名
+    """
+    partitions = list_partitions(conn)
+    interval = interval or Config.PARTITION_INTERVAL or _infer_interval(partitions)
+    premake = Config.PARTITION_PREMAKE if premake is None else premake
+    now = now or datetime.now()
+
+    created = []
+    if not any(name == _DEFAULT_PARTITION for name, _, _ in partitions):
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {_DEFAULT_PARTITION} PARTITION OF {_TABLE} DEFAULT"))
+        created.append(_DEFAULT_PARTITION)
+
+    start = period_start(since or now, interval)
+    covered_until = max((end for _, _, end in partitions if end is not None), default=None)
+    if covered_until is not None and covered_until > start:
+        start = covered_until
+    until = period_start(now, interval)
+    for _ in range(premake + 1):
+        until = next_period(until, interval)
+
+    while start < until:
+        end = next_period(start, interval)
+        name = _create_partition(conn, start, end)
+        if name:
+            created.append(name)
+        start = end
+    return created
+
+
+def drop_expired_partitions(conn: Connection, cutoff: datetime) -> tuple[list[str], int]:
+    """
+    删除结束时间不晚于 cutoff 的分区，默认分区中早于 cutoff 的事件按行删除
+
+    Returns:
+        tuple: (删除的分区名, 默认分区中删除的行数)
+    """
+    dropped, deleted = [], 0
+    for name, start, end in list_partitions(conn):
+        if name == _DEFAULT_PARTITION:
+            deleted = conn.execute(text(f"DELETE FROM {name} WHERE timestamp < :cutoff"), {'cutoff': cutoff}).rowcount
+        elif end is not None and end <= cutoff:
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped, deleted
+
+
+def delete_expired_events(cutoff: datetime, batch_size: int = 5000) -> int:
+    """未分区的数据库按 ID 分批删除早于 cutoff 的事件（每批一个事务，避免长事务和大量锁）"""
+    deleted = 0
+    while True:
+        with session_scope() as session:
+            ids = [row.id for row in session.query(WebhookEvent.id).filter(
+                WebhookEvent.timestamp < cutoff
+            ).order_by(WebhookEvent.id).limit(batch_size)]
+            if not ids:
+                return deleted
+            deleted += session.query(WebhookEvent).filter(
+                WebhookEvent.id.in_(ids)
+            ).delete(synchronize_session=False)
+
+
+def run_maintenance(engine: Optional[Engine] = None, now: Optional[datetime] = None) -> dict[str, Any]:
+    """
+    执行一次维护：分区表创建未来分区并删除过期分区，未分区的数据库删除过期事件
+
+    Returns:
+        dict: created（新建的分区）、dropped（删除的分区）、deleted（按行删除的事件数）、
+            materialized（原始告警过期前还原为完整副本的重复告警数）、orphaned_blobs（删除的不再被引用的请求体 blob 数）、
+            skipped（其他 worker 正在执行时为 True）
+    """
+    engine = engine or get_engine()
+    now = now or datetime.now()
+    cutoff = now - timedelta(days=Config.RETENTION_DAYS) if Config.RETENTION_DAYS > 0 else None
+    result = {'created': [], 'dropped': [], 'deleted': 0, 'materialized': 0, 'orphaned_blobs': 0, 'skipped': False}
+
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {'key': _LOCK_KEY}).scalar():
+                result['skipped'] = True
+                return result
+            if is_partitioned(conn):
+                conn.execute(text(f"SET LOCAL lock_timeout = '{_DDL_LOCK_TIMEOUT}'"))
+                result['created'] = ensure_partitions(conn, now=now)
+                if cutoff is not None:
+                    result['materialized'] = materialize_expiring(conn, cutoff)
+                    result['dropped'], result['deleted'] = drop_expired_partitions(conn, cutoff)
+                cutoff = None
+        if cutoff is not None:
+            result['materialized'] = materialize_expiring(engine, cutoff)
+            result['deleted'] = delete_expired_events(cutoff)
+
+    if Config.PAYLOAD_STORE == 'blob' and (result['dropped'] or result['deleted']):
+        with engine.begin() as conn:
+            result['orphaned_blobs'] = delete_orphan_references(conn, now)
+
+    if result['created'] or result['dropped'] or result['deleted']:
+        logger.info(
+            f"分区维护完成: 新建分区 {len(result['created'])} 个, 删除过期分区 {len(result['dropped'])} 个, "
+            f"删除过期事件 {result['deleted']} 条"
+        )
+    return result
+
+
+def partition_existing_table(engine: Engine, interval: str) -> int:
+    """
+    把已有的 webhook_events 转换为分区表（migrate_db 调用，PostgreSQL）
+
+    在一个事务中：原表改名为 webhook_events_legacy（删除其索引，释放索引名），按原表结构创建分区表，
+    主键改为 (id, timestamp)，沿用原 id 序列，按模型定义重建索引，创建覆盖已有数据的分区后复制数据
+    （设置了 RETENTION_DAYS 时不复制已过期的事件）。复制期间持有原表排他锁，大表应在维护窗口执行。
+    原表为空时直接删除，否则保留 webhook_events_legacy，确认无误后手动 DROP。
+
+    Returns:
+        int: 复制的事件数
+    """
+    cutoff = datetime.now() - timedelta(days=Config.RETENTION_DAYS) if Config.RETENTION_DAYS > 0 else None
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': _LEGACY_TABLE}).scalar():
+            raise RuntimeError(f"{_LEGACY_TABLE} 已存在（上次转换保留的原表），确认后删除再执行")
+
+        conn.execute(text(f"LOCK TABLE {_TABLE} IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text(f"ALTER TABLE {_TABLE} RENAME TO {_LEGACY_TABLE}"))
+        primary_key = conn.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:name) AND contype = 'p'"
+        ), {'name': _LEGACY_TABLE}).scalar()
+        if primary_key:
+            conn.execute(text(f'ALTER TABLE {_LEGACY_TABLE} RENAME CONSTRAINT "{primary_key}" TO {_LEGACY_TABLE}_pkey'))
+        for (index_name,) in conn.execute(text(
+            "SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = to_regclass(:name) AND NOT x.indisprimary"
+        ), {'name': _LEGACY_TABLE}).all():
+            conn.execute(text(f'DROP INDEX "{index_name}"'))
+
+        conn.execute(text(
+            f"CREATE TABLE {_TABLE} (LIKE {_LEGACY_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"
+        ))
+        conn.execute(text(f"ALTER TABLE {_TABLE} ADD PRIMARY KEY (id, timestamp)"))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:name, 'id')"), {'name': _LEGACY_TABLE}).scalar()
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {_TABLE}.id"))
+        for index in WebhookEvent.__table__.indexes:
+            index.create(conn)
+
+        oldest, total = conn.execute(text(
+            f"SELECT min(timestamp), count(*) FROM {_LEGACY_TABLE}"
+        )).one()
+        since = max(oldest, cutoff) if oldest is not None and cutoff is not None else oldest
+        created = ensure_partitions(conn, interval=interval, since=since)
+        logger.info(f"已创建 {len(created)} 个分区")
+
+        copy_sql = f"INSERT INTO {_TABLE} SELECT * FROM {_LEGACY_TABLE}"
+        params = {}
+        if cutoff is not None:
+            copy_sql += " WHERE timestamp >= :cutoff"
+            params['cutoff'] = cutoff
+        copied = conn.execute(text(copy_sql), params).rowcount
+        if total == 0:
+            conn.execute(text(f"DROP TABLE {_LEGACY_TABLE}"))
+
+    ensure_json_indexes(engine)
+    from search import ensure_search_index
+    ensure_search_index(engine)
+    legacy_note = f"，原表保留为 {_LEGACY_TABLE}" if total else ''
+    logger.info(f"webhook_events 已转换为分区表（{interval}），复制 {copied} 条事件{legacy_note}")
+    return copied
+
+
+def setup_partitioning(engine: Engine, convert_existing: bool = False) -> bool:
+    """
+    按 PARTITION_INTERVAL 准备分区表（init_db 和 migrate_db 调用，仅 PostgreSQL）
+
+    未分区的空表直接转换；已有数据的表只在 convert_existing（migrate_db）时转换，否则提示执行迁移。
+
+    Returns:
+        bool: webhook_events 是否为分区表
+    """
+    if engine.dialect.name != 'postgresql' or Config.PARTITION_INTERVAL not in PARTITION_INTERVALS:
+        return False
+
+    with engine.connect() as conn:
+        partitioned = is_partitioned(conn)
+        has_rows = not partitioned and conn.execute(text(f"SELECT 1 FROM {_TABLE} LIMIT 1")).scalar() is not None
+
+    if not partitioned:
+        if has_rows and not convert_existing:
+            logger.warning("PARTITION_INTERVAL 已设置但 webhook_events 不是分区表，执行 python migrate_db.py 转换")
+            return False
+        partition_existing_table(engine, Config.PARTITION_INTERVAL)
+    run_maintenance(engine)
+    return True
+
+
+def start_maintenance_thread() -> bool:
+    """
+    启动后台维护线程（worker 预热完成后调用），每 PARTITION_MAINTENANCE_INTERVAL 秒执行一次 run_maintenance
+
+    Returns:
+        bool: 是否启动（未启用分区和数据保留，或间隔为 0 时不启动）
+    """
+    global _maintenance_thread
+    if Config.PARTITION_MAINTENANCE_INTERVAL <= 0:
+        return False
+    if Config.PARTITION_INTERVAL not in PARTITION_INTERVALS and Config.RETENTION_DAYS <= 0:
+        return False
+    if _maintenance_thread is not None and _maintenance_thread.is_alive():
+        return True
+
+    def _run() -> None:
+        while True:
+            time.sleep(Config.PARTITION_MAINTENANCE_INTERVAL)
+            try:
+                run_maintenance()
+            except Exception as e:
+                logger.warning(f"分区维护失败（下一轮重试）: {str(e)}")
+
+    _maintenance_thread = threading.Thread(target=_run, name='partition-maintenance', daemon=True)
+    _maintenance_thread.start()
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='webhook_events 分区维护')
+    parser.add_argument('command', choices=('maintain', 'status'))
+    args = parser.parse_args()
+
+    engine = get_engine()
+    if args.command == 'maintain':
+        result = run_maintenance(engine)
+        if result['skipped']:
+            print("其他进程正在执行维护，已跳过")
+            return 0
+        print(f"新建分区: {', '.join(result['created']) or '无'}")
+        print(f"删除分区: {', '.join(result['dropped']) or '无'}")
+        print(f"删除事件: {result['deleted']}")
+        print(f"还原重复告警: {result['materialized']}")
+        print(f"删除请求体 blob: {result['orphaned_blobs']}")
+        return 0
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            print("webhook_events 不是分区表")
+            return 0
+        rows = dict(conn.execute(text(
+            "SELECT c.relname, GREATEST(c.reltuples, 0)::bigint FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)"
+        ), {'table': _TABLE}).all())
+        for name, start, end in list_partitions(conn):
+            span = f"{start:%Y-%m-%d} ~ {end:%Y-%m-%d}" if start else 'DEFAULT'
+            print(f"{name:<32} {span:<26} 约 {rows.get(name, 0)} 行")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
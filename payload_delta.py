@@ -0,0 +1,198 @@
+"""
+重复告警的紧凑存储：只保存与原始告警不同的部分
+
+重复告警的请求体、请求头和解析后数据与原始告警几乎相同（通常只有时间、数值等少数字段不同），
+AI 分析结果直接复用原始告警的。紧凑存储时这些列为 NULL，差异保存在 webhook_events.delta 中：
+
+    {
+        "raw": [[起始, 结束, "替换文本"], ...],  # 请求体相对原始告警请求体的 token 级替换
+        "parsed": "$raw" | <JSON 差异>,          # "$raw" 表示解析后数据可由请求体 json.loads 得到
+        "headers": <JSON 差异>
+    }
+
+缺少的键表示与原始告警相同；行上非 NULL 的列优先（例如重新分析后写入的 ai_analysis）。
+读取时由 WebhookEvent.get_field / to_dict 按原始告警还原，请求体逐字节还原。
+
+JSON 差异格式：{"$v": 新值}（整体替换）、{"$d": {键: 差异}, "$r": [删除的键]}（对象）、
+{"$l": {下标: 差异}}（等长数组），相同的值不出现。
+"""
+import json
+import re
+from typing import Any, Optional
+
+# 请求体按 JSON 字符串切分：字符串（含引号）和字符串之间的片段交替出现，拼接后与原文完全一致；
+# 时间戳、ID 等变化通常只替换一个 token
+_TOKEN_RE = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")')
+
+# 解析后数据可由请求体得到的标记
+PARSED_FROM_RAW = '$raw'
+
+
+def json_delta(old: Any, new: Any) -> Optional[dict]:
+    """new 相对 old 的差异，相同时返回 None"""
+    if type(old) is not type(new):
+        return {'$v': new}
+    if isinstance(new, dict):
+        changes = {}
+        for key, value in new.items():
+            if key not in old:
+                changes[key] = {'$v': value}
+                continue
+            sub = json_delta(old[key], value)
+            if sub is not None:
+                changes[key] = sub
+        removed = [key for key in old if key not in new]
+        if not changes and not removed:
+            return None
+        delta = {'$d': changes}
+        if removed:
+            delta['$r'] = removed
+        return delta
+    if isinstance(new, list):
+        if len(old) != len(new):
+            return {'$v': new}
+        changes = {}
+        for i, (a, b) in enumerate(zip(old, new)):
+            sub = json_delta(a, b)
+            if sub is not None:
+                changes[str(i)] = sub
+        return {'$l': changes} if changes else None
+    return None if old == new else {'$v': new}
+
+
+def apply_json_delta(old: Any, delta: Optional[dict]) -> Any:
+    """把 json_delta 的结果应用到 old（不修改 old）"""
+    if delta is None:
+        return old
+    if '$v' in delta:
+        return delta['$v']
+    if '$d' in delta:
+        result = dict(old)
+        for key, sub in delta['$d'].items():
+            result[key] = apply_json_delta(old.get(key), sub)
+        for key in delta.get('$r', ()):
+            result.pop(key, None)
+        return result
+    result = list(old)
+    for index, sub in delta['$l'].items():
+        result[int(index)] = apply_json_delta(old[int(index)], sub)
+    return result
+
+
+def text_delta(old: str, new: str) -> Optional[list]:
+    """
+    new 相对 old 的 token 级替换列表 [[起始, 结束, 替换文本], ...]（old 的 token[起始:结束] 替换为该文本）
+
+    token 数相同时逐位置比较（常见情况：结构相同、只有值变化）；否则去掉相同的前缀和后缀，
+    中间部分整体替换（分组中增减告警等）。两种方式都是线性时间。差异不比原文小时返回 None（调用方完整保存 new）。
+    """
+    a, b = _TOKEN_RE.split(old), _TOKEN_RE.split(new)
+    ops = []
+    if len(a) == len(b):
+        changed = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+        for i in changed:
+            if ops and ops[-1][1] == i:
+                ops[-1][1] = i + 1
+            else:
+                ops.append([i, i + 1])
+        ops = [[start, end, ''.join(b[start:end])] for start, end in ops]
+    else:
+        prefix = 0
+        limit = min(len(a), len(b))
+        while prefix < limit and a[prefix] == b[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and a[-1 - suffix] == b[-1 - suffix]:
+            suffix += 1
+        ops.append([prefix, len(a) - suffix, ''.join(b[prefix:len(b) - suffix])])
+
+    if len(json.dumps(ops, ensure_ascii=False)) >= len(new):
+        return None
+    return ops
+
+
+def apply_text_delta(old: str, ops: list) -> str:
+    tokens = _TOKEN_RE.split(old)
+    parts, position = [], 0
+    for start, end, replacement in ops:
+        parts.extend(tokens[position:start])
+        parts.append(replacement)
+        position = end
+    parts.extend(tokens[position:])
+    return ''.join(parts)
+
+
+def build_delta(
+    original_raw: Optional[str],
+    original_headers: Optional[dict],
+    original_parsed: Any,
+    raw: Optional[str],
+    headers: dict,
+    parsed: Any
+) -> tuple[dict, dict[str, Any]]:
+    """
+    计算重复告警相对原始告警的差异
+
+    Returns:
+        tuple: (delta, 仍需完整保存的列)：无法用差异表示的请求体 / 解析后数据原样保存在对应列中
+    """
+    delta, columns = {}, {}
+
+    if raw is not None and original_raw is not None:
+        ops = text_delta(original_raw, raw)
+        if ops is not None:
+            delta['raw'] = ops
+        else:
+            columns['raw_payload'] = raw
+    elif raw is not None:
+        columns['raw_payload'] = raw
+
+    parsed_from_raw = False
+    if raw is not None:
+        try:
+            parsed_from_raw = json.loads(raw) == parsed
+        except ValueError:
+            pass
+    if parsed_from_raw:
+        delta['parsed'] = PARSED_FROM_RAW
+    else:
+        parsed_delta = json_delta(original_parsed, parsed)
+        if parsed_delta is not None:
+            delta['parsed'] = parsed_delta
+
+    headers_delta = json_delta(original_headers or {}, headers)
+    if headers_delta is not None:
+        delta['headers'] = headers_delta
+    return delta, columns
+
+
+def expand_field(name: str, delta: dict, row: dict[str, Any], original: dict[str, Any]) -> Any:
+    """
+    还原紧凑存储的字段
+
+    Args:
+        name: raw_payload / headers / parsed_data / ai_analysis
+        delta: 行上的 delta
+        row: 行上 raw_payload / headers / parsed_data / ai_analysis 列的值（非 NULL 时直接使用）
+        original: 原始告警的 raw_payload / headers / parsed_data / ai_analysis（原始告警不存在时为空字典）
+    """
+    if row.get(name) is not None:
+        return row[name]
+    if name == 'raw_payload':
+        # 没有 raw 差异说明重复告警本身没有请求体（无法用差异表示时已完整保存在列中）
+        if 'raw' in delta and original.get('raw_payload') is not None:
+            return apply_text_delta(original['raw_payload'], delta['raw'])
+        return None
+    if name == 'parsed_data':
+        parsed = delta.get('parsed')
+        if parsed == PARSED_FROM_RAW:
+            raw = expand_field('raw_payload', delta, row, original)
+            return json.loads(raw) if raw is not None else None
+        base = original.get('parsed_data')
+        if base is None and not (parsed and '$v' in parsed):
+            # 原始告警已不存在（或没有解析后数据），无法还原
+            return None
+        return apply_json_delta(base, parsed)
+    if name == 'headers':
+        return apply_json_delta(original.get('headers') or {}, delta.get('headers'))
+    return original.get(name)
@@ -0,0 +1,94 @@
+"""
+请求体和请求头的去重存储（PAYLOAD_STORE=blob）
+
+inline（默认）时每条事件在 webhook_events 中保存 raw_payload 文本、parsed_data JSON 和完整请求头；
+blob 时：
+
+- 请求体按内容哈希（SHA-256）压缩后保存在 payload_blobs 中，相同的请求体只保存一份，
+  事件的 payload_hash 指向它，读取时解压逐字节还原
+- parsed_data 能由请求体 json.loads 得到时不再保存完整 JSON，只保留标记和告警标签投影
+  {"$payload": true, "alerts": [{"labels": ...}]}（标签过滤和 GIN 索引仍可用），读取时由请求体解析
+- 请求头去掉每次请求都不同的字段后按内容哈希保存在 header_sets 中（header_hash），
+  这些字段留在事件的 headers 列中，读取时合并
+
+压缩优先使用 zstd（需要安装 zstandard），否则使用标准库 zlib；每个 blob 记录自己的压缩算法。
+"""
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+from typing import Any
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时使用 zlib
+    zstandard = None
+
+# 新写入 blob 使用的压缩算法
+CODEC = 'zstd' if zstandard is not None else 'zlib'
+
+_ZSTD_LEVEL = 3
+_ZLIB_LEVEL = 6
+
+# 内容已存在的 blob / 请求头集合被新事件引用时，last_seen_at 早于此间隔才刷新（避免每次写入都更新）
+REFERENCE_REFRESH = timedelta(hours=1)
+# 清理不再被引用的 blob / 请求头集合时，只删除超过此时间未被引用的记录（应远大于 REFERENCE_REFRESH 和最长事务时间）
+REFERENCE_GRACE = timedelta(days=1)
+
+# parsed_data 由请求体解析得到时标签投影中的标记
+PARSED_STUB_KEY = '$payload'
+
+# 每次请求都不同的请求头（小写），不参与请求头集合去重
+VOLATILE_HEADERS = frozenset((
+    'content-length', 'date', 'x-request-id', 'x-forwarded-for', 'x-real-ip', 'x-webhook-signature',
+    'traceparent', 'tracestate', 'x-amzn-trace-id', 'x-b3-traceid', 'x-b3-spanid', 'x-b3-parentspanid',
+    'x-b3-sampled', 'sentry-trace', 'baggage',
+))
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def compress(data: bytes) -> tuple[str, bytes]:
+    """按 CODEC 压缩，返回 (算法, 压缩后数据)"""
+    if CODEC == 'zstd':
+        return CODEC, zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(data)
+    return CODEC, zlib.compress(data, _ZLIB_LEVEL)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("payload 使用 zstd 压缩，需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"未知的压缩算法: {codec}")
+
+
+def split_headers(headers: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """拆分为 (可共享的请求头, 每次请求不同的请求头)"""
+    shared, volatile = {}, {}
+    for name, value in headers.items():
+        (volatile if name.lower() in VOLATILE_HEADERS else shared)[name] = value
+    return shared, volatile
+
+
+def header_set_hash(headers: dict[str, Any]) -> str:
+    return content_hash(json.dumps(headers, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+
+
+def parsed_stub(parsed: Any) -> dict[str, Any]:
+    """由请求体解析得到的 parsed_data 在行上保留的标记和告警标签投影"""
+    stub = {PARSED_STUB_KEY: True}
+    alerts = parsed.get('alerts') if isinstance(parsed, dict) else None
+    if isinstance(alerts, list):
+        labels = [{'labels': alert['labels']} for alert in alerts if isinstance(alert, dict) and 'labels' in alert]
+        if labels:
+            stub['alerts'] = labels
+    return stub
+
+
+def is_parsed_stub(value: Any) -> bool:
+    return isinstance(value, dict) and PARSED_STUB_KEY in value
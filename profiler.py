@@ -0,0 +1,283 @@
+"""
+按需性能剖析
+
+通过管理接口在处理请求的 worker 内启动一次限时剖析，剖析在后台线程中运行，不阻塞请求：
+- CPU：基于 sys._current_frames() 的采样剖析（墙钟时间，包含 I/O 和锁等待），
+  输出 flamegraph.pl / speedscope 可直接使用的折叠栈格式；gevent worker 下采样线程使用原生线程，
+  同时采样挂起的 greenlet（gr_frame），正在运行的 greenlet 由 sys._current_frames() 采到
+- 内存：tracemalloc 对比剖析开始和结束时的快照，输出分配增长最多的代码位置
+
+结果写入 PROFILE_DIR，gunicorn 多 worker 下任一 worker 都可以读取。
+未触发时没有任何开销；同一 worker 同时只允许一个剖析，时长不超过 PROFILE_MAX_SECONDS。
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+from collections import Counter
+from datetime import datetime
+from typing import Any, Optional
+
+from config import Config
+from logger import logger
+
+PROFILE_KINDS = ('cpu', 'memory')
+
+# gevent 下重新查找 greenlet 的间隔(秒)，gc.get_objects() 遍历全部对象，不能每轮采样都执行
+_GREENLET_REFRESH = 1.0
+
+# 当前 worker 正在运行的剖析（同一时间只允许一个）
+_active_lock = threading.Lock()
+_active: Optional[dict[str, Any]] = None
+
+
+class ProfilerBusy(RuntimeError):
+    """当前 worker 已有剖析在运行"""
+
+
+def _result_path(profile_id: str) -> str:
+    return os.path.join(Config.PROFILE_DIR, f"profile-{profile_id}.json")
+
+
+def _write_result(profile_id: str, data: dict[str, Any]) -> None:
+    """原子写入结果文件（先写临时文件再替换）"""
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    path = _result_path(profile_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    # 只保留最后两级路径，避免折叠栈过长
+    short = '/'.join(filename.replace('\\', '/').split('/')[-2:])
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _gevent_threading() -> bool:
+    """threading 是否已被 gevent monkey patch（Thread 为 greenlet，get_ident 返回 greenlet ID）"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def _find_greenlets() -> weakref.WeakSet:
+    import gc
+    from greenlet import greenlet
+    return weakref.WeakSet(obj for obj in gc.get_objects() if isinstance(obj, greenlet))
+
+
+def _fold(frame, root: str) -> str:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.append(root)
+    return ';'.join(reversed(stack))
+
+
+def sample_cpu(seconds: float, interval: float, stop_event: Optional[threading.Event] = None) -> dict[str, Any]:
+    """
+    采样所有线程（gevent 下还包括挂起的 greenlet）的调用栈
+
+    gevent 下需在原生线程中调用（见 start_profile），否则采样期间其他 greenlet 不会运行。
+
+    Returns:
+        dict: samples 为 {折叠栈: 采样次数}，栈以线程名（greenlet:名称）为根节点
+    """
+    patched = _gevent_threading()
+    if patched:
+        from gevent.monkey import get_original
+        own_id = get_original('_thread', 'get_ident')()
+        sleep = get_original('time', 'sleep')
+    else:
+        own_id = threading.get_ident()
+        sleep = time.sleep
+    greenlets: weakref.WeakSet = weakref.WeakSet()
+    refreshed = 0.0
+    stacks: Counter = Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+
+    while time.perf_counter() < deadline:
+        if stop_event is not None and stop_event.is_set():
+            break
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own_id:
+                stacks[_fold(frame, f"thread:{names.get(thread_id, thread_id)}")] += 1
+        if patched:
+            if time.perf_counter() - refreshed >= _GREENLET_REFRESH:
+                greenlets = _find_greenlets()
+                refreshed = time.perf_counter()
+            for glet in list(greenlets):
+                # 正在运行和已结束的 greenlet 没有 gr_frame
+                frame = glet.gr_frame
+                if frame is not None:
+                    name = getattr(glet, 'name', None) or type(glet).__name__
+                    stacks[_fold(frame, f"greenlet:{name}")] += 1
+        samples += 1
+        sleep(interval)
+
+    return {
+        'duration_seconds': round(time.perf_counter() - started, 3),
+        'interval_ms': interval * 1000,
+        'sample_rounds': samples,
+        'samples': dict(stacks.most_common())
+    }
+
+
+def trace_memory(
+    seconds: float,
+    top: int = 30,
+    frames: int = 10,
+    stop_event: Optional[threading.Event] = None
+) -> dict[str, Any]:
+    """
+    对比 tracemalloc 快照，返回分配增长最多的位置
+
+    tracemalloc 已被其他代码开启时沿用现有设置，结束后也不关闭。
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(frames)
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, __file__)
+    ]
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(filters)
+        if stop_event is not None:
+            stop_event.wait(seconds)
+        else:
+            time.sleep(seconds)
+        after = tracemalloc.take_snapshot().filter_traces(filters)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    growth = []
+    for stat in after.compare_to(before, 'traceback')[:top]:
+        growth.append({
+            'size_diff_kb': round(stat.size_diff / 1024, 2),
+            'size_kb': round(stat.size / 1024, 2),
+            'count_diff': stat.count_diff,
+            'count': stat.count,
+            'traceback': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        })
+
+    largest = []
+    for stat in after.statistics('lineno')[:top]:
+        frame = stat.traceback[0]
+        largest.append({
+            'location': f"{frame.filename}:{frame.lineno}",
+            'size_kb': round(stat.size / 1024, 2),
+            'count': stat.count
+        })
+
+    return {
+        'traced_current_kb': round(current / 1024, 2),
+        'traced_peak_kb': round(peak / 1024, 2),
+        'top_growth': growth,
+        'top_allocations': largest
+    }
+
+
+def start_profile(kind: str, seconds: float, **options: Any) -> dict[str, Any]:
+    """
+    在后台线程中启动剖析
+
+    Raises:
+        ValueError: 类型或参数无效
+        ProfilerBusy: 当前 worker 已有剖析在运行
+    """
+    global _active
+    if kind not in PROFILE_KINDS:
+        raise ValueError(f"不支持的剖析类型: {kind}")
+    if seconds <= 0 or seconds > Config.PROFILE_MAX_SECONDS:
+        raise ValueError(f"剖析时长需在 (0, {Config.PROFILE_MAX_SECONDS}] 秒之间")
+
+    with _active_lock:
+        if _active is not None:
+            raise ProfilerBusy(f"已有剖析在运行: {_active['profile_id']}")
+        profile_id = uuid.uuid4().hex[:12]
+        meta = {
+            'profile_id': profile_id,
+            'kind': kind,
+            'status': 'running',
+            'worker_pid': os.getpid(),
+            'started_at': datetime.now().isoformat(),
+            'seconds': seconds,
+            'options': options
+        }
+        _write_result(profile_id, meta)
+        stop_event = threading.Event()
+        _active = {**meta, 'stop_event': stop_event}
+
+    args = (kind, seconds, options, meta, stop_event)
+    if kind == 'cpu' and _gevent_threading():
+        # threading.Thread 已被替换为 greenlet，采样需在原生线程中运行
+        from gevent.monkey import get_original
+        get_original('_thread', 'start_new_thread')(_run_profile, args)
+    else:
+        threading.Thread(target=_run_profile, args=args, name=f"profiler-{profile_id}", daemon=True).start()
+    logger.info(f"开始 {kind} 剖析: id={profile_id}, 时长={seconds}s, worker={os.getpid()}")
+    return meta
+
+
+def _run_profile(
+    kind: str,
+    seconds: float,
+    options: dict[str, Any],
+    meta: dict[str, Any],
+    stop_event: threading.Event
+) -> None:
+    global _active
+    try:
+        if kind == 'cpu':
+            interval = max(options.get('interval_ms', 10), 1) / 1000.0
+            data = sample_cpu(seconds, interval, stop_event)
+        else:
+            data = trace_memory(seconds, options.get('top', 30), options.get('frames', 10), stop_event)
+        _write_result(meta['profile_id'], {**meta, 'status': 'done', 'finished_at': datetime.now().isoformat(), 'result': data})
+        logger.info(f"{kind} 剖析完成: id={meta['profile_id']}")
+    except Exception as e:
+        logger.error(f"{kind} 剖析失败: {str(e)}", exc_info=True)
+        _write_result(meta['profile_id'], {**meta, 'status': 'failed', 'error': str(e)})
+    finally:
+        with _active_lock:
+            _active = None
+
+
+def stop_active_profile() -> bool:
+    """提前结束当前 worker 正在运行的剖析（已采集的数据照常写出）"""
+    with _active_lock:
+        if _active is None:
+            return False
+        _active['stop_event'].set()
+        return True
+
+
+def load_profile(profile_id: str) -> Optional[dict[str, Any]]:
+    """读取剖析结果（任一 worker 均可读取）"""
+    if not profile_id.isalnum():
+        return None
+    try:
+        with open(_result_path(profile_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def folded_stacks(samples: dict[str, int]) -> str:
+    """折叠栈文本：每行 "栈;帧 次数"，可直接输入 flamegraph.pl"""
+    return ''.join(f"{stack} {count}\n" for stack, count in samples.items())
@@ -0,0 +1,225 @@
+"""
+SQL 语句统计与查询预算
+
+通过 SQLAlchemy 事件统计每个请求执行的语句数、影响行数和耗时，并识别：
+- N+1 模式：同一条语句模板在一个请求内以不同参数执行多次
+- 重复查询：完全相同的语句和参数在一个请求内执行多次
+
+超出查询预算（QUERY_BUDGET）时按 QUERY_BUDGET_MODE 处理：
+off 不检查、warn 记录警告、raise 抛出 QueryBudgetExceeded（用于压测和测试）。
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Generator, Optional
+
+from config import Config
+from logger import logger
+from tracing import record_span
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """请求执行的 SQL 语句数超出预算"""
+
+
+class QueryStats:
+    """单个请求（或代码块）的 SQL 统计"""
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.statements = 0
+        self.rows = 0
+        self.duration = 0.0
+        self.templates: Counter = Counter()
+        self.identical: Counter = Counter()
+
+    def record(self, statement: str, parameters: Any, rowcount: int, duration: float) -> None:
+        self.statements += 1
+        self.duration += duration
+        if rowcount and rowcount > 0:
+            self.rows += rowcount
+        self.templates[statement] += 1
+        try:
+            self.identical[(statement, _fingerprint(parameters))] += 1
+        except Exception:
+            pass
+
+    def n_plus_one(self, threshold: Optional[int] = None) -> list[tuple[str, int]]:
+        """同一模板以不同参数执行次数达到阈值的语句"""
+        threshold = threshold or Config.N_PLUS_ONE_THRESHOLD
+        distinct_params = Counter(statement for statement, _ in self.identical)
+        return [
+            (statement, count) for statement, count in self.templates.items()
+            if count >= threshold and distinct_params[statement] > 1
+        ]
+
+    def repeated(self) -> list[tuple[str, int]]:
+        """完全相同的语句和参数被执行多次"""
+        return [(statement, count) for (statement, _), count in self.identical.items() if count > 1]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'label': self.label,
+            'statements': self.statements,
+            'rows': self.rows,
+            'duration_ms': round(self.duration * 1000, 2),
+            'n_plus_one': [{'statement': _short(s), 'count': c} for s, c in self.n_plus_one()],
+            'repeated': [{'statement': _short(s), 'count': c} for s, c in self.repeated()]
+        }
+
+
+def _fingerprint(parameters: Any, limit: int = 256) -> int:
+    """
+    参数指纹：只保存哈希值，不对每条语句生成和保存完整的 repr（请求体等大参数）
+
+    dict（命名参数）按键值对、list（executemany）逐组计算；含不可哈希的值时退回截断后的 repr
+    """
+    if isinstance(parameters, dict):
+        parameters = tuple(parameters.items())
+    elif isinstance(parameters, list):
+        parameters = tuple(_fingerprint(group, limit) for group in parameters)
+    try:
+        return hash(parameters)
+    except TypeError:
+        return hash(repr(parameters)[:limit])
+
+
+def _short(statement: str, limit: int = 200) -> str:
+    return ' '.join(statement.split())[:limit]
+
+
+class _Totals:
+    """进程级累计统计（压测时通过 /_bench/stats 读取）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.statements = 0
+        self.rows = 0
+        self.duration = 0.0
+        self.max_statements = 0
+        self.budget_violations = 0
+        self.n_plus_one_flags = 0
+        self.repeated_flags = 0
+
+    def add(self, stats: QueryStats, over_budget: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.statements += stats.statements
+            self.rows += stats.rows
+            self.duration += stats.duration
+            self.max_statements = max(self.max_statements, stats.statements)
+            self.budget_violations += int(over_budget)
+            self.n_plus_one_flags += int(bool(stats.n_plus_one()))
+            self.repeated_flags += int(bool(stats.repeated()))
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'statements': self.statements,
+                'rows': self.rows,
+                'duration_ms': round(self.duration * 1000, 2),
+                'max_statements': self.max_statements,
+                'budget_violations': self.budget_violations,
+                'n_plus_one_flags': self.n_plus_one_flags,
+                'repeated_flags': self.repeated_flags
+            }
+
+
+totals = _Totals()
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar('current_query_stats', default=None)
+
+
+def start(label: str = '') -> QueryStats:
+    """开始统计当前上下文的 SQL"""
+    stats = QueryStats(label)
+    _current_stats.set(stats)
+    return stats
+
+
+def current() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+def finish(budget: Optional[int] = None, mode: Optional[str] = None) -> Optional[QueryStats]:
+    """
+    结束统计并检查预算
+
+    Args:
+        budget: 语句数上限，默认 Config.QUERY_BUDGET（0 表示不限制）
+        mode: off / warn / raise，默认 Config.QUERY_BUDGET_MODE
+
+    Raises:
+        QueryBudgetExceeded: mode 为 raise 且超出预算
+    """
+    stats = _current_stats.get()
+    _current_stats.set(None)
+    if stats is None:
+        return None
+
+    budget = Config.QUERY_BUDGET if budget is None else budget
+    mode = (mode or Config.QUERY_BUDGET_MODE).lower()
+    over_budget = bool(budget) and stats.statements > budget
+    totals.add(stats, over_budget)
+
+    if mode == 'off':
+        return stats
+
+    for statement, count in stats.n_plus_one():
+        logger.warning(f"疑似 N+1 查询: {stats.label} 执行 {count} 次: {_short(statement)}")
+    for statement, count in stats.repeated():
+        logger.info(f"重复查询: {stats.label} 相同语句和参数执行 {count} 次: {_short(statement)}")
+
+    if over_budget:
+        message = f"SQL 语句数超出预算: {stats.label} 执行 {stats.statements} 条，预算 {budget} 条"
+        if mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return stats
+
+
+@contextmanager
+def track(label: str = '', budget: Optional[int] = None, mode: Optional[str] = None) -> Generator[QueryStats, None, None]:
+    """统计代码块内的 SQL，退出时检查预算"""
+    token_stats = _current_stats.get()
+    stats = start(label)
+    try:
+        yield stats
+    finally:
+        finish(budget, mode)
+        _current_stats.set(token_stats)
+
+
+def instrument_engine(engine) -> None:
+    """监听语句执行：更新当前统计并记录追踪 span"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_query_start')
+        if not starts:
+            return
+        start_time = starts.pop()
+        duration = time.perf_counter() - start_time
+
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.record(statement, parameters, getattr(cursor, 'rowcount', -1), duration)
+        record_span('db', start_time, duration, _short(statement))
+
+    @event.listens_for(engine, 'handle_error')
+    def _on_error(context):
+        # 执行失败时不会触发 after_cursor_execute，清理计时栈
+        if context.connection is not None:
+            context.connection.info.pop('_query_start', None)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+流量回放工具
+
+从文件备份（webhooks_data/）或数据库（raw_payload + headers）读取一个时间窗口内的真实流量，
+按原始到达间隔（可按倍速缩放）用多个并发发送者重放到目标实例，
+并对比回放结果与原始记录的去重和转发决策。
+
+    # 从数据库回放 10:00~10:30 的告警风暴，2 倍速
+    python replay_traffic.py --from-db --start 2025-11-07T10:00:00 --end 2025-11-07T10:30:00 \\
+        --target http://127.0.0.1:8100 --speed 2
+
+    # 从文件备份回放
+    python replay_traffic.py --from-files webhooks_data --target http://127.0.0.1:8100 --speed 10
+
+注意：目标实例应使用独立的空数据库，否则所有回放请求都会被判定为重复。
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Optional
+
+import requests
+
+from bench_ingest import percentile
+
+# 回放时不转发的请求头（由 HTTP 客户端重新生成）
+_SKIP_HEADERS = {'host', 'content-length', 'connection', 'transfer-encoding', 'accept-encoding', 'keep-alive'}
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _in_window(ts: datetime, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    return (start is None or ts >= start) and (end is None or ts < end)
+
+
+def load_from_files(
+    data_dir: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    source: Optional[str] = None
+) -> list[dict[str, Any]]:
+    """从 save_webhook_to_file 生成的备份文件加载流量"""
+    records = []
+    for filename in os.listdir(data_dir):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(data_dir, filename), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"跳过无法读取的文件 {filename}: {e}")
+            continue
+
+        ts = _parse_time(data.get('timestamp'))
+        if ts is None or not _in_window(ts, start, end):
+            continue
+        if source and data.get('source') != source:
+            continue
+
+        raw = data.get('raw_payload')
+        if raw is None:
+            raw = json.dumps(data.get('parsed_data'), ensure_ascii=False)
+        analysis = data.get('ai_analysis') or {}
+        records.append({
+            'ref': filename,
+            'timestamp': ts,
+            'source': data.get('source') or 'unknown',
+            'headers': data.get('headers') or {},
+            'body': raw.encode('utf-8'),
+            'original': {
+                # 文件备份不记录去重和转发结果，只能对比重要性
+                'is_duplicate': None,
+                'forward_status': None,
+                'importance': analysis.get('importance')
+            }
+        })
+    records.sort(key=lambda r: r['timestamp'])
+    return records
+
+
+def load_from_db(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    source: Optional[str] = None,
+    limit: Optional[int] = None
+) -> list[dict[str, Any]]:
+    """从数据库加载流量（使用 DATABASE_URL）"""
+    from models import WebhookEvent, session_scope
+
+    records = []
+    with session_scope() as session:
+        query = session.query(WebhookEvent)
+        if start is not None:
+            query = query.filter(WebhookEvent.timestamp >= start)
+        if end is not None:
+            query = query.filter(WebhookEvent.timestamp < end)
+        if source:
+            query = query.filter(WebhookEvent.source == source)
+        query = query.order_by(WebhookEvent.timestamp.asc(), WebhookEvent.id.asc())
+        if limit:
+            query = query.limit(limit)
+
+        for event in query.yield_per(500):
+            raw = event.get_field('raw_payload')
+            if raw is None:
+                raw = json.dumps(event.get_field('parsed_data'), ensure_ascii=False)
+            records.append({
+                'ref': event.id,
+                'timestamp': event.timestamp,
+                'source': event.source,
+                'headers': event.get_field('headers') or {},
+                'body': raw.encode('utf-8'),
+                'original': {
+                    'is_duplicate': bool(event.is_duplicate),
+                    'forward_status': event.forward_status,
+                    'importance': event.importance
+                }
+            })
+    return records
+
+
+def forward_decision(status: Optional[str]) -> Optional[str]:
+    """将转发状态归一化为决策：forward / skip（未知返回 None）"""
+    if status in (None, 'pending', 'unknown'):
+        return None
+    return 'skip' if status == 'skipped' else 'forward'
+
+
+class Replayer:
+    """按原始到达间隔并发重放请求"""
+
+    def __init__(self, target: str, speed: float, concurrency: int):
+        self.target = target.rstrip('/')
+        self.speed = speed
+        self.concurrency = concurrency
+        self._queue: queue.Queue = queue.Queue(maxsize=concurrency * 4)
+        self._lock = threading.Lock()
+        self.results: list[dict[str, Any]] = []
+
+    def _send(self, session: requests.Session, record: dict[str, Any]) -> dict[str, Any]:
+        headers = {k: v for k, v in record['headers'].items() if k.lower() not in _SKIP_HEADERS}
+        headers.setdefault('Content-Type', 'application/json')
+        started = time.perf_counter()
+        try:
+            response = session.post(
+                f"{self.target}/webhook/{record['source']}",
+                data=record['body'],
+                headers=headers,
+                timeout=300
+            )
+            body = response.json() if response.headers.get('Content-Type', '').startswith('application/json') else {}
+            return {
+                'status_code': response.status_code,
+                'latency': time.perf_counter() - started,
+                'is_duplicate': body.get('is_duplicate'),
+                'forward_status': body.get('forward_status'),
+                'importance': (body.get('ai_analysis') or {}).get('importance')
+            }
+        except requests.RequestException as e:
+            return {'status_code': None, 'latency': time.perf_counter() - started, 'error': type(e).__name__}
+
+    def _worker(self) -> None:
+        session = requests.Session()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            scheduled_at, record = item
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lag = max(0.0, time.perf_counter() - scheduled_at)
+            result = self._send(session, record)
+            result['lag'] = lag
+            with self._lock:
+                self.results.append({'record': record, 'replay': result})
+
+    def run(self, records: list[dict[str, Any]]) -> float:
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+
+        started = time.perf_counter()
+        first_ts = records[0]['timestamp'] if records else None
+        for record in records:
+            offset = (record['timestamp'] - first_ts).total_seconds() / self.speed
+            self._queue.put((started + offset, record))
+
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - started
+
+
+def compare_results(results: list[dict[str, Any]]) -> dict[str, Any]:
+    """对比回放结果与原始记录的去重、转发和重要性判断"""
+    checks = {name: Counter() for name in ('dedup', 'forward', 'importance')}
+    mismatches = []
+
+    for item in results:
+        original, replay = item['record']['original'], item['replay']
+        if replay.get('status_code') != 200:
+            continue
+
+        pairs = {
+            'dedup': (original['is_duplicate'], replay.get('is_duplicate')),
+            'forward': (forward_decision(original['forward_status']), forward_decision(replay.get('forward_status'))),
+            'importance': (original['importance'], replay.get('importance'))
+        }
+        for name, (expected, actual) in pairs.items():
+            if expected is None:
+                checks[name]['unknown'] += 1
+            elif expected == actual:
+                checks[name]['match'] += 1
+            else:
+                checks[name]['mismatch'] += 1
+                mismatches.append({'ref': item['record']['ref'], 'check': name, 'original': expected, 'replay': actual})
+
+    return {'checks': {k: dict(v) for k, v in checks.items()}, 'mismatches': mismatches}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Webhook 流量回放')
+    origin = parser.add_mutually_exclusive_group(required=True)
+    origin.add_argument('--from-files', metavar='DIR', help='从文件备份目录读取')
+    origin.add_argument('--from-db', action='store_true', help='从数据库读取（DATABASE_URL）')
+    parser.add_argument('--start', help='窗口开始时间（ISO 格式，含）')
+    parser.add_argument('--end', help='窗口结束时间（ISO 格式，不含）')
+    parser.add_argument('--source', help='只回放指定来源')
+    parser.add_argument('--limit', type=int, help='最多回放条数')
+    parser.add_argument('--target', required=True, help='目标实例地址')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放倍速（2 表示间隔缩短一半）')
+    parser.add_argument('--concurrency', type=int, default=32, help='并发发送者数量')
+    parser.add_argument('--output', help='结果 JSON 输出路径')
+    args = parser.parse_args()
+
+    start, end = _parse_time(args.start), _parse_time(args.end)
+    if args.from_db:
+        records = load_from_db(start, end, args.source, args.limit)
+    else:
+        records = load_from_files(args.from_files, start, end, args.source)
+        if args.limit:
+            records = records[:args.limit]
+
+    if not records:
+        print("时间窗口内没有可回放的流量")
+        return 1
+
+    span = (records[-1]['timestamp'] - records[0]['timestamp']).total_seconds()
+    print(f"加载 {len(records)} 条请求，原始时间跨度 {span:.1f}s，"
+          f"按 {args.speed}x 回放预计 {span / args.speed:.1f}s")
+
+    replayer = Replayer(args.target, args.speed, args.concurrency)
+    elapsed = replayer.run(records)
+
+    latencies = [r['replay']['latency'] for r in replayer.results if r['replay'].get('status_code')]
+    status_codes = Counter(str(r['replay'].get('status_code') or r['replay'].get('error')) for r in replayer.results)
+    comparison = compare_results(replayer.results)
+
+    report = {
+        'requests': len(records),
+        'elapsed_seconds': round(elapsed, 3),
+        'original_span_seconds': round(span, 3),
+        'speed': args.speed,
+        'status_codes': dict(status_codes),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2)
+        },
+        'schedule_lag_p99_ms': round(percentile([r['replay']['lag'] for r in replayer.results], 99) * 1000, 2),
+        **comparison
+    }
+
+    print("\n" + "=" * 60)
+    print("回放结果")
+    print("=" * 60)
+    print(f"耗时: {report['elapsed_seconds']}s  状态码: {report['status_codes']}")
+    print(f"延迟(ms): {report['latency_ms']}  调度延迟 p99: {report['schedule_lag_p99_ms']}ms")
+    for name, counts in report['checks'].items():
+        print(f"{name:<12} 一致 {counts.get('match', 0):>6}  不一致 {counts.get('mismatch', 0):>6}  "
+              f"无原始记录 {counts.get('unknown', 0):>6}")
+    for item in report['mismatches'][:20]:
+        print(f"  ✗ {item['check']}: ref={item['ref']} 原始={item['original']} 回放={item['replay']}")
+    if len(report['mismatches']) > 20:
+        print(f"  ... 共 {len(report['mismatches'])} 条不一致")
+    print("说明: 窗口内第一条告警的原始结果可能依赖窗口之前的告警，少量 dedup 不一致属正常")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+        print(f"\n结果已保存到 {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
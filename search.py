@@ -0,0 +1,210 @@
+"""
+Webhook 全文检索（/api/webhooks/search）
+
+检索文本保存在 webhook_events.search_text（写入时由 utils.build_search_text 生成），索引随写入增量维护：
+- PostgreSQL：to_tsvector('simple', search_text) 表达式上的 GIN 索引，ts_rank 排序
+- SQLite：FTS5 外部内容表 webhook_events_fts，由触发器在插入 / 更新 / 删除时同步，bm25 排序
+
+两种后端都使用不做词干处理的分词（simple / unicode61），按空白或标点切分，适合 pod 名、实例 ID、
+规则名等标识符；连续的中文按一个词处理。多个关键词之间为 AND 关系。
+
+结果按相关度倒序（相同相关度按 ID 倒序），游标为上一页最后一条的 (相关度, id)，与列表接口一样是 keyset 分页，
+并可与列表接口的过滤条件（来源、时间范围等）组合。
+"""
+import base64
+from typing import Any, Optional
+
+from sqlalchemy import Float, Integer, text, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import load_only
+
+from logger import logger
+from models import WebhookEvent, attach_references, load_columns, session_scope
+from utils import apply_filters, build_search_text
+
+# PostgreSQL 检索表达式（查询中的表达式必须与索引定义完全一致才能使用 GIN 索引）
+_PG_VECTOR = "to_tsvector('simple', coalesce(webhook_events.search_text, ''))"
+
+_PG_INDEX_DDL = f"CREATE INDEX IF NOT EXISTS idx_search_text_fts ON webhook_events USING GIN ({_PG_VECTOR})"
+
+_PG_RANKED = f"""
+    SELECT webhook_events.id AS id, ts_rank({_PG_VECTOR}, query)::float8 AS score
+    FROM webhook_events, websearch_to_tsquery('simple', :q) AS query
+    WHERE {_PG_VECTOR} @@ query
+"""
+
+_SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS webhook_events_fts USING fts5(
+        search_text, content='webhook_events', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS webhook_events_fts_insert AFTER INSERT ON webhook_events BEGIN
+        INSERT INTO webhook_events_fts(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS webhook_events_fts_delete AFTER DELETE ON webhook_events BEGIN
+        INSERT INTO webhook_events_fts(webhook_events_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS webhook_events_fts_update AFTER UPDATE OF search_text ON webhook_events BEGIN
+        INSERT INTO webhook_events_fts(webhook_events_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        INSERT INTO webhook_events_fts(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+)
+
+_SQLITE_RANKED = """
+    SELECT rowid AS id, -bm25(webhook_events_fts) AS score
+    FROM webhook_events_fts
+    WHERE webhook_events_fts MATCH :q
+"""
+
+
+class SearchUnavailable(Exception):
+    """当前数据库不支持全文检索"""
+
+
+def ensure_search_index(engine: Engine) -> Optional[str]:
+    """
+    创建全文检索索引（幂等，init_db 和 migrate_db 调用）
+
+    Returns:
+        str | None: 使用的后端（postgresql / fts5），不支持时返回 None
+    """
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text(_PG_INDEX_DDL))
+        return 'postgresql'
+
+    if dialect == 'sqlite':
+        with engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'webhook_events_fts'"
+            )).scalar()
+            try:
+                for statement in _SQLITE_DDL:
+                    conn.execute(text(statement))
+            except Exception as e:
+                # SQLite 未编译 FTS5 时检索接口返回 501，不影响其他功能
+                logger.warning(f"创建 FTS5 全文检索索引失败: {str(e)}")
+                return None
+            if not exists:
+                # 新建的外部内容表需要从已有数据重建一次，之后由触发器增量维护
+                conn.execute(text("INSERT INTO webhook_events_fts(webhook_events_fts) VALUES ('rebuild')"))
+        return 'fts5'
+
+    return None
+
+
+def backfill_search_text(batch_size: int = 500) -> int:
+    """
+    为升级前写入的事件生成检索文本（migrate_db 调用），按 ID 分批处理
+
+    Returns:
+        int: 更新的事件数
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        with session_scope() as session:
+            events = session.query(WebhookEvent).options(
+                load_only(*load_columns(('id', 'parsed_data', 'ai_analysis')))
+            ).filter(
+                WebhookEvent.id > last_id, WebhookEvent.search_text.is_(None)
+            ).order_by(WebhookEvent.id).limit(batch_size).all()
+            if not events:
+                return updated
+            attach_references(session, events, ('parsed_data', 'ai_analysis'))
+            for event in events:
+                event.search_text = build_search_text(event.get_field('parsed_data'), event.get_field('ai_analysis'))
+            last_id = events[-1].id
+            updated += len(events)
+        logger.info(f"已生成 {updated} 条事件的检索文本")
+
+
+def _fts5_query(q: str) -> str:
+    """把用户输入转换为 FTS5 查询：按空白切分，每段作为短语（避免 - : * 等被解析为语法），段之间为 AND"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def encode_search_cursor(score: float, webhook_id: int) -> str:
+    raw = f"{score!r}|{webhook_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, int]:
+    """
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        score, _, webhook_id = raw.partition('|')
+        return float(score), int(webhook_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("cursor 无效") from None
+
+
+def search_webhooks(
+    q: str,
+    page_size: int = 20,
+    cursor: Optional[str] = None,
+    fields: Optional[tuple[str, ...]] = None,
+    filters: Optional[dict[str, Any]] = None
+) -> tuple[list[dict], Optional[str]]:
+    """
+    全文检索
+
+    Args:
+        q: 关键词（多个关键词之间为 AND）
+        page_size: 每页数量
+        cursor: 上一页返回的 next_cursor
+        fields: 只查询并返回这些字段（见 utils.resolve_fields），None 表示全部字段
+        filters: 过滤条件（见 utils.resolve_filters）
+
+    Returns:
+        tuple: (webhook 数据列表（每条附带相关度 score）, 下一页游标)
+
+    Raises:
+        ValueError: 关键词为空或游标无效
+        SearchUnavailable: 当前数据库不支持全文检索
+    """
+    if not q.strip():
+        raise ValueError("q 参数不能为空")
+    position = decode_search_cursor(cursor) if cursor else None
+
+    with session_scope() as session:
+        dialect = session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            ranked_sql, query_text = _PG_RANKED, q
+        elif dialect == 'sqlite':
+            ranked_sql, query_text = _SQLITE_RANKED, _fts5_query(q)
+        else:
+            raise SearchUnavailable(f"{dialect} 不支持全文检索")
+
+        ranked = text(ranked_sql).bindparams(q=query_text).columns(id=Integer, score=Float).subquery('ranked')
+        query = apply_filters(
+            session.query(WebhookEvent, ranked.c.score).join(ranked, ranked.c.id == WebhookEvent.id),
+            filters
+        )
+        if fields is not None:
+            query = query.options(load_only(*load_columns(fields), raiseload=True))
+        if position is not None:
+            query = query.filter(tuple_(ranked.c.score, WebhookEvent.id) < position)
+
+        try:
+            rows = query.order_by(ranked.c.score.desc(), WebhookEvent.id.desc()).limit(page_size).all()
+        except Exception as e:
+            if dialect == 'sqlite' and 'webhook_events_fts' in str(e):
+                raise SearchUnavailable("SQLite 全文检索索引不存在（需要 FTS5 支持）") from e
+            raise
+
+        attach_references(session, [event for event, _ in rows], fields)
+        webhooks = []
+        for event, score in rows:
+            webhook = event.to_dict(fields)
+            webhook['score'] = score
+            webhooks.append(webhook)
+
+        next_cursor = None
+        if len(rows) == page_size:
+            event, score = rows[-1]
+            next_cursor = encode_search_cursor(score, event.id)
+        return webhooks, next_cursor
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+启动耗时分析
+
+imports：在新的解释器中以 -X importtime 导入指定模块，按子系统（Web 框架、数据库、LLM SDK、
+指标、项目模块等）汇总导入耗时，相当于按子系统分组的 -X importtime。
+
+ready：启动被测服务并轮询 /ready，测量从进程启动到可以接收请求（worker 预热完成）的耗时。
+
+两个命令都可以指定目标值，超出时以非零状态退出（可用于 CI）：
+
+    python startup_profile.py imports                       # 默认分析 app 和 migrate_db
+    python startup_profile.py imports --module app --max-ms 800
+    python startup_profile.py ready --runs 3 --max-seconds 3
+    python startup_profile.py ready --server uvicorn
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from typing import Any, Optional
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 第三方包所属子系统（按顶层包名）
+SUBSYSTEMS = {
+    'web': ('flask', 'werkzeug', 'jinja2', 'markupsafe', 'itsdangerous', 'click', 'blinker'),
+    'database': ('sqlalchemy', 'psycopg2', 'asyncpg', 'aiosqlite', 'greenlet'),
+    'llm': ('openai', 'httpx', 'httpcore', 'anyio', 'sniffio', 'h11', 'pydantic', 'pydantic_core',
+            'annotated_types', 'typing_extensions', 'distro', 'jiter', 'tqdm', 'trio', 'json5'),
+    'http': ('requests', 'urllib3', 'charset_normalizer', 'idna', 'certifi'),
+    'metrics': ('prometheus_client',),
+    'logging': ('pythonjsonlogger',),
+    'concurrency': ('gevent', 'zope'),
+    'config': ('dotenv',),
+    'asgi': ('uvicorn',),
+}
+_PACKAGE_SUBSYSTEM = {package: name for name, packages in SUBSYSTEMS.items() for package in packages}
+_PROJECT_MODULES = {os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(_HERE, '*.py'))}
+
+
+def subsystem_of(module: str) -> str:
+    """模块所属子系统：项目模块、标准库、已知第三方子系统或 other"""
+    top = module.split('.')[0]
+    if top in _PROJECT_MODULES:
+        return 'project'
+    if top in _PACKAGE_SUBSYSTEM:
+        return _PACKAGE_SUBSYSTEM[top]
+    if top in sys.stdlib_module_names or top.startswith('_'):
+        return 'stdlib'
+    return 'other'
+
+
+def parse_importtime(output: str) -> list[tuple[str, int, int]]:
+    """解析 -X importtime 输出，返回 [(模块名, 自身耗时 us, 累计耗时 us)]"""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def profile_imports(module: str) -> dict[str, Any]:
+    """在新的解释器中导入模块并按子系统汇总耗时"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='0')
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=_HERE, env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+
+    entries = parse_importtime(result.stderr)
+    by_subsystem: dict[str, int] = defaultdict(int)
+    by_package: dict[str, int] = defaultdict(int)
+    for name, self_us, _ in entries:
+        by_subsystem[subsystem_of(name)] += self_us
+        by_package[name.split('.')[0]] += self_us
+
+    module_entry = next((e for e in reversed(entries) if e[0] == module), None)
+    return {
+        'module': module,
+        'import_ms': round(module_entry[2] / 1000, 2) if module_entry else None,
+        'interpreter_wall_ms': round(wall_ms, 2),
+        'modules_loaded': len(entries),
+        'subsystems_ms': {
+            name: round(us / 1000, 2)
+            for name, us in sorted(by_subsystem.items(), key=lambda item: item[1], reverse=True)
+        },
+        'top_packages_ms': {
+            name: round(us / 1000, 2)
+            for name, us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:10]
+        }
+    }
+
+
+def print_import_report(report: dict[str, Any]) -> None:
+    print(f"\n== import {report['module']}")
+    print(f"导入耗时: {report['import_ms']}ms  解释器总耗时: {report['interpreter_wall_ms']}ms  "
+          f"加载模块数: {report['modules_loaded']}")
+    print("按子系统（自身耗时）:")
+    for name, ms in report['subsystems_ms'].items():
+        print(f"  {name:<12} {ms:>9.2f}ms")
+    print("耗时最多的顶层包:")
+    for name, ms in report['top_packages_ms'].items():
+        print(f"  {name:<24} {ms:>9.2f}ms")
+
+
+def _server_command(server: str, port: int) -> list[str]:
+    if server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', '127.0.0.1', '--port', str(port)]
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+
+
+def measure_ready(server: str, port: int, timeout: float, env: dict[str, str]) -> Optional[float]:
+    """启动服务并轮询 /ready，返回从启动到返回 200 的秒数（超时返回 None）"""
+    url = f"http://127.0.0.1:{port}/ready"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        _server_command(server, port), cwd=_HERE, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"服务启动失败（退出码 {process.returncode}）")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.02)
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def cmd_imports(args: argparse.Namespace) -> int:
+    reports = [profile_imports(module) for module in args.module or ['app', 'migrate_db']]
+    for report in reports:
+        print_import_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.max_ms:
+        over = [r for r in reports if r['import_ms'] is not None and r['import_ms'] > args.max_ms]
+        if over:
+            for report in over:
+                print(f"\n✗ import {report['module']} 耗时 {report['import_ms']}ms，超出目标 {args.max_ms}ms")
+            return 1
+        print(f"\n✓ 所有模块导入耗时均未超出 {args.max_ms}ms")
+    return 0
+
+
+def cmd_ready(args: argparse.Namespace) -> int:
+    env = os.environ.copy()
+    env.update({
+        'PORT': str(args.port),
+        'DATABASE_URL': args.database_url,
+        'GUNICORN_WORKERS': str(args.workers),
+        'LOG_LEVEL': 'WARNING'
+    })
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+    timings = []
+    for run in range(args.runs):
+        elapsed = measure_ready(args.server, args.port, args.timeout, env)
+        if elapsed is None:
+            print(f"✗ 第 {run + 1} 次启动在 {args.timeout}s 内未就绪")
+            return 1
+        timings.append(elapsed)
+        print(f"第 {run + 1} 次: 启动到就绪 {elapsed:.3f}s")
+
+    median = statistics.median(timings)
+    print(f"\n{args.server}（{args.workers} worker）启动到就绪: "
+          f"中位数 {median:.3f}s  最快 {min(timings):.3f}s  最慢 {max(timings):.3f}s")
+
+    if args.max_seconds:
+        if median > args.max_seconds:
+            print(f"✗ 中位数超出目标 {args.max_seconds}s")
+            return 1
+        print(f"✓ 未超出目标 {args.max_seconds}s")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='启动耗时分析')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_imports = sub.add_parser('imports', help='按子系统汇总模块导入耗时')
+    p_imports.add_argument('--module', action='append', help='要分析的模块（可重复，默认 app 和 migrate_db）')
+    p_imports.add_argument('--max-ms', type=float, default=0, help='导入耗时目标（毫秒，0 表示不检查）')
+    p_imports.add_argument('--output', help='结果 JSON 输出路径')
+
+    p_ready = sub.add_parser('ready', help='测量服务从启动到就绪的耗时')
+    p_ready.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    p_ready.add_argument('--workers', type=int, default=1, help='gunicorn worker 数量')
+    p_ready.add_argument('--port', type=int, default=8190)
+    p_ready.add_argument('--database-url', default='sqlite:///startup_profile.db')
+    p_ready.add_argument('--runs', type=int, default=3)
+    p_ready.add_argument('--timeout', type=float, default=60, help='单次启动最长等待时间（秒）')
+    p_ready.add_argument('--max-seconds', type=float, default=0, help='启动到就绪耗时目标（秒，0 表示不检查）')
+
+    args = parser.parse_args()
+    if args.command == 'imports':
+        return cmd_imports(args)
+    return cmd_ready(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""测试冷存储归档（按天和来源分区导出、删除已导出事件、重复告警还原、查询下推和分页）"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from app import app
+from archive import archive_events, archive_status, query_archive
+from config import Config
+from models import WebhookEvent, session_scope
+from test_change_feed import _temporary_sqlite_db
+from utils import check_duplicate_alert, save_webhook_data
+
+_NOW = datetime(2026, 10, 19, 12, 0)
+
+
+def _save(source: str, importance: str, alert_hash: str, value: int = 90) -> int:
+    """保存一条告警；去重时间窗口内已有相同 alert_hash 的告警时保存为紧凑存储的重复告警"""
+    data = {'status': 'firing', 'alerts': [{'labels': {'alertname': 'HighCPU', 'pod': f'{source}-1'},
+                                            'annotations': {'description': f'CPU 使用率 {value}%'}}]}
+    is_duplicate, original = check_duplicate_alert(alert_hash)
+    webhook_id, _, _, _ = save_webhook_data(
+        data, source, json.dumps(data, indent=2).encode('utf-8'), {'Content-Type': 'application/json'},
+        '127.0.0.1', {'importance': importance, 'summary': 'CPU 过高'},
+        alert_hash=alert_hash, is_duplicate=is_duplicate, original_event=original
+    )
+    return webhook_id
+
+
+def _backdate(days_ago: dict[int, float]) -> None:
+    """全部保存完成后再修改接收时间（先修改会使原始告警超出去重时间窗口）"""
+    with session_scope() as session:
+        for webhook_id, days in days_ago.items():
+            session.get(WebhookEvent, webhook_id).timestamp = _NOW - timedelta(days=days)
+
+
+def _assert_compact(webhook_id: int) -> None:
+    with session_scope() as session:
+        assert session.get(WebhookEvent, webhook_id).is_compact(), webhook_id
+
+
+def _fixture() -> dict[str, int]:
+    """两天、两个来源的过期事件（含一条紧凑存储的重复告警）和一条未过期事件"""
+    ids = {
+        'old_prom_high': _save('prometheus', 'high', 'hash-1'),
+        'old_prom_low': _save('prometheus', 'low', 'hash-2'),
+        'old_grafana': _save('grafana', 'medium', 'hash-3'),
+        'older_prom': _save('prometheus', 'high', 'hash-4'),
+        'recent': _save('prometheus', 'high', 'hash-5'),
+        'old_duplicate': _save('prometheus', 'high', 'hash-1', value=97),
+    }
+    _backdate({ids['old_prom_high']: 40, ids['old_prom_low']: 40.1, ids['old_grafana']: 40.2,
+               ids['older_prom']: 41, ids['recent']: 1, ids['old_duplicate']: 39.9})
+    _assert_compact(ids['old_duplicate'])
+    return ids
+
+
+def test_archive_and_query():
+    """过期事件按天和来源写入 Parquet 后删除，内容与数据库中一致，查询按分区和行组统计过滤"""
+    print("=" * 60)
+    print("测试归档和查询")
+    print("=" * 60)
+
+    client = app.test_client()
+    saved = (Config.ARCHIVE_DIR, Config.COMPACT_DUPLICATES)
+    try:
+        with _temporary_sqlite_db(), tempfile.TemporaryDirectory() as directory:
+            Config.ARCHIVE_DIR, Config.COMPACT_DUPLICATES = directory, True
+            ids = _fixture()
+            before = {i: client.get(f'/api/webhooks/{i}').get_json()['data'] for i in ids.values()}
+            assert archive_events(days=30, now=_NOW, dry_run=True)['archived'] == 5
+
+            result = archive_events(days=30, now=_NOW)
+            assert result['archived'] == 5 and result['deleted'] == 5 and result['days'] == 2, result
+            with session_scope() as session:
+                assert [event.id for event in session.query(WebhookEvent)] == [ids['recent']]
+            partitions = [(entry['day'], entry['source'], entry['events']) for entry in archive_status()]
+            assert partitions == [
+                ('2026-09-08', 'prometheus', 1), ('2026-09-09', 'grafana', 1), ('2026-09-09', 'prometheus', 3)
+            ], partitions
+            assert all(name.endswith('.parquet') for _, _, names in os.walk(directory) for name in names)
+
+            # 全部字段与归档前的详情一致（紧凑存储的重复告警已还原为完整内容）
+            archived, _, _ = query_archive(limit=10)
+            assert {w['id']: w for w in archived} == {i: before[i] for i in ids.values() if i != ids['recent']}
+
+            # 不带过滤条件时只读取最近一天的文件就能凑满一页
+            webhooks, next_cursor, files = query_archive(limit=2)
+            assert [w['id'] for w in webhooks] == [ids['old_duplicate'], ids['old_prom_high']] and next_cursor
+            assert files == 2
+
+            # 按来源、重要性和时间范围过滤：只扫描对应日期和来源的文件
+            filters = {'source': 'prometheus', 'importance': 'high',
+                       'start': datetime(2026, 9, 9), 'end': datetime(2026, 9, 10)}
+            webhooks, _, files = query_archive(filters, ('id', 'importance'))
+            assert webhooks == [{'id': ids['old_duplicate'], 'importance': 'high'},
+                                {'id': ids['old_prom_high'], 'importance': 'high'}], webhooks
+            assert files == 1
+
+            # 接口分页
+            response = client.get('/api/archive/webhooks?fields=summary&page_size=2&source=prometheus').get_json()
+            first = [w['id'] for w in response['data']]
+            cursor = response['pagination']['next_cursor']
+            response = client.get(f'/api/archive/webhooks?fields=summary&page_size=2&source=prometheus&cursor={cursor}')
+            second = [w['id'] for w in response.get_json()['data']]
+            assert first + second == [ids['old_duplicate'], ids['old_prom_high'], ids['old_prom_low'], ids['older_prom']]
+            assert response.get_json()['pagination']['next_cursor'] is None
+            assert client.get('/api/archive/webhooks?label.pod=x').status_code == 400
+    finally:
+        Config.ARCHIVE_DIR, Config.COMPACT_DUPLICATES = saved
+    print("✓ 5 条过期事件写入 3 个分区后删除，查询结果与归档前一致")
+
+
+def test_archive_keeps_duplicates_of_archived_originals():
+    """原始告警先于重复告警被删除时，重复告警先还原为完整副本（跨天归档或仍留在数据库中）"""
+    print("\n测试归档前还原重复告警")
+
+    client = app.test_client()
+    saved = (Config.ARCHIVE_DIR, Config.COMPACT_DUPLICATES)
+    try:
+        with _temporary_sqlite_db(), tempfile.TemporaryDirectory() as directory:
+            Config.ARCHIVE_DIR, Config.COMPACT_DUPLICATES = directory, True
+            # 原始告警和重复告警在不同的归档日（09-08 21:36 和 09-09 02:24）
+            cross_day = (_save('prometheus', 'high', 'hash-x'), _save('prometheus', 'high', 'hash-x', value=97))
+            # 原始告警被归档，重复告警未过期
+            kept = (_save('grafana', 'high', 'hash-y'), _save('grafana', 'high', 'hash-y', value=97))
+            _backdate({cross_day[0]: 40.6, cross_day[1]: 40.4, kept[0]: 30.1, kept[1]: 29.9})
+            _assert_compact(cross_day[1])
+            _assert_compact(kept[1])
+            before = {i: client.get(f'/api/webhooks/{i}').get_json()['data'] for i in cross_day + kept}
+            assert before[cross_day[1]]['raw_payload'] and before[kept[1]]['parsed_data']
+
+            result = archive_events(days=30, now=_NOW)
+            assert result['archived'] == 3 and result['days'] == 3, result
+            archived = {w['id']: w for w in query_archive(limit=10)[0]}
+            assert archived == {i: before[i] for i in (*cross_day, kept[0])}
+
+            with session_scope() as session:
+                assert session.get(WebhookEvent, kept[0]) is None
+                assert not session.get(WebhookEvent, kept[1]).is_compact()
+            assert client.get(f'/api/webhooks/{kept[1]}').get_json()['data'] == before[kept[1]]
+    finally:
+        Config.ARCHIVE_DIR, Config.COMPACT_DUPLICATES = saved
+    print("✓ 跨天归档和仍留在数据库中的重复告警内容不变")
+
+
+if __name__ == '__main__':
+    try:
+        test_archive_and_query()
+        test_archive_keeps_duplicates_of_archived_originals()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
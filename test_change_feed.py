@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""测试增量查询（since_id / updated_since）和管理页面推送（/api/webhooks/stream）"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import models
+from app import app
+from change_feed import ChangeFeed, feed, format_cursor, parse_cursor
+from config import Config
+from models import WebhookEvent, init_db, session_scope
+
+
+@contextmanager
+def _temporary_sqlite_db():
+    """测试期间切换到临时 SQLite 数据库"""
+    saved = (Config.DATABASE_URL, models._engine, models._session_factory)
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    Config.DATABASE_URL = f'sqlite:///{path}'
+    models._engine = models._session_factory = None
+    try:
+        init_db()
+        yield
+    finally:
+        models.get_engine().dispose()
+        Config.DATABASE_URL, models._engine, models._session_factory = saved
+        os.remove(path)
+
+
+def _insert_events(count: int) -> list[int]:
+    with session_scope() as session:
+        events = [WebhookEvent(source='test', raw_payload='{}', parsed_data={}) for _ in range(count)]
+        session.add_all(events)
+        session.flush()
+        return [event.id for event in events]
+
+
+def _bump_duplicate_count(webhook_id: int) -> None:
+    with session_scope() as session:
+        event = session.get(WebhookEvent, webhook_id)
+        event.duplicate_count += 1
+        event.updated_at = datetime.now() + timedelta(milliseconds=10)
+
+
+def test_incremental_api():
+    """since_id 返回新事件，updated_since 返回之后更新过的事件"""
+    print("=" * 60)
+    print("测试增量查询")
+    print("=" * 60)
+
+    client = app.test_client()
+    with _temporary_sqlite_db():
+        first, second, third = _insert_events(3)
+
+        result = client.get(f'/api/webhooks?since_id={first}&fields=summary').get_json()
+        assert [w['id'] for w in result['data']] == [second, third], result
+        assert result['changes']['since_id'] == third
+        assert 'raw_payload' not in result['data'][0]
+        updated_since = result['changes']['updated_since']
+
+        _bump_duplicate_count(first)
+        result = client.get(f'/api/webhooks?since_id={third}&updated_since={updated_since}').get_json()
+        assert [(w['id'], w['duplicate_count']) for w in result['data']] == [(first, 2)], result
+
+        result = client.get(f'/api/webhooks?since_id={first}&page_size=1').get_json()
+        assert [w['id'] for w in result['data']] == [second] and result['changes']['has_more']
+
+        # 过滤参数在增量模式下同样生效
+        assert client.get(f'/api/webhooks?since_id={first}&source=other').get_json()['data'] == []
+        result = client.get(f'/api/webhooks?since_id={first}&source=test').get_json()
+        assert [w['id'] for w in result['data']] == [second, third], result
+
+        assert client.get('/api/webhooks?updated_since=yesterday').status_code == 400
+    print("✓ 新事件、更新、过滤和分批查询正确")
+
+
+def _collect_changes(client, since_id: int, updated_since: datetime, page_size: int) -> list[int]:
+    """按返回的游标翻页直到取完，返回依次收到的事件 ID"""
+    received = []
+    params = f'since_id={since_id}&updated_since={updated_since.isoformat()}'
+    for _ in range(20):
+        result = client.get(f'/api/webhooks?{params}&fields=summary&page_size={page_size}').get_json()
+        received += [w['id'] for w in result['data']]
+        changes = result['changes']
+        params = f"since_id={changes['since_id']}&updated_since={changes['updated_since']}"
+        if not changes['has_more']:
+            return received
+    raise AssertionError(f"增量查询没有结束: {received}")
+
+
+def test_incremental_batches():
+    """变化超过 page_size 时分批返回，较早更新的事件不会因游标推进而丢失"""
+    print("\n测试增量查询分批")
+
+    client = app.test_client()
+    with _temporary_sqlite_db():
+        ids = _insert_events(4)
+        base = datetime.now() + timedelta(seconds=1)
+        with session_scope() as session:
+            for webhook_id, seconds in zip(ids, (10, 10, 5, 5)):
+                session.get(WebhookEvent, webhook_id).updated_at = base + timedelta(seconds=seconds)
+        assert _collect_changes(client, ids[-1], base, 2) == [ids[2], ids[3], ids[0], ids[1]]
+
+        # 同一 updated_at 的更新超过 page_size 时一次返回
+        with session_scope() as session:
+            for webhook_id in ids:
+                session.get(WebhookEvent, webhook_id).updated_at = base + timedelta(seconds=20)
+        assert sorted(_collect_changes(client, ids[-1], base + timedelta(seconds=10), 2)) == ids
+
+        # 新事件和更新混合：新事件先于更新返回，全部取完
+        new_ids = _insert_events(3)
+        with session_scope() as session:
+            session.get(WebhookEvent, ids[0]).updated_at = base + timedelta(seconds=30)
+        received = _collect_changes(client, ids[-1], base + timedelta(seconds=20), 1)
+        assert received[:3] == new_ids and set(received) == set(new_ids) | {ids[0]}, received
+    print("✓ 分批查询不遗漏更新")
+
+
+def test_feed_broadcasts_changes():
+    """轮询只推送订阅之后的变化，回看窗口内同一变化只推送一次"""
+    print("\n测试变化广播")
+
+    saved_interval = Config.SSE_POLL_INTERVAL
+    Config.SSE_POLL_INTERVAL = 60  # 测试中手动调用 poll()
+    with _temporary_sqlite_db():
+        (existing,) = _insert_events(1)
+        broadcaster = ChangeFeed()
+        subscriber = broadcaster.subscribe()
+        try:
+            (new_id,) = _insert_events(1)
+            _bump_duplicate_count(existing)
+
+            assert broadcaster.poll() == 2
+            webhooks, cursor = subscriber.get_nowait()
+            assert sorted(w['id'] for w in webhooks) == [existing, new_id]
+            assert cursor[0] == new_id
+            assert parse_cursor(format_cursor(*cursor)) == cursor
+
+            assert broadcaster.poll() == 0
+            assert subscriber.empty()
+        finally:
+            broadcaster.unsubscribe(subscriber)
+            broadcaster.notify()
+            Config.SSE_POLL_INTERVAL = saved_interval
+    print("✓ 新事件和重复次数更新各推送一次")
+
+
+def test_stream_endpoint():
+    """sync worker 返回 503；支持长连接时按游标补发错过的变化"""
+    print("\n测试推送接口")
+
+    client = app.test_client()
+    assert client.get('/api/webhooks/stream').status_code == 503
+
+    saved = (Config.SSE_POLL_INTERVAL, Config.SSE_MAX_SECONDS)
+    Config.SSE_POLL_INTERVAL, Config.SSE_MAX_SECONDS = 60, 0  # 补发后立即结束连接
+    try:
+        with _temporary_sqlite_db():
+            first, second = _insert_events(2)
+            response = client.get(
+                f'/api/webhooks/stream?since_id={first}', environ_overrides={'wsgi.multithread': True}
+            )
+            body = response.get_data(as_text=True)
+            assert response.status_code == 200
+            assert response.mimetype == 'text/event-stream'
+            assert 'event: webhooks' in body and f'"id": {second}' in body, body
+            assert f'id: {second}|' in body
+            feed.notify()  # 连接已结束，轮询线程随之退出
+    finally:
+        Config.SSE_POLL_INTERVAL, Config.SSE_MAX_SECONDS = saved
+    print("✓ 推送接口补发正确")
+
+
+if __name__ == '__main__':
+    try:
+        test_incremental_api()
+        test_incremental_batches()
+        test_feed_broadcasts_changes()
+        test_stream_endpoint()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
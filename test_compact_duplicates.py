@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""测试重复告警紧凑存储（差异计算与还原、接口输出、已有数据压缩、标签过滤和过期前还原）"""
+
+import json
+import sys
+from datetime import datetime, timedelta
+
+from app import app
+from compact_duplicates import backfill
+from config import Config
+from models import WebhookEvent, session_scope
+from partitions import run_maintenance
+from payload_delta import build_delta, expand_field
+from test_change_feed import _temporary_sqlite_db
+from utils import check_duplicate_alert, save_webhook_data
+
+_HEADERS = {'Content-Type': 'application/json', 'User-Agent': 'Alertmanager/0.27.0'}
+
+
+def _alert(starts_at: str, value: int) -> dict:
+    return {
+        'status': 'firing',
+        'commonLabels': {'alertname': 'HighCPU', 'namespace': 'prod'},
+        'alerts': [{
+            'labels': {'alertname': 'HighCPU', 'namespace': 'prod', 'pod': 'api-1'},
+            'annotations': {'description': f'CPU 使用率 {value}%'},
+            'startsAt': starts_at
+        }]
+    }
+
+
+def _save(data: dict, is_duplicate: bool = False, original=None) -> int:
+    raw = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    webhook_id, _, _, _ = save_webhook_data(
+        data, 'prometheus', raw, _HEADERS, '127.0.0.1', {'importance': 'high', 'summary': 'CPU 过高'},
+        alert_hash='hash-cpu', is_duplicate=is_duplicate, original_event=original
+    )
+    return webhook_id
+
+
+def _save_pair() -> tuple[int, int, dict]:
+    """保存一条原始告警和一条紧凑存储的重复告警，返回 (原始 ID, 重复 ID, 重复告警内容)"""
+    original_id = _save(_alert('2026-10-19T08:00:00Z', 91))
+    _, original = check_duplicate_alert('hash-cpu')
+    duplicate = _alert('2026-10-19T08:05:00Z', 97)
+    return original_id, _save(duplicate, True, original), duplicate
+
+
+def test_delta_round_trip():
+    """请求体逐字节还原，解析后数据和请求头按差异还原，行上的值优先"""
+    print("=" * 60)
+    print("测试差异计算与还原")
+    print("=" * 60)
+
+    original_raw = json.dumps(_alert('2026-10-19T08:00:00Z', 91), indent=2)
+    raw = json.dumps(_alert('2026-10-19T08:05:00Z', 97), indent=2)
+    original = {'raw_payload': original_raw, 'headers': _HEADERS, 'parsed_data': json.loads(original_raw),
+                'ai_analysis': {'summary': 'CPU 过高'}}
+    headers = dict(_HEADERS, **{'X-Request-Id': 'abc'})
+    parsed = json.loads(raw)
+
+    delta, columns = build_delta(original_raw, _HEADERS, original['parsed_data'], raw, headers, parsed)
+    assert columns == {} and delta['parsed'] == '$raw', delta
+    assert len(json.dumps(delta)) < len(raw) / 2, delta
+    assert expand_field('raw_payload', delta, {}, original) == raw
+    assert expand_field('parsed_data', delta, {}, original) == parsed
+    assert expand_field('headers', delta, {}, original) == headers
+    assert expand_field('ai_analysis', delta, {'ai_analysis': {'summary': '重新分析'}}, original) == {'summary': '重新分析'}
+
+    # 解析后数据与请求体不一致时单独记录差异；原始告警不存在时无法还原的字段为 None
+    changed = dict(parsed, extra=[1, 2])
+    delta, _ = build_delta(original_raw, _HEADERS, original['parsed_data'], raw, headers, changed)
+    assert expand_field('parsed_data', delta, {}, original) == changed
+    assert expand_field('parsed_data', delta, {}, {}) is None
+    print("✓ 请求体逐字节还原，差异不到请求体的一半")
+
+
+def test_api_and_backfill():
+    """接口输出与完整存储一致；开启前写入的完整副本可通过 backfill 压缩"""
+    print("\n测试接口输出和已有数据压缩")
+
+    client = app.test_client()
+    saved = Config.COMPACT_DUPLICATES
+    try:
+        with _temporary_sqlite_db():
+            Config.COMPACT_DUPLICATES = False
+            _, full_id, _ = _save_pair()
+            Config.COMPACT_DUPLICATES = True
+            _, compact_id, duplicate = _save_pair()
+
+            with session_scope() as session:
+                event = session.get(WebhookEvent, compact_id)
+                assert event.is_compact() and event.parsed_data is None and event.headers is None
+                assert event.ai_analysis is None and event.raw_payload is None
+                assert session.get(WebhookEvent, full_id).delta is None
+
+            detail = client.get(f'/api/webhooks/{compact_id}').get_json()['data']
+            assert detail['parsed_data'] == duplicate and detail['headers'] == _HEADERS, detail
+            assert detail['raw_payload'] == json.dumps(duplicate, ensure_ascii=False, indent=2)
+            assert detail['ai_analysis']['summary'] == 'CPU 过高' and 'delta' not in detail
+
+            listed = {w['id']: w for w in client.get('/api/webhooks?fields=summary').get_json()['data']}
+            assert listed[compact_id]['ai_analysis']['summary'] == 'CPU 过高', listed[compact_id]
+            full = {w['id']: w for w in client.get('/api/webhooks').get_json()['data']}
+            assert full[compact_id]['parsed_data'] == duplicate
+
+            before = client.get(f'/api/webhooks/{full_id}').get_json()['data']
+            stats = backfill(dry_run=True)
+            assert stats['compacted'] == 1 and stats['bytes_after'] < stats['bytes_before'], stats
+            stats = backfill()
+            assert stats['compacted'] == 1 and backfill()['compacted'] == 0, stats
+            with session_scope() as session:
+                assert session.get(WebhookEvent, full_id).is_compact()
+            assert client.get(f'/api/webhooks/{full_id}').get_json()['data'] == before
+    finally:
+        Config.COMPACT_DUPLICATES = saved
+    print("✓ 详情、列表与完整存储一致，backfill 压缩后输出不变")
+
+
+def test_label_filter_and_retention():
+    """标签过滤按原始告警匹配紧凑存储的重复告警；原始告警过期前重复告警还原为完整副本"""
+    print("\n测试标签过滤和过期前还原")
+
+    client = app.test_client()
+    saved = Config.RETENTION_DAYS
+    try:
+        with _temporary_sqlite_db():
+            original_id, compact_id, duplicate = _save_pair()
+            ids = [w['id'] for w in client.get('/api/webhooks?label.pod=api-1').get_json()['data']]
+            assert sorted(ids) == [original_id, compact_id], ids
+            assert client.get('/api/webhooks?label.pod=api-2').get_json()['data'] == []
+
+            # 原始告警早于保留期，重复告警仍在保留期内
+            with session_scope() as session:
+                session.get(WebhookEvent, original_id).timestamp = datetime.now() - timedelta(days=8)
+                session.get(WebhookEvent, compact_id).timestamp = datetime.now() - timedelta(days=7, hours=-1)
+            Config.RETENTION_DAYS = 7
+            result = run_maintenance()
+            assert result['materialized'] == 1 and result['deleted'] == 1, result
+
+            with session_scope() as session:
+                event = session.get(WebhookEvent, compact_id)
+                assert not event.is_compact() and event.get_field('parsed_data') == duplicate
+            detail = client.get(f'/api/webhooks/{compact_id}').get_json()['data']
+            assert detail['raw_payload'] == json.dumps(duplicate, ensure_ascii=False, indent=2)
+            assert detail['ai_analysis']['summary'] == 'CPU 过高'
+    finally:
+        Config.RETENTION_DAYS = saved
+    print("✓ 标签过滤包含重复告警，保留策略不会丢失重复告警内容")
+
+
+if __name__ == '__main__':
+    try:
+        test_delta_round_trip()
+        test_api_and_backfill()
+        test_label_filter_and_retention()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""测试优雅停机（drain 状态下拒绝新 webhook、截断出站超时、AI 降级）"""
+
+import sys
+
+import drain
+from ai_analyzer import ai_unavailable_reason
+from app import app
+from config import Config
+
+
+def test_bounded_timeout():
+    """未进入 drain 时不改变超时，drain 期间截断到截止时间（不低于下限）"""
+    print("=" * 60)
+    print("测试 drain 超时截断")
+    print("=" * 60)
+
+    drain.reset()
+    assert drain.remaining() is None
+    assert drain.bounded_timeout(60) == 60
+
+    drain.begin_drain(5)
+    try:
+        assert drain.is_draining()
+        assert 4 < drain.bounded_timeout(60) <= 5
+        assert drain.bounded_timeout(1) == 1
+
+        drain.begin_drain(100)  # 重复调用不延长截止时间
+        assert drain.remaining() <= 5
+    finally:
+        drain.reset()
+
+    drain.begin_drain(0)
+    try:
+        assert drain.bounded_timeout(60) == drain._MIN_TIMEOUT
+    finally:
+        drain.reset()
+    print("✓ 超时截断正确")
+
+
+def test_ai_fallback_when_draining():
+    """剩余时间不足以完成 AI 调用时降级为规则分析"""
+    print("\n测试 drain 期间 AI 降级")
+
+    saved = (Config.ENABLE_AI_ANALYSIS, Config.OPENAI_API_KEY)
+    Config.ENABLE_AI_ANALYSIS, Config.OPENAI_API_KEY = True, 'test-key'
+    try:
+        assert ai_unavailable_reason() is None
+        drain.begin_drain(drain.MIN_AI_SECONDS + 10)
+        assert ai_unavailable_reason() is None
+        drain.reset()
+        drain.begin_drain(drain.MIN_AI_SECONDS / 2)
+        assert ai_unavailable_reason() == 'draining'
+    finally:
+        drain.reset()
+        Config.ENABLE_AI_ANALYSIS, Config.OPENAI_API_KEY = saved
+    print("✓ 剩余时间不足时降级原因为 draining")
+
+
+def test_rejects_new_webhooks_when_draining():
+    """drain 期间新 webhook 返回 503 + Retry-After，/ready 返回 503"""
+    print("\n测试 drain 期间拒绝新请求")
+
+    client = app.test_client()
+    drain.begin_drain(10)
+    try:
+        response = client.post('/webhook/test', json={'event': 'x'})
+        assert response.status_code == 503, response.status_code
+        assert response.headers.get('Retry-After')
+        assert response.get_json()['error'] == 'Service draining'
+
+        response = client.get('/ready')
+        assert response.status_code == 503
+        assert response.get_json()['status'] == 'draining'
+    finally:
+        drain.reset()
+    print("✓ 新 webhook 和就绪检查均返回 503")
+
+
+if __name__ == '__main__':
+    try:
+        test_bounded_timeout()
+        test_ai_fallback_when_draining()
+        test_rejects_new_webhooks_when_draining()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
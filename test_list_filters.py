@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""测试列表接口的服务端过滤和 keyset 游标分页"""
+
+import sys
+from datetime import datetime, timedelta
+
+from app import app
+from models import WebhookEvent, session_scope
+from test_change_feed import _temporary_sqlite_db
+
+_BASE_TIME = datetime(2026, 1, 1)
+
+
+def _insert_sample_events() -> None:
+    """60 条事件：3 个来源 × 3 种重要性组合，每 2 条共享同一接收时间（覆盖 timestamp 相同的翻页边界）"""
+    with session_scope() as session:
+        for i in range(60):
+            session.add(WebhookEvent(
+                source=('prometheus', 'grafana', 'custom')[i % 3],
+                importance=('high', 'medium', 'low')[(i // 3) % 3],
+                timestamp=_BASE_TIME + timedelta(minutes=i // 2),
+                alert_hash=f'hash-{i % 5}',
+                is_duplicate=1 if i % 4 == 0 else 0,
+                forward_status='success' if i % 2 else 'skipped',
+                raw_payload='{}',
+                parsed_data={}
+            ))
+
+
+def _walk_pages(client, query: str, page_size: int = 7) -> list[dict]:
+    """按 next_cursor 翻完所有页"""
+    webhooks, cursor = [], None
+    while True:
+        url = f'/api/webhooks?page_size={page_size}&fields=summary&count=exact&{query}'
+        result = client.get(url + (f'&cursor={cursor}' if cursor else '')).get_json()
+        assert result['success'], result
+        webhooks.extend(result['data'])
+        cursor = result['pagination']['next_cursor']
+        if not cursor:
+            assert result['pagination']['total'] == len(webhooks), result['pagination']
+            return webhooks
+
+
+def _expected_ids(**conditions) -> list[int]:
+    with session_scope() as session:
+        query = session.query(WebhookEvent).filter_by(**conditions)
+        events = query.order_by(WebhookEvent.timestamp.desc(), WebhookEvent.id.desc()).all()
+        return [event.id for event in events]
+
+
+def test_filters_with_keyset_pagination():
+    """各种过滤组合下逐页翻完的结果与直接查询一致，且不重不漏"""
+    print("=" * 60)
+    print("测试过滤 + keyset 分页")
+    print("=" * 60)
+
+    client = app.test_client()
+    with _temporary_sqlite_db():
+        _insert_sample_events()
+        cases = [
+            ('', {}),
+            ('source=prometheus', {'source': 'prometheus'}),
+            ('source=grafana&importance=high', {'source': 'grafana', 'importance': 'high'}),
+            ('alert_hash=hash-2&duplicate=false', {'alert_hash': 'hash-2', 'is_duplicate': 0}),
+            ('duplicate=true&forward_status=skipped', {'is_duplicate': 1, 'forward_status': 'skipped'}),
+        ]
+        for query, conditions in cases:
+            ids = [webhook['id'] for webhook in _walk_pages(client, query)]
+            assert ids == _expected_ids(**conditions), query
+            print(f"✓ {query or '无过滤'}: {len(ids)} 条")
+
+        start, end = _BASE_TIME + timedelta(minutes=5), _BASE_TIME + timedelta(minutes=10)
+        webhooks = _walk_pages(client, f'start={start.isoformat()}&end={end.isoformat()}', page_size=3)
+        assert len(webhooks) == 10
+        assert all(start.isoformat() <= w['timestamp'] < end.isoformat() for w in webhooks)
+        print("✓ 时间范围过滤（start 包含，end 不包含）")
+
+
+def test_cursor_compatibility_and_validation():
+    """旧版整数游标仍可用，无效参数返回 400"""
+    print("\n测试游标兼容和参数校验")
+
+    client = app.test_client()
+    with _temporary_sqlite_db():
+        _insert_sample_events()
+        first_page = client.get('/api/webhooks?page_size=5').get_json()
+        last_id = first_page['data'][-1]['id']
+        legacy = client.get(f'/api/webhooks?page_size=5&cursor={last_id}').get_json()
+        keyset = client.get(f"/api/webhooks?page_size=5&cursor={first_page['pagination']['next_cursor']}").get_json()
+        assert [w['id'] for w in legacy['data']] == [w['id'] for w in keyset['data']]
+        print("✓ 整数游标与 keyset 游标结果一致")
+
+        for query in ('importance=urgent', 'duplicate=maybe', 'start=yesterday', 'cursor=not-a-cursor', 'cursor=999999'):
+            response = client.get(f'/api/webhooks?{query}')
+            assert response.status_code == 400, query
+        print("✓ 无效参数返回 400")
+
+
+def test_label_filters():
+    """label.<name> 匹配任一告警同时包含全部指定标签的事件，可与其他过滤条件组合"""
+    print("\n测试告警标签过滤")
+
+    client = app.test_client()
+    with _temporary_sqlite_db():
+        with session_scope() as session:
+            for i in range(12):
+                alerts = [
+                    {'labels': {'namespace': ('prod', 'staging')[i % 2], 'severity': 'warning'}},
+                    {'labels': {'namespace': 'infra', 'severity': ('critical', 'info', 'warning')[i % 3]}},
+                ]
+                session.add(WebhookEvent(
+                    source=('prometheus', 'grafana')[i // 6], timestamp=_BASE_TIME + timedelta(minutes=i),
+                    raw_payload='{}', parsed_data={'alerts': alerts}
+                ))
+            session.add(WebhookEvent(source='custom', raw_payload='{}', parsed_data={'event': 'deploy'}))
+
+        cases = [
+            ('label.namespace=prod', 6),
+            ('label.namespace=infra&label.severity=critical', 4),
+            ('label.namespace=prod&label.severity=critical', 0),  # 标签分属不同告警，不匹配
+            ('label.namespace=staging&source=grafana', 3),
+        ]
+        for query, expected in cases:
+            webhooks = _walk_pages(client, query, page_size=4)
+            assert len(webhooks) == expected, (query, len(webhooks))
+            print(f"✓ {query}: {expected} 条")
+
+        assert client.get('/api/webhooks?label.bad-name=x').status_code == 400
+        print("✓ 无效标签名返回 400")
+
+
+if __name__ == '__main__':
+    try:
+        test_filters_with_keyset_pagination()
+        test_cursor_compatibility_and_validation()
+        test_label_filters()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
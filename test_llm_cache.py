@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""测试 LLM 响应缓存（record / replay / passthrough 及 LRU 淘汰）"""
+
+import os
+import sys
+import tempfile
+
+from llm_cache import LLMResponseCache, LLMCacheMiss, cached_completion, make_cache_key
+import llm_cache
+
+
+def _use_temp_cache(tmpdir, **kwargs):
+    """替换全局缓存实例为临时目录中的缓存"""
+    llm_cache._cache = LLMResponseCache(os.path.join(tmpdir, 'cache.db'), **kwargs)
+    return llm_cache._cache
+
+
+def test_record_and_replay():
+    """record 模式写入后 replay 模式可确定性回放"""
+    print("=" * 60)
+    print("测试 LLM 缓存 record / replay")
+    print("=" * 60)
+
+    request = {'model': 'test-model', 'messages': [{'role': 'user', 'content': 'hello'}], 'temperature': 0.3}
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return '{"importance": "high"}'
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = _use_temp_cache(tmpdir)
+
+        # passthrough 不写缓存
+        assert cached_completion(request, fetch, mode='passthrough') == '{"importance": "high"}'
+        assert cache.stats()['entries'] == 0
+
+        # record 调用真实服务并写缓存
+        assert cached_completion(request, fetch, mode='record') == '{"importance": "high"}'
+        assert cache.stats()['entries'] == 1
+        assert len(calls) == 2
+
+        # replay 只读缓存，不调用真实服务
+        assert cached_completion(request, fetch, mode='replay') == '{"importance": "high"}'
+        assert len(calls) == 2
+        print("✓ 回放命中，未调用真实服务")
+
+        # 请求内容变化时 replay 未命中
+        other = dict(request, temperature=0.5)
+        assert make_cache_key(other) != make_cache_key(request)
+        try:
+            cached_completion(other, fetch, mode='replay')
+            raise AssertionError("replay 未命中时应抛出 LLMCacheMiss")
+        except LLMCacheMiss:
+            print("✓ 回放未命中时抛出 LLMCacheMiss")
+
+        llm_cache._cache = None
+
+
+def test_lru_eviction():
+    """超过条目数限制时淘汰最久未访问的记录"""
+    print("\n测试 LRU 淘汰")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = LLMResponseCache(os.path.join(tmpdir, 'cache.db'), max_entries=2)
+        cache.put('a', 'response-a')
+        cache.put('b', 'response-b')
+        # 访问 a，使 b 成为最久未访问
+        assert cache.get('a') == 'response-a'
+        cache.put('c', 'response-c')
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 'response-a'
+        assert cache.get('c') == 'response-c'
+        assert cache.stats()['entries'] == 2
+        print("✓ 淘汰了最久未访问的记录")
+
+
+if __name__ == '__main__':
+    try:
+        test_record_and_replay()
+        test_lru_eviction()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""测试分区边界计算、过期事件清理、重复计数和转发状态更新"""
+
+import sys
+from datetime import datetime, timedelta
+
+from config import Config
+from models import WebhookEvent, get_engine, session_scope
+from partitions import (
+    _infer_interval, next_period, parse_bound, partition_name, period_start, run_maintenance, setup_partitioning
+)
+from test_change_feed import _temporary_sqlite_db
+from utils import check_duplicate_alert, save_webhook_data, update_forward_status
+
+
+def test_partition_bounds():
+    """day 分区从零点开始，week 分区从周一零点开始，分区范围可从 pg_get_expr 结果解析"""
+    print("=" * 60)
+    print("测试分区边界")
+    print("=" * 60)
+
+    moment = datetime(2026, 10, 22, 15, 30)  # 周四
+    assert period_start(moment, 'day') == datetime(2026, 10, 22)
+    assert period_start(moment, 'week') == datetime(2026, 10, 19)
+    assert next_period(datetime(2026, 10, 19), 'week') == datetime(2026, 10, 26)
+    assert partition_name(datetime(2026, 10, 19)) == 'webhook_events_p20261019'
+
+    bound = parse_bound("FOR VALUES FROM ('2026-10-19 00:00:00') TO ('2026-10-26 00:00:00')")
+    assert bound == (datetime(2026, 10, 19), datetime(2026, 10, 26))
+    assert parse_bound('DEFAULT') is None
+    assert _infer_interval([('p', *bound), ('webhook_events_default', None, None)]) == 'week'
+    print("✓ 分区边界正确")
+
+
+def test_retention_without_partitions():
+    """未分区的数据库按保留天数分批删除过期事件"""
+    print("\n测试过期事件清理")
+
+    saved = (Config.RETENTION_DAYS, Config.PARTITION_INTERVAL)
+    Config.RETENTION_DAYS, Config.PARTITION_INTERVAL = 7, 'day'
+    now = datetime(2026, 10, 19, 12)
+    try:
+        with _temporary_sqlite_db():
+            assert setup_partitioning(get_engine()) is False  # SQLite 不分区
+            with session_scope() as session:
+                for days in (30, 10, 8, 6, 1):
+                    session.add(WebhookEvent(source='test', raw_payload='{}', parsed_data={},
+                                             timestamp=now - timedelta(days=days)))
+
+            result = run_maintenance(now=now)
+            assert result['deleted'] == 3 and result['created'] == [] and not result['skipped'], result
+            with session_scope() as session:
+                remaining = sorted((now - e.timestamp).days for e in session.query(WebhookEvent))
+            assert remaining == [1, 6], remaining
+            assert run_maintenance(now=now)['deleted'] == 0
+    finally:
+        Config.RETENTION_DAYS, Config.PARTITION_INTERVAL = saved
+    print("✓ 删除 3 条过期事件，保留期内的事件不受影响")
+
+
+def test_duplicate_count_update():
+    """重复告警按 (id, timestamp) 递增原始告警的计数，原始告警已被清理时按新告警保存"""
+    print("\n测试重复计数更新")
+
+    with _temporary_sqlite_db():
+        alert = {'alertname': 'HighCPU', 'instance': 'node-1'}
+        original_id, is_dup, _, _ = save_webhook_data(alert, 'test', b'{}', alert_hash='hash-1', is_duplicate=False)
+        assert not is_dup
+
+        for _ in range(2):
+            found, original = check_duplicate_alert('hash-1')
+            assert found and original.id == original_id
+            _, is_dup, duplicate_of, _ = save_webhook_data(
+                alert, 'test', b'{}', alert_hash='hash-1', is_duplicate=True, original_event=original
+            )
+            assert is_dup and duplicate_of == original_id
+        with session_scope() as session:
+            assert session.get(WebhookEvent, original_id).duplicate_count == 3
+
+        with session_scope() as session:
+            session.delete(session.get(WebhookEvent, original_id))
+        webhook_id, is_dup, duplicate_of, _ = save_webhook_data(
+            alert, 'test', b'{}', alert_hash='hash-1', is_duplicate=True, original_event=original
+        )
+        assert not is_dup and duplicate_of is None and isinstance(webhook_id, int)
+    print("✓ 重复计数正确，原始告警不存在时按新告警保存")
+
+
+def test_forward_status_update():
+    """转发状态按保存时返回的 (id, timestamp) 回写"""
+    print("\n测试转发状态更新")
+
+    with _temporary_sqlite_db():
+        webhook_id, _, _, saved_at = save_webhook_data({'alertname': 'HighCPU'}, 'test', b'{}', alert_hash='hash-2')
+        update_forward_status(webhook_id, saved_at - timedelta(seconds=1), 'success')  # 其他分区中的同 ID 行
+        with session_scope() as session:
+            assert session.get(WebhookEvent, webhook_id).forward_status == 'pending'
+        update_forward_status(webhook_id, saved_at, 'success')
+        with session_scope() as session:
+            assert session.get(WebhookEvent, webhook_id).forward_status == 'success'
+    print("✓ 只更新 (id, timestamp) 对应的行")
+
+
+if __name__ == '__main__':
+    try:
+        test_partition_bounds()
+        test_retention_without_partitions()
+        test_duplicate_count_update()
+        test_forward_status_update()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
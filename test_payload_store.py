@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""测试请求体去重存储（压缩、请求头集合、逐字节还原、与紧凑存储配合、已有数据转换和清理）"""
+
+import sys
+import zlib
+from datetime import datetime, timedelta
+
+from app import app
+from compact_duplicates import externalize
+from config import Config
+from models import HeaderSet, PayloadBlob, WebhookEvent, delete_orphan_references, get_engine, session_scope
+from payload_store import compress, decompress, parsed_stub, split_headers
+from test_change_feed import _temporary_sqlite_db
+from utils import check_duplicate_alert, save_webhook_data
+
+_ALERT = {
+    'status': 'firing',
+    'alerts': [{'labels': {'alertname': 'DiskFull', 'instance': 'db-1'}, 'annotations': {'summary': '磁盘已满'}}]
+}
+# 保留原始格式（缩进、键顺序、转义）才能验证逐字节还原
+_RAW = '{\n  "status": "firing",\n  "alerts": [{"labels": {"alertname": "DiskFull", "instance": "db-1"},' \
+       ' "annotations": {"summary": "\\u78c1\\u76d8\\u5df2\\u6ee1"}}]\n}'
+
+
+def _headers(request_id: str) -> dict:
+    return {'Content-Type': 'application/json', 'User-Agent': 'Alertmanager/0.27.0', 'X-Request-Id': request_id}
+
+
+def _save(alert_hash: str, request_id: str, is_duplicate: bool = False, original=None) -> int:
+    webhook_id, _, _, _ = save_webhook_data(
+        _ALERT, 'prometheus', _RAW.encode('utf-8'), _headers(request_id), '127.0.0.1', {'summary': '磁盘已满'},
+        alert_hash=alert_hash, is_duplicate=is_duplicate, original_event=original
+    )
+    return webhook_id
+
+
+def _counts() -> tuple[int, int]:
+    with session_scope() as session:
+        return session.query(PayloadBlob).count(), session.query(HeaderSet).count()
+
+
+def test_codec_and_headers():
+    """压缩可还原，请求头按是否每次不同拆分，标签投影只保留告警标签"""
+    print("=" * 60)
+    print("测试压缩和请求头拆分")
+    print("=" * 60)
+
+    codec, data = compress(_RAW.encode('utf-8') * 20)
+    assert decompress(codec, data) == _RAW.encode('utf-8') * 20 and len(data) < len(_RAW) * 2
+    assert decompress('zlib', zlib.compress(_RAW.encode('utf-8'))) == _RAW.encode('utf-8')  # 未安装 zstandard 时的格式
+    shared, volatile = split_headers(_headers('abc'))
+    assert volatile == {'X-Request-Id': 'abc'} and 'X-Request-Id' not in shared
+    assert parsed_stub(_ALERT) == {'$payload': True, 'alerts': [{'labels': _ALERT['alerts'][0]['labels']}]}
+    assert parsed_stub({'RuleName': 'cpu'}) == {'$payload': True}
+    print(f"✓ {codec} 压缩可还原，请求头拆分正确")
+
+
+def test_blob_round_trip():
+    """相同请求体和请求头集合只保存一份，接口输出逐字节还原，标签过滤仍可用"""
+    print("\n测试 blob 存储和还原")
+
+    client = app.test_client()
+    saved = Config.PAYLOAD_STORE
+    try:
+        with _temporary_sqlite_db():
+            Config.PAYLOAD_STORE = 'blob'
+            first, second = _save('hash-a', 'r1'), _save('hash-b', 'r2')
+            assert _counts() == (1, 1), _counts()
+
+            with session_scope() as session:
+                event = session.get(WebhookEvent, first)
+                assert event.raw_payload is None and event.payload_hash and event.header_hash
+                assert event.parsed_data['$payload'] and event.headers == {'X-Request-Id': 'r1'}
+
+            detail = client.get(f'/api/webhooks/{second}').get_json()['data']
+            assert detail['raw_payload'] == _RAW and detail['parsed_data'] == _ALERT, detail
+            assert detail['headers'] == _headers('r2') and 'payload_hash' not in detail
+            listed = client.get('/api/webhooks?label.instance=db-1').get_json()['data']
+            assert sorted(w['id'] for w in listed) == [first, second]
+            assert all(w['raw_payload'] == _RAW for w in listed)
+            summary = client.get('/api/webhooks?fields=summary').get_json()['data']
+            assert all('raw_payload' not in w for w in summary)
+    finally:
+        Config.PAYLOAD_STORE = saved
+    print("✓ 2 条事件共享 1 个 blob 和 1 个请求头集合，输出与原文一致")
+
+
+def test_compact_duplicates_over_blobs():
+    """原始告警使用 blob 存储时重复告警仍按差异紧凑存储并正确还原"""
+    print("\n测试 blob 存储与紧凑存储配合")
+
+    client = app.test_client()
+    saved = (Config.PAYLOAD_STORE, Config.COMPACT_DUPLICATES)
+    try:
+        with _temporary_sqlite_db():
+            Config.PAYLOAD_STORE, Config.COMPACT_DUPLICATES = 'blob', True
+            original_id = _save('hash-c', 'r1')
+            _, original = check_duplicate_alert('hash-c')
+            duplicate_id = _save('hash-c', 'r2', True, original)
+
+            with session_scope() as session:
+                event = session.get(WebhookEvent, duplicate_id)
+                assert event.is_compact() and event.payload_hash is None and event.raw_payload is None
+            detail = client.get(f'/api/webhooks/{duplicate_id}').get_json()['data']
+            assert detail['raw_payload'] == _RAW and detail['parsed_data'] == _ALERT
+            assert detail['headers'] == _headers('r2') and detail['duplicate_of'] == original_id
+    finally:
+        Config.PAYLOAD_STORE, Config.COMPACT_DUPLICATES = saved
+    print("✓ 重复告警相对 blob 存储的原始告警还原正确")
+
+
+def test_externalize_and_cleanup():
+    """已有事件转换为引用后输出不变；事件删除后不再被引用的 blob 被清理"""
+    print("\n测试已有数据转换和清理")
+
+    client = app.test_client()
+    saved = Config.PAYLOAD_STORE
+    try:
+        with _temporary_sqlite_db():
+            Config.PAYLOAD_STORE = 'inline'
+            ids = [_save(f'hash-{i}', f'r{i}') for i in range(3)]
+            before = [client.get(f'/api/webhooks/{i}').get_json()['data'] for i in ids]
+
+            Config.PAYLOAD_STORE = 'blob'
+            stats = externalize(dry_run=True)
+            assert stats['converted'] == 3 and _counts() == (0, 0), stats
+            stats = externalize()
+            assert stats['converted'] == 3 and stats['bytes_after'] < stats['bytes_before'], stats
+            assert externalize()['converted'] == 0 and _counts() == (1, 1)
+            assert [client.get(f'/api/webhooks/{i}').get_json()['data'] for i in ids] == before
+
+            with session_scope() as session:
+                session.query(WebhookEvent).delete()
+            with get_engine().begin() as conn:
+                assert delete_orphan_references(conn) == 0  # 刚被引用过的 blob 保留
+                assert delete_orphan_references(conn, now=datetime.now() + timedelta(days=2)) == 1
+            assert _counts() == (0, 0)
+    finally:
+        Config.PAYLOAD_STORE = saved
+    print("✓ 转换后输出不变，过了保留期且不再被引用的 blob 被删除")
+
+
+if __name__ == '__main__':
+    try:
+        test_codec_and_headers()
+        test_blob_round_trip()
+        test_compact_duplicates_over_blobs()
+        test_externalize_and_cleanup()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""测试按需剖析（CPU 采样折叠栈和 tracemalloc 分配统计）"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+from profiler import folded_stacks, sample_cpu, trace_memory
+
+
+def _busy_worker(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_sample_cpu():
+    """采样结果包含其他线程的调用栈，不包含采样线程自身"""
+    print("=" * 60)
+    print("测试 CPU 采样剖析")
+    print("=" * 60)
+
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_worker, args=(stop,), name='busy-worker')
+    worker.start()
+    try:
+        result = sample_cpu(0.3, 0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert result['sample_rounds'] > 0
+    busy = [stack for stack in result['samples'] if stack.startswith('thread:busy-worker;')]
+    assert busy and any('_busy_worker' in stack for stack in busy), list(result['samples'])[:3]
+    assert not any('sample_cpu' in stack for stack in result['samples'])
+
+    lines = folded_stacks(result['samples']).splitlines()
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    print(f"✓ {result['sample_rounds']} 轮采样，{len(lines)} 个不同调用栈")
+
+
+# gevent monkey patch 只能在独立进程中执行
+_GEVENT_SCRIPT = """
+from gevent import monkey; monkey.patch_all()
+import json, gevent
+from profiler import sample_cpu
+
+def waiting_handler():
+    while True:
+        gevent.sleep(0.01)
+
+handler = gevent.spawn(waiting_handler)
+result = gevent.get_hub().threadpool.apply(sample_cpu, (0.3, 0.005))
+print(json.dumps(result['samples']))
+"""
+
+
+def test_sample_cpu_gevent():
+    """gevent 下采样到挂起 greenlet 的调用栈，不包含采样线程自身"""
+    print("\n测试 gevent 下的 CPU 采样")
+
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("未安装 gevent，跳过")
+        return
+    output = subprocess.run([sys.executable, '-c', _GEVENT_SCRIPT], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    samples = json.loads(output.strip().splitlines()[-1])
+    handler = [stack for stack in samples if 'waiting_handler' in stack]
+    assert handler and all(stack.startswith('greenlet:') for stack in handler), list(samples)[:3]
+    assert not any('sample_cpu' in stack for stack in samples)
+    print(f"✓ 采样到 greenlet 调用栈: {handler[0]}")
+
+
+def test_trace_memory():
+    """剖析期间的分配出现在增长列表中，结束后关闭 tracemalloc"""
+    print("\n测试内存剖析")
+
+    retained = []
+    stop = threading.Event()
+
+    def allocate():
+        while not stop.is_set():
+            retained.append(bytearray(64 * 1024))
+            time.sleep(0.01)
+
+    worker = threading.Thread(target=allocate)
+    worker.start()
+    try:
+        result = trace_memory(0.3, top=5)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert result['top_growth'] and result['top_growth'][0]['size_diff_kb'] > 0
+    assert any('test_profiler.py' in frame for frame in result['top_growth'][0]['traceback'])
+    assert not tracemalloc.is_tracing()
+    print(f"✓ 增长最多: {result['top_growth'][0]['size_diff_kb']}KB @ {result['top_growth'][0]['traceback'][-1]}")
+
+
+def test_start_profile_rejects_non_object_body():
+    """剖析接口的请求体不是 JSON 对象时返回 400"""
+    print("\n测试剖析接口参数校验")
+
+    from app import app
+    from config import Config
+
+    client = app.test_client()
+    saved = Config.WEBHOOK_SECRET
+    Config.WEBHOOK_SECRET = 'test-secret'
+    try:
+        for body in ([1, 2], 'cpu', 10):
+            response = client.post('/api/admin/profile/cpu', json=body, headers={'X-Admin-Secret': 'test-secret'})
+            assert response.status_code == 400, (body, response.status_code)
+            assert response.get_json()['success'] is False
+    finally:
+        Config.WEBHOOK_SECRET = saved
+    print("✓ 数组和标量请求体返回 400")
+
+
+if __name__ == '__main__':
+    try:
+        test_sample_cpu()
+        test_sample_cpu_gevent()
+        test_trace_memory()
+        test_start_profile_rejects_non_object_body()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""测试 SQL 语句统计（N+1 / 重复查询识别及查询预算）"""
+
+import sys
+
+from sqlalchemy import create_engine, text
+
+import query_stats
+from query_stats import QueryBudgetExceeded
+
+
+def _make_engine():
+    engine = create_engine('sqlite:///:memory:')
+    query_stats.instrument_engine(engine)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)'))
+        conn.execute(text("INSERT INTO items (id, name) VALUES (1, 'a'), (2, 'b'), (3, 'c'), (4, 'd'), (5, 'e')"))
+    return engine
+
+
+def test_detects_n_plus_one_and_repeated():
+    """同一模板不同参数多次执行标记为 N+1，相同参数多次执行标记为重复查询"""
+    print("=" * 60)
+    print("测试 N+1 与重复查询识别")
+    print("=" * 60)
+
+    engine = _make_engine()
+    with query_stats.track('n+1', mode='off') as stats:
+        with engine.connect() as conn:
+            for item_id in range(1, 6):
+                conn.execute(text('SELECT name FROM items WHERE id = :id'), {'id': item_id})
+            conn.execute(text('SELECT COUNT(*) FROM items'))
+            conn.execute(text('SELECT COUNT(*) FROM items'))
+
+    assert stats.statements == 7, stats.statements
+    assert [count for _, count in stats.n_plus_one(threshold=5)] == [5]
+    assert [count for _, count in stats.repeated()] == [2]
+    print(f"✓ {stats.to_dict()['n_plus_one']}")
+    print(f"✓ {stats.to_dict()['repeated']}")
+
+    # 大参数只保存固定大小的指纹，内容不同（仅末尾不同）时不算重复
+    payload = 'x' * 100000
+    with query_stats.track('large', mode='off') as stats:
+        with engine.connect() as conn:
+            for name in (payload, payload, payload + 'y'):
+                conn.execute(text('SELECT id FROM items WHERE name = :name'), {'name': name})
+    assert [count for _, count in stats.repeated()] == [2]
+    assert all(isinstance(fingerprint, int) for _, fingerprint in stats.identical)
+    print("✓ 大参数按指纹统计")
+
+
+def test_query_budget():
+    """超出预算时 raise 模式抛出异常，未超出或 warn 模式正常返回"""
+    print("\n测试查询预算")
+
+    engine = _make_engine()
+    query_stats.totals.reset()
+
+    with query_stats.track('within', budget=2, mode='raise'):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+
+    try:
+        with query_stats.track('over', budget=2, mode='raise'):
+            with engine.connect() as conn:
+                for _ in range(3):
+                    conn.execute(text('SELECT 1'))
+        raise AssertionError("超出预算时应抛出 QueryBudgetExceeded")
+    except QueryBudgetExceeded as e:
+        print(f"✓ {e}")
+
+    with query_stats.track('warn', budget=1, mode='warn'):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            conn.execute(text('SELECT 2'))
+
+    totals = query_stats.totals.to_dict()
+    assert totals['requests'] == 3
+    assert totals['budget_violations'] == 2
+    assert totals['max_statements'] == 3
+    print(f"✓ 累计统计: {totals}")
+
+    # 不在统计上下文中执行的语句不影响任何统计
+    assert query_stats.current() is None
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    assert query_stats.totals.to_dict()['statements'] == totals['statements']
+
+
+if __name__ == '__main__':
+    try:
+        test_detects_n_plus_one_and_repeated()
+        test_query_budget()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
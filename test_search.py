@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""测试全文检索（检索文本生成、SQLite FTS5 增量索引、相关度排序和 keyset 分页）"""
+
+import sys
+
+from app import app
+from models import WebhookEvent, session_scope
+from test_change_feed import _temporary_sqlite_db
+from utils import build_search_text, build_webhook_event
+
+
+def _prometheus_alert(pod: str) -> dict:
+    return {
+        'commonLabels': {'namespace': 'prod'},
+        'alerts': [{'labels': {'alertname': 'PodCrashLooping', 'pod': pod, 'namespace': 'prod'}}]
+    }
+
+
+def _save(data: dict, summary: str = '告警') -> int:
+    with session_scope() as session:
+        event = build_webhook_event(
+            data, 'test', b'{}', {}, '127.0.0.1', 'hash', {'summary': summary, 'event_type': 'alert'}
+        )
+        session.add(event)
+        session.flush()
+        return event.id
+
+
+def test_build_search_text():
+    """收录 AI 摘要、事件类型、标签值、规则名和资源 ID，重复值只保留一次"""
+    print("=" * 60)
+    print("测试检索文本生成")
+    print("=" * 60)
+
+    text = build_search_text(_prometheus_alert('api-7f9c'), {'summary': 'Pod 频繁重启', 'event_type': 'k8s_alert'})
+    assert text.split(' ') == ['Pod', '频繁重启', 'k8s_alert', 'prod', 'PodCrashLooping', 'api-7f9c'], text
+
+    text = build_search_text({'RuleName': 'cpu-high', 'Resources': [{'InstanceId': 'i-0abc'}], 'Level': True}, None)
+    assert text == 'cpu-high i-0abc', text
+    print("✓ 检索文本正确")
+
+
+def test_search_ranking_and_pagination():
+    """命中摘要和标签的事件排在前面，逐页翻完不重不漏，可与过滤条件组合"""
+    print("\n测试检索排序和分页")
+
+    client = app.test_client()
+    with _temporary_sqlite_db():
+        best = _save(_prometheus_alert('api-7f9c'), summary='api-7f9c 重启次数过多')
+        matching = [_save(_prometheus_alert('api-7f9c')) for _ in range(6)]
+        _save(_prometheus_alert('web-1234'))
+        _save({'RuleName': 'cpu-high', 'Resources': [{'InstanceId': 'i-0abc'}]})
+
+        result = client.get('/api/webhooks/search?q=api-7f9c&fields=summary').get_json()
+        assert result['data'][0]['id'] == best, result
+        assert 'raw_payload' not in result['data'][0] and 'score' in result['data'][0]
+
+        ids, cursor = [], None
+        while True:
+            url = '/api/webhooks/search?q=api-7f9c&page_size=3' + (f'&cursor={cursor}' if cursor else '')
+            result = client.get(url).get_json()
+            ids += [webhook['id'] for webhook in result['data']]
+            cursor = result['pagination']['next_cursor']
+            if not cursor:
+                break
+        assert sorted(ids) == sorted([best] + matching) and len(ids) == len(set(ids)), ids
+
+        assert [w['id'] for w in client.get('/api/webhooks/search?q=i-0abc').get_json()['data']] != []
+        assert client.get('/api/webhooks/search?q=prod PodCrashLooping&source=other').get_json()['data'] == []
+        assert client.get('/api/webhooks/search?q=').status_code == 400
+        assert client.get('/api/webhooks/search?q=-').status_code == 200
+    print("✓ 排序、分页和过滤正确")
+
+
+def test_index_follows_updates():
+    """更新检索文本后索引同步更新（触发器增量维护）"""
+    print("\n测试索引增量维护")
+
+    client = app.test_client()
+    with _temporary_sqlite_db():
+        webhook_id = _save(_prometheus_alert('old-pod'))
+        with session_scope() as session:
+            session.get(WebhookEvent, webhook_id).search_text = 'new-pod'
+
+        assert client.get('/api/webhooks/search?q=old-pod').get_json()['data'] == []
+        assert [w['id'] for w in client.get('/api/webhooks/search?q=new-pod').get_json()['data']] == [webhook_id]
+
+        with session_scope() as session:
+            session.delete(session.get(WebhookEvent, webhook_id))
+        assert client.get('/api/webhooks/search?q=new-pod').get_json()['data'] == []
+    print("✓ 更新和删除后检索结果同步")
+
+
+if __name__ == '__main__':
+    try:
+        test_build_search_text()
+        test_search_ranking_and_pagination()
+        test_index_follows_updates()
+    except AssertionError as e:
+        print(f"✗ 测试失败: {e}")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("测试完成")
+    print("=" * 60)
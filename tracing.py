@@ -0,0 +1,164 @@
+"""
+进程内请求追踪
+
+为每个请求记录各处理阶段和每条 SQL 语句的耗时（span），不依赖外部追踪后端：
+- 通过 Server-Timing 响应头返回各阶段耗时，浏览器开发者工具可直接查看
+- 保留最慢的 N 个请求（按 worker 进程），可通过管理接口查看
+- 超过阈值的请求记录一条慢请求日志
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Generator, Optional
+
+from config import Config
+
+# 单个请求最多保留的 span 数量（避免批量 SQL 导致内存膨胀）
+_MAX_SPANS = 200
+
+
+class RequestTrace:
+    """单个请求的追踪数据"""
+
+    def __init__(self, method: str, path: str):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.source: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self.spans: list[tuple[str, float, float, Optional[str]]] = []
+        self.dropped_spans = 0
+        self.query_stats = None  # query_stats.QueryStats
+
+    def add_span(self, name: str, start: float, duration: float, desc: Optional[str] = None) -> None:
+        """记录 span（start 为 perf_counter 时间点）"""
+        if len(self.spans) >= _MAX_SPANS:
+            self.dropped_spans += 1
+            return
+        self.spans.append((name, start - self._start, duration, desc))
+
+    def finish(self, status: int) -> None:
+        self.status = status
+        self.duration = time.perf_counter() - self._start
+
+    def summary(self) -> dict[str, tuple[float, int]]:
+        """按名称汇总 span：{name: (总耗时秒, 次数)}"""
+        totals: dict[str, tuple[float, int]] = {}
+        for name, _, duration, _ in self.spans:
+            total, count = totals.get(name, (0.0, 0))
+            totals[name] = (total + duration, count + 1)
+        return totals
+
+    def server_timing(self) -> str:
+        """生成 Server-Timing 响应头"""
+        parts = []
+        for name, (total, count) in self.summary().items():
+            entry = f"{name};dur={total * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="{count}x"'
+            parts.append(entry)
+        parts.append(f"total;dur={self.duration * 1000:.1f}")
+        return ', '.join(parts)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'method': self.method,
+            'path': self.path,
+            'source': self.source,
+            'status': self.status,
+            'worker_pid': os.getpid(),
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration * 1000, 2),
+            'stages': {
+                name: {'total_ms': round(total * 1000, 2), 'count': count}
+                for name, (total, count) in self.summary().items()
+            },
+            'spans': [
+                {'name': name, 'start_ms': round(offset * 1000, 2), 'duration_ms': round(duration * 1000, 2), 'desc': desc}
+                for name, offset, duration, desc in self.spans
+            ],
+            'dropped_spans': self.dropped_spans,
+            'queries': self.query_stats.to_dict() if self.query_stats is not None else None
+        }
+
+
+class SlowRequestBuffer:
+    """保留耗时最长的 N 个请求（最小堆，线程安全）"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._heap: list[tuple[float, int, RequestTrace]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def offer(self, trace: RequestTrace) -> None:
+        if self.capacity <= 0:
+            return
+        item = (trace.duration, next(self._counter), trace)
+        with self._lock:
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, item)
+            elif trace.duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        """按耗时降序返回"""
+        with self._lock:
+            traces = [trace for _, _, trace in self._heap]
+        return [trace.to_dict() for trace in sorted(traces, key=lambda t: t.duration, reverse=True)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+
+
+# 当前 worker 最慢请求缓冲区
+slow_requests = SlowRequestBuffer(Config.SLOW_REQUEST_BUFFER_SIZE)
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)
+
+
+def start_trace(method: str, path: str) -> RequestTrace:
+    """开始追踪当前请求"""
+    trace = RequestTrace(method, path)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def end_trace() -> Optional[RequestTrace]:
+    """结束追踪并解除与当前上下文的绑定"""
+    trace = _current_trace.get()
+    _current_trace.set(None)
+    return trace
+
+
+def record_span(name: str, start: float, duration: float, desc: Optional[str] = None) -> None:
+    """向当前请求记录 span（不在请求上下文中时忽略）"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, duration, desc)
+
+
+@contextmanager
+def span(name: str, desc: Optional[str] = None) -> Generator[None, None, None]:
+    """记录一段代码的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start, time.perf_counter() - start, desc)
+
@@ -1,13 +1,24 @@
+import base64
 import hmac
 import hashlib
 import json
 import os
+import re
 from datetime import datetime, timedelta
-from typing import Any, Optional, Union
+from typing import Any, Mapping, Optional, Union
 
 from config import Config
 from logger import logger
-from models import WebhookEvent, get_session, session_scope
+from sqlalchemy import func, or_, text, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import load_only
+
+from models import (
+    HeaderSet, PayloadBlob, WebhookEvent, WEBHOOK_FIELDS, WEBHOOK_SUMMARY_FIELDS, attach_references, get_session,
+    load_columns, session_scope
+)
+from payload_delta import build_delta
+from payload_store import PARSED_STUB_KEY, REFERENCE_REFRESH, compress, content_hash, header_set_hash, parsed_stub, split_headers
 
 # 类型别名
 WebhookData = dict[str, Any]
@@ -105,6 +116,48 @@ def _extract_generic_fields(data: dict) -> dict:
     return key_fields
 
 
+# 全文检索文本的最大长度（字符）和最多收录的告警条数
+_SEARCH_TEXT_MAX_CHARS = 8000
+_SEARCH_TEXT_MAX_ALERTS = 50
+
+
+def build_search_text(data: Any, ai_analysis: Optional[AnalysisResult]) -> str:
+    """
+    生成全文检索文本（见 search.py）
+    
+    收录 AI 摘要和事件类型，以及解析后数据中便于定位告警的文本：
+    Prometheus 告警的全部标签值、规则名，华为云 / 通用告警的规则名、指标名等字段和资源 ID。
+    """
+    parts: list[str] = []
+    if ai_analysis:
+        parts += [ai_analysis.get('summary'), ai_analysis.get('event_type')]
+    
+    if isinstance(data, dict):
+        for field in PROMETHEUS_ROOT_FIELDS + GENERIC_FIELDS:
+            parts.append(data.get(field))
+        
+        labels = [data.get('commonLabels')]
+        alerts = data.get('alerts')
+        if isinstance(alerts, list):
+            labels += [alert.get('labels') for alert in alerts[:_SEARCH_TEXT_MAX_ALERTS] if isinstance(alert, dict)]
+        for label_set in labels:
+            if isinstance(label_set, dict):
+                parts += label_set.values()
+        
+        resources = data.get('Resources')
+        if isinstance(resources, list):
+            for resource in resources[:_SEARCH_TEXT_MAX_ALERTS]:
+                if isinstance(resource, dict):
+                    parts += [resource.get('InstanceId'), resource.get('id'), resource.get('name')]
+    
+    # 去重并保持顺序（同一组告警的标签大量重复）
+    unique = dict.fromkeys(
+        str(part) for part in parts
+        if isinstance(part, (str, int)) and not isinstance(part, bool) and part != ''
+    )
+    return ' '.join(unique)[:_SEARCH_TEXT_MAX_CHARS]
+
+
 def generate_alert_hash(data: dict, source: str) -> str:
     """
     生成告警的唯一哈希值，用于识别重复告警
@@ -137,7 +190,7 @@ def generate_alert_hash(data: dict, source: str) -> str:
     # 计算 SHA256 哈希
     hash_value = hashlib.sha256(key_string.encode('utf-8')).hexdigest()
     
-    logger.debug(f"生成告警哈希: {hash_value}, 关键字段: {key_fields}")
+    logger.debug("生成告警哈希: %s, 关键字段: %s", hash_value, key_fields)
     return hash_value
 
 
@@ -169,7 +222,11 @@ def check_duplicate_alert(
             .first()
         
         if original_event:
-            logger.info(f"检测到重复告警: hash={alert_hash}, 原始告警ID={original_event.id}, 时间窗口={time_window_hours}小时")
+            logger.info("检测到重复告警: hash=%s, 原始告警ID=%s, 时间窗口=%s小时",
+                        alert_hash, original_event.id, time_window_hours, extra={'sampled': True})
+            if Config.COMPACT_DUPLICATES:
+                # 会话关闭前加载请求体 / 请求头引用（紧凑存储计算差异时使用）
+                attach_references(session, [original_event])
             return True, original_event
         else:
             return False, None
@@ -181,6 +238,167 @@ def check_duplicate_alert(
         session.close()
 
 
+def build_webhook_event(
+    data: WebhookData,
+    source: str,
+    raw_payload: Optional[bytes],
+    headers: Optional[HeadersDict],
+    client_ip: Optional[str],
+    alert_hash: str,
+    ai_analysis: Optional[AnalysisResult],
+    forward_status: str = 'pending',
+    original_event: Optional[WebhookEvent] = None
+) -> WebhookEvent:
+    """
+    构建待保存的事件记录（同步和异步保存共用）
+    
+    传入 original_event 时构建重复告警记录，复用原始告警的 AI 分析结果；COMPACT_DUPLICATES 开启时
+    只保存与原始告警的差异（见 payload_delta.py）。PAYLOAD_STORE=blob 时请求体和请求头集合改为引用
+    （见 store_references，保存前需执行 reference_inserts 返回的语句）。读取时由 WebhookEvent.get_field 还原。
+    """
+    if original_event is not None:
+        ai_analysis = original_event.ai_analysis
+        importance = original_event.importance
+    else:
+        importance = ai_analysis.get('importance') if ai_analysis else None
+    
+    event = WebhookEvent(
+        source=source,
+        client_ip=client_ip,
+        timestamp=datetime.now(),
+        raw_payload=raw_payload.decode('utf-8') if raw_payload else None,
+        headers=dict(headers) if headers else {},
+        parsed_data=data,
+        alert_hash=alert_hash,
+        ai_analysis=ai_analysis,
+        importance=importance,
+        forward_status=forward_status,
+        is_duplicate=1 if original_event is not None else 0,
+        duplicate_of=original_event.id if original_event is not None else None,
+        duplicate_count=1,
+        search_text=build_search_text(data, ai_analysis)
+    )
+    if original_event is not None and Config.COMPACT_DUPLICATES:
+        compact_event(event, original_event)
+    if Config.PAYLOAD_STORE == 'blob':
+        store_references(event)
+    return event
+
+
+def compact_event(event: WebhookEvent, original_event: WebhookEvent) -> None:
+    """把重复告警改为紧凑存储：raw_payload / headers / parsed_data / ai_analysis 只保留无法用差异表示的部分"""
+    delta, columns = build_delta(
+        original_event.get_field('raw_payload'), original_event.get_field('headers'),
+        original_event.get_field('parsed_data'),
+        event.get_field('raw_payload'), event.get_field('headers') or {}, event.get_field('parsed_data')
+    )
+    same_analysis = event.get_field('ai_analysis') == original_event.get_field('ai_analysis')
+    event.delta = delta
+    event.raw_payload = columns.get('raw_payload')
+    event.headers = None
+    event.parsed_data = None
+    event.payload_hash = None
+    event.header_hash = None
+    if same_analysis:
+        event.ai_analysis = None
+
+
+def _parses_to(raw: str, parsed: Any) -> bool:
+    try:
+        return json.loads(raw) == parsed
+    except ValueError:
+        return False
+
+
+def store_references(event: WebhookEvent) -> None:
+    """
+    PAYLOAD_STORE=blob：请求体压缩后移到 payload_blobs，请求头中可共享的部分移到 header_sets（见 payload_store.py）
+
+    parsed_data 能由请求体解析得到时只保留标签投影；待写入的 blob / 请求头集合记录在 event._new_references 中。
+    """
+    references = []
+    now = datetime.now()
+    parsed = event.parsed_data
+    derived = parsed is not None and not (isinstance(parsed, dict) and PARSED_STUB_KEY in parsed)
+    if event.raw_payload is not None and (parsed is None or (derived and _parses_to(event.raw_payload, parsed))):
+        raw = event.raw_payload.encode('utf-8')
+        codec, data = compress(raw)
+        event.payload_hash = content_hash(raw)
+        references.append((PayloadBlob, {
+            'hash': event.payload_hash, 'codec': codec, 'size': len(raw), 'data': data, 'last_seen_at': now
+        }))
+        event.raw_payload = None
+        if parsed is not None:
+            event.parsed_data = parsed_stub(parsed)
+    if event.headers:
+        shared, volatile = split_headers(event.headers)
+        if shared:
+            event.header_hash = header_set_hash(shared)
+            references.append((HeaderSet, {'hash': event.header_hash, 'headers': shared, 'last_seen_at': now}))
+            event.headers = volatile or None
+    event._new_references = references
+
+
+def reference_inserts(event: WebhookEvent, dialect: str) -> list:
+    """
+    store_references 产生的 blob / 请求头集合的插入语句（同步和异步保存共用）
+
+    内容哈希已存在时不重复写入，只在 last_seen_at 早于 REFERENCE_REFRESH 时刷新（清理任务据此保留仍在使用的记录，
+    见 models.delete_orphan_references）。
+    """
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statements = []
+    for model, values in event.__dict__.get('_new_references', ()):
+        statement = insert(model).values(**values)
+        statements.append(statement.on_conflict_do_update(
+            index_elements=['hash'],
+            set_={'last_seen_at': statement.excluded.last_seen_at},
+            where=model.last_seen_at < values['last_seen_at'] - REFERENCE_REFRESH
+        ))
+    return statements
+
+
+def save_references(session, event: WebhookEvent) -> None:
+    """在 session 中写入 store_references 产生的 blob / 请求头集合"""
+    for statement in reference_inserts(event, session.get_bind().dialect.name):
+        session.execute(statement)
+
+
+def decide_forward(
+    analysis_result: AnalysisResult,
+    is_duplicate: bool,
+    original_id: Optional[int] = None
+) -> tuple[bool, Optional[str]]:
+    """
+    自动转发决策：只转发高风险告警，重复告警按 FORWARD_DUPLICATE_ALERTS 决定
+    
+    Returns:
+        tuple: (是否转发, 跳过原因)
+    """
+    importance = analysis_result.get('importance', '').lower()
+    if importance != 'high':
+        return False, f'重要性为 {importance}，非高风险事件不自动转发'
+    if is_duplicate and not Config.FORWARD_DUPLICATE_ALERTS:
+        return False, f'重复告警（原始 ID={original_id}），配置跳过转发'
+    return True, None
+
+
+def increment_duplicate_count(original_event: WebhookEvent):
+    """
+    原始告警重复次数 +1 的 UPDATE 语句（RETURNING 递增后的重复次数，原始告警已被删除时无返回行）
+
+    按 (id, timestamp) 定位：分区表上只访问原始告警所在的分区（见 partitions.py）；
+    在数据库中原子递增，并发的重复告警不会互相覆盖计数。
+    """
+    return update(WebhookEvent).where(
+        WebhookEvent.id == original_event.id,
+        WebhookEvent.timestamp == original_event.timestamp
+    ).values(
+        duplicate_count=func.coalesce(WebhookEvent.duplicate_count, 1) + 1,
+        updated_at=datetime.now()
+    ).returning(WebhookEvent.duplicate_count)
+
+
 def save_webhook_data(
     data: WebhookData,
     source: str = 'unknown',
@@ -192,8 +410,14 @@ def save_webhook_data(
     alert_hash: Optional[str] = None,
     is_duplicate: Optional[bool] = None,
     original_event: Optional[WebhookEvent] = None
-) -> tuple[Union[int, str], bool, Optional[int]]:
-    """保存 webhook 数据到数据库"""
+) -> tuple[Union[int, str], bool, Optional[int], Optional[datetime]]:
+    """
+    保存 webhook 数据到数据库
+    
+    Returns:
+        tuple: (事件 ID, 是否重复告警, 原始告警 ID, 接收时间 timestamp)；
+            数据库保存失败时事件 ID 为备份文件路径、timestamp 为 None
+    """
     # 如果未提供预计算的哈希值，则重新计算
     if alert_hash is None:
         alert_hash = generate_alert_hash(data, source)
@@ -205,77 +429,79 @@ def save_webhook_data(
     try:
         with session_scope() as session:
             if is_duplicate and original_event:
-                # 重复告警：使用 session.get() 更高效地获取原始告警并更新重复计数
-                orig = session.get(WebhookEvent, original_event.id)
-                if orig:
-                    orig.duplicate_count = (orig.duplicate_count or 1) + 1
-                    orig.updated_at = datetime.now()
-                    
-                    logger.info(f"发现重复告警，原始告警ID={orig.id}, 已重复{orig.duplicate_count}次")
+                # 重复告警：递增原始告警的重复计数（原始告警已被清理时按新告警保存）
+                duplicate_count = session.execute(increment_duplicate_count(original_event)).scalar_one_or_none()
+                if duplicate_count is not None:
+                    logger.info("发现重复告警，原始告警ID=%s, 已重复%s次", original_event.id, duplicate_count,
+                                extra={'sampled': True})
                     
                     # 创建重复告警记录（复用传入的 original_event 数据，避免重复读取）
-                    webhook_event = WebhookEvent(
-                        source=source,
-                        client_ip=client_ip,
-                        timestamp=datetime.now(),
-                        raw_payload=raw_payload.decode('utf-8') if raw_payload else None,
-                        headers=dict(headers) if headers else {},
-                        parsed_data=data,
-                        alert_hash=alert_hash,
-                        ai_analysis=original_event.ai_analysis,  # 使用传入的数据
-                        importance=original_event.importance,    # 使用传入的数据
-                        forward_status=forward_status,
-                        is_duplicate=1,
-                        duplicate_of=original_event.id,
-                        duplicate_count=1
+                    webhook_event = build_webhook_event(
+                        data, source, raw_payload, headers, client_ip, alert_hash,
+                        ai_analysis=None, forward_status=forward_status, original_event=original_event
                     )
                     
+                    save_references(session, webhook_event)
                     session.add(webhook_event)
                     session.flush()  # 获取 ID
                     
                     webhook_id = webhook_event.id
-                    logger.info(f"重复告警已保存: ID={webhook_id}, 复用原始告警{orig.id}的AI分析结果")
+                    logger.info("重复告警已保存: ID=%s, 复用原始告警%s的AI分析结果", webhook_id, original_event.id,
+                                extra={'sampled': True})
                     
                     # 可选: 同时保存到文件
                     if Config.ENABLE_FILE_BACKUP:
-                        save_webhook_to_file(data, source, raw_payload, headers, client_ip, orig.ai_analysis)
+                        save_webhook_to_file(data, source, raw_payload, headers, client_ip, original_event.ai_analysis)
                     
-                    return webhook_id, True, orig.id
+                    return webhook_id, True, original_event.id, webhook_event.timestamp
             
             # 新告警：正常保存
-            webhook_event = WebhookEvent(
-                source=source,
-                client_ip=client_ip,
-                timestamp=datetime.now(),
-                raw_payload=raw_payload.decode('utf-8') if raw_payload else None,
-                headers=dict(headers) if headers else {},
-                parsed_data=data,
-                alert_hash=alert_hash,
-                ai_analysis=ai_analysis,
-                importance=ai_analysis.get('importance') if ai_analysis else None,
-                forward_status=forward_status,
-                is_duplicate=0,
-                duplicate_of=None,
-                duplicate_count=1
+            webhook_event = build_webhook_event(
+                data, source, raw_payload, headers, client_ip, alert_hash,
+                ai_analysis=ai_analysis, forward_status=forward_status
             )
             
+            save_references(session, webhook_event)
             session.add(webhook_event)
             session.flush()  # 获取 ID
             
             webhook_id = webhook_event.id
-            logger.info(f"Webhook 数据已保存到数据库: ID={webhook_id}")
+            logger.info("Webhook 数据已保存到数据库: ID=%s", webhook_id, extra={'sampled': True})
             
             # 可选: 同时保存到文件
             if Config.ENABLE_FILE_BACKUP:
                 save_webhook_to_file(data, source, raw_payload, headers, client_ip, ai_analysis)
             
-            return webhook_id, False, None
+            return webhook_id, False, None, webhook_event.timestamp
         
     except Exception as e:
         logger.error(f"保存 webhook 数据到数据库失败: {str(e)}")
         # 失败时至少保存到文件
         file_id = save_webhook_to_file(data, source, raw_payload, headers, client_ip, ai_analysis)
-        return file_id, False, None
+        return file_id, False, None, None
+
+
+def update_forward_status(webhook_id: Union[int, str], timestamp: Optional[datetime], forward_status: str) -> None:
+    """
+    更新已保存事件的转发状态（保存时为 pending，转发决策完成后回写）
+    
+    按 (id, timestamp) 定位（timestamp 为 save_webhook_data 返回的接收时间）：分区表上只访问事件所在的分区。
+    """
+    # 数据库保存失败时 webhook_id 为备份文件路径，无需回写
+    if not isinstance(webhook_id, int):
+        return
+    
+    try:
+        with session_scope() as session:
+            session.query(WebhookEvent).filter(
+                WebhookEvent.id == webhook_id,
+                WebhookEvent.timestamp == timestamp
+            ).update(
+                {WebhookEvent.forward_status: forward_status},
+                synchronize_session=False
+            )
+    except Exception as e:
+        logger.error(f"更新转发状态失败: ID={webhook_id}, 错误: {str(e)}")
 
 
 def save_webhook_to_file(
@@ -327,54 +553,404 @@ def get_client_ip(request) -> str:
         return request.remote_addr
 
 
+def resolve_fields(spec: Optional[str]) -> Optional[tuple[str, ...]]:
+    """
+    解析列表接口的 fields 参数
+    
+    Args:
+        spec: 'full'（默认，全部字段）、'summary'（摘要字段）或逗号分隔的字段名
+    
+    Returns:
+        tuple | None: 需要输出的字段（始终包含 id），None 表示全部字段
+    
+    Raises:
+        ValueError: 包含未知字段
+    """
+    if not spec or spec == 'full':
+        return None
+    if spec == 'summary':
+        return WEBHOOK_SUMMARY_FIELDS
+    
+    names = [name.strip() for name in spec.split(',') if name.strip()]
+    unknown = [name for name in names if name not in WEBHOOK_FIELDS]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+    return tuple(name for name in WEBHOOK_FIELDS if name == 'id' or name in names)
+
+
+# 列表接口支持的过滤参数（均可组合，按 timestamp 倒序 keyset 分页）
+WEBHOOK_FILTERS = ('source', 'importance', 'alert_hash', 'forward_status', 'duplicate', 'start', 'end', 'label.<name>')
+
+_IMPORTANCE_LEVELS = ('high', 'medium', 'low')
+
+# 标签过滤参数前缀（label.namespace=prod），标签名规则与 Prometheus 一致
+_LABEL_PREFIX = 'label.'
+_LABEL_NAME_RE = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+
+
+def resolve_filters(args: Mapping[str, str]) -> dict[str, Any]:
+    """
+    解析列表接口的过滤参数
+    
+    Args:
+        args: 请求参数，支持 source、importance、alert_hash、forward_status（精确匹配），
+            duplicate（true 只看重复告警 / false 只看原始告警），
+            start / end（ISO 时间，按接收时间 timestamp 过滤，start 包含、end 不包含），
+            label.<name>（Prometheus 告警标签，多个标签需出现在同一条告警中）
+    
+    Returns:
+        dict: 规范化后的过滤条件（未传入的参数不出现）
+    
+    Raises:
+        ValueError: 参数取值无效
+    """
+    filters: dict[str, Any] = {}
+    for name in ('source', 'alert_hash', 'forward_status'):
+        if args.get(name):
+            filters[name] = args[name]
+    
+    if args.get('importance'):
+        if args['importance'] not in _IMPORTANCE_LEVELS:
+            raise ValueError(f"importance 参数无效，可选值: {', '.join(_IMPORTANCE_LEVELS)}")
+        filters['importance'] = args['importance']
+    
+    if args.get('duplicate'):
+        value = args['duplicate'].lower()
+        if value not in ('true', 'false', '1', '0'):
+            raise ValueError("duplicate 参数无效，可选值: true, false")
+        filters['duplicate'] = value in ('true', '1')
+    
+    for name in ('start', 'end'):
+        if args.get(name):
+            try:
+                filters[name] = datetime.fromisoformat(args[name])
+            except ValueError:
+                raise ValueError(f"{name} 参数应为 ISO 格式时间") from None
+    
+    labels = {}
+    for key, value in args.items():
+        if key.startswith(_LABEL_PREFIX):
+            name = key[len(_LABEL_PREFIX):]
+            if not _LABEL_NAME_RE.fullmatch(name):
+                raise ValueError(f"标签名无效: {name}")
+            labels[name] = value
+    if labels:
+        filters['labels'] = labels
+    return filters
+
+
+def _label_condition(dialect: str, labels: dict[str, str]):
+    """
+    告警标签过滤条件：parsed_data.alerts 中存在一条告警同时带有全部指定标签
+    
+    PostgreSQL 使用 JSONB 包含查询（idx_parsed_alert_labels GIN 索引），SQLite 使用 json_each 逐条匹配。
+    紧凑存储的重复告警（parsed_data 为 NULL）按原始告警的标签匹配：两者 alert_hash 相同，
+    PostgreSQL 上通过 idx_hash_timestamp 从命中的原始告警关联到重复告警，两部分都能走索引。
+    """
+    if dialect == 'postgresql':
+        # 参数为 JSON 字符串（而不是 JSONB 类型的绑定参数），count_webhooks 的 EXPLAIN 估算直接使用编译后的参数
+        match = "({table}.parsed_data -> 'alerts') @> CAST(:alert_labels AS jsonb)"
+        return text(
+            "webhook_events.id IN ("
+            f"SELECT original.id FROM webhook_events AS original WHERE {match.format(table='original')} "
+            "UNION ALL SELECT compact.id FROM webhook_events AS original "
+            "JOIN webhook_events AS compact ON compact.alert_hash = original.alert_hash "
+            "AND compact.duplicate_of = original.id "
+            f"WHERE {match.format(table='original')} AND compact.delta IS NOT NULL)"
+        ).bindparams(alert_labels=json.dumps([{'labels': labels}], ensure_ascii=False))
+    if dialect == 'sqlite':
+        conditions, params = [], {}
+        for i, (name, value) in enumerate(labels.items()):
+            conditions.append(f"json_extract(alert.value, :label_path_{i}) = :label_value_{i}")
+            params[f'label_path_{i}'] = f'$.labels.{name}'
+            params[f'label_value_{i}'] = value
+        match = (
+            "EXISTS (SELECT 1 FROM json_each({table}.parsed_data, '$.alerts') AS alert "
+            f"WHERE {' AND '.join(conditions)})"
+        )
+        return text(
+            f"({match.format(table='webhook_events')} OR (webhook_events.delta IS NOT NULL AND EXISTS ("
+            "SELECT 1 FROM webhook_events AS original WHERE original.id = webhook_events.duplicate_of "
+            f"AND {match.format(table='original')})))"
+        ).bindparams(**params)
+    raise ValueError(f"{dialect} 不支持标签过滤")
+
+
+def apply_filters(query, filters: Optional[dict[str, Any]]):
+    """
+    把过滤条件加到查询上
+    
+    等值条件配合 (source / importance / alert_hash, timestamp) 复合索引，
+    时间范围和 keyset 游标都落在同一个索引的 timestamp 部分上；标签条件见 _label_condition。
+    """
+    if not filters:
+        return query
+    for name in ('source', 'importance', 'alert_hash', 'forward_status'):
+        if name in filters:
+            query = query.filter(getattr(WebhookEvent, name) == filters[name])
+    if 'duplicate' in filters:
+        query = query.filter(WebhookEvent.is_duplicate == (1 if filters['duplicate'] else 0))
+    if 'start' in filters:
+        query = query.filter(WebhookEvent.timestamp >= filters['start'])
+    if 'end' in filters:
+        query = query.filter(WebhookEvent.timestamp < filters['end'])
+    if 'labels' in filters:
+        query = query.filter(_label_condition(query.session.get_bind().dialect.name, filters['labels']))
+    return query
+
+
+def encode_list_cursor(timestamp: datetime, webhook_id: int) -> str:
+    """列表分页游标：本页最后一条的 (timestamp, id)，编码为不透明字符串"""
+    raw = f"{timestamp.isoformat()}|{webhook_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_list_cursor(session, cursor: str) -> tuple[datetime, int]:
+    """
+    解析列表分页游标
+    
+    兼容旧版的整数游标（上一页最后一条的 ID），按 ID 查出其 timestamp 后转换为 keyset 位置。
+    
+    Raises:
+        ValueError: 游标无效
+    """
+    if cursor.isdigit():
+        timestamp = session.query(WebhookEvent.timestamp).filter(WebhookEvent.id == int(cursor)).scalar()
+        if timestamp is None:
+            raise ValueError("cursor 无效：事件不存在")
+        return timestamp, int(cursor)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        timestamp, _, webhook_id = raw.partition('|')
+        return datetime.fromisoformat(timestamp), int(webhook_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("cursor 无效") from None
+
+
+# 列表总数的统计方式
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+# 估算值低于该阈值时直接精确计数（小表精确计数很便宜，也覆盖 PostgreSQL 尚未 ANALYZE 的情况）
+_EXACT_COUNT_THRESHOLD = 10000
+
+
+def _planner_estimate(session, query) -> Optional[int]:
+    """PostgreSQL 规划器对查询结果行数的估算（EXPLAIN，不执行查询）"""
+    compiled = query.statement.compile(dialect=session.get_bind().dialect)
+    plan = session.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def count_webhooks(
+    session,
+    mode: str = 'estimate',
+    filters: Optional[dict[str, Any]] = None
+) -> tuple[Optional[int], str]:
+    """
+    统计 webhook 总数
+    
+    Args:
+        mode: exact（COUNT(*) 精确计数）、estimate 或 none（不统计）。estimate 在 PostgreSQL 上
+            无过滤条件时读取 pg_class.reltuples（分区表为各分区之和），有过滤条件时使用 EXPLAIN 的行数估算；
+            其他数据库无过滤条件时使用主键范围，有过滤条件时精确计数
+        filters: 过滤条件（见 resolve_filters）
+    
+    Returns:
+        tuple: (总数, 实际使用的统计方式)，mode 为 none 时总数为 None
+    """
+    if mode == 'none':
+        return None, 'none'
+    
+    query = apply_filters(session.query(WebhookEvent.id), filters)
+    if mode == 'estimate':
+        estimate = None
+        if session.get_bind().dialect.name == 'postgresql':
+            if filters:
+                estimate = _planner_estimate(session, query)
+            else:
+                # 分区表（见 partitions.py）的父表没有统计信息，累加各分区的 reltuples
+                estimate = session.execute(text(
+                    "SELECT COALESCE("
+                    "(SELECT sum(GREATEST(c.reltuples, 0))::bigint FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)), "
+                    "(SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)))"
+                ), {'table': WebhookEvent.__tablename__}).scalar()
+        elif not filters:
+            min_id, max_id = session.query(func.min(WebhookEvent.id), func.max(WebhookEvent.id)).one()
+            estimate = max_id - min_id + 1 if max_id is not None else 0
+        if estimate is not None and estimate >= _EXACT_COUNT_THRESHOLD:
+            return int(estimate), 'estimate'
+    
+    return query.count(), 'exact'
+
+
 def get_all_webhooks(
     page: int = 1, 
     page_size: int = 20,
-    cursor_id: Optional[int] = None
-) -> tuple[list[dict], int, Optional[int]]:
+    cursor: Optional[str] = None,
+    fields: Optional[tuple[str, ...]] = None,
+    count_mode: str = 'estimate',
+    filters: Optional[dict[str, Any]] = None
+) -> tuple[list[dict], Optional[int], Optional[str], str]:
     """
-    从数据库获取 webhook 数据（支持游标分页）
+    从数据库获取 webhook 数据（支持过滤、keyset 游标分页和字段投影）
+    
+    按接收时间倒序（timestamp, id 均倒序）排列，游标为上一页最后一条的 (timestamp, id)，
+    任意过滤条件组合下翻页都只需在索引上定位，不随页数变慢。
     
     Args:
         page: 页码（仅用于首次加载或无游标时）
         page_size: 每页数量
-        cursor_id: 游标 ID，获取此 ID 之后的数据（更高效）
+        cursor: 上一页返回的 next_cursor（也接受旧版的整数事件 ID）
+        fields: 只查询并返回这些字段（见 resolve_fields），None 表示全部字段
+        count_mode: 总数统计方式（见 count_webhooks）
+        filters: 过滤条件（见 resolve_filters）
     
     Returns:
-        tuple: (webhook数据列表, 总数量, 下一页游标ID)
+        tuple: (webhook数据列表, 总数量, 下一页游标, 总数统计方式)
+    
+    Raises:
+        ValueError: 游标无效
     """
     try:
         with session_scope() as session:
-            # 查询总数
-            total = session.query(WebhookEvent).count()
-            
-            # 构建查询
-            query = session.query(WebhookEvent)
+            # 构建查询：指定字段时只 SELECT 这些列，其余列延迟加载且禁止隐式加载（避免逐行补查）
+            query = apply_filters(session.query(WebhookEvent), filters)
+            if fields is not None:
+                # 游标需要 timestamp
+                columns = fields if 'timestamp' in fields else fields + ('timestamp',)
+                query = query.options(load_only(*load_columns(columns), raiseload=True))
             
-            if cursor_id is not None:
-                # 游标分页：获取 ID 小于 cursor_id 的记录（因为按 ID 降序）
-                query = query.filter(WebhookEvent.id < cursor_id)
+            if cursor:
+                # keyset 分页：获取排在游标之后的记录
+                position = decode_list_cursor(session, cursor)
+                query = query.filter(tuple_(WebhookEvent.timestamp, WebhookEvent.id) < position)
             else:
                 # 无游标时使用 offset（仅首次加载）
                 offset = (page - 1) * page_size
                 if offset > 0:
                     query = query.offset(offset)
             
-            # 按 ID 降序排列并限制数量
-            events = query.order_by(WebhookEvent.id.desc()).limit(page_size).all()
+            # 按接收时间倒序排列并限制数量
+            events = query.order_by(
+                WebhookEvent.timestamp.desc(), WebhookEvent.id.desc()
+            ).limit(page_size).all()
             
-            # 转换为字典列表
-            webhooks = [event.to_dict() for event in events]
+            # 转换为字典列表（批量加载原始告警和请求体 / 请求头引用后还原）
+            attach_references(session, events, fields)
+            webhooks = [event.to_dict(fields) for event in events]
             
-            # 计算下一页游标
-            next_cursor = events[-1].id if events else None
+            # 计算下一页游标（不足一页说明已到末尾）
+            next_cursor = None
+            if len(events) == page_size:
+                next_cursor = encode_list_cursor(events[-1].timestamp, events[-1].id)
             
-            return webhooks, total, next_cursor
+            # 查询总数（默认估算，避免每次请求全表计数）
+            total, total_type = count_webhooks(session, count_mode, filters)
+            
+            return webhooks, total, next_cursor, total_type
         
+    except ValueError:
+        raise
     except Exception as e:
         logger.error(f"从数据库查询 webhook 数据失败: {str(e)}")
         webhooks = get_webhooks_from_files(limit=page_size)
-        return webhooks, len(webhooks), None
+        return webhooks, len(webhooks), None, 'exact'
+
+
+def get_webhook_changes(
+    since_id: Optional[int] = None,
+    updated_since: Optional[datetime] = None,
+    fields: Optional[tuple[str, ...]] = None,
+    limit: int = 100,
+    filters: Optional[dict[str, Any]] = None
+) -> tuple[list[dict], bool, tuple[Optional[int], Optional[datetime]]]:
+    """
+    增量查询：ID 大于 since_id 的新事件，以及 updated_at 晚于 updated_since 的已更新事件
+    （重复告警递增了重复次数、转发状态变化等）
+    
+    新事件按 ID 升序在前，已有事件的更新按 (updated_at, id) 升序在后。变化超过 limit 时分批返回，
+    返回的游标只越过已返回的变化：新事件未取完时只推进 since_id；更新在 updated_at 边界处截断
+    （同一 updated_at 的更新总是一起返回，超过 limit 时也一次返回），updated_since 推进到该边界。
+    分批过程中同一事件可能先作为新事件、再作为更新出现两次，调用方按 ID 覆盖即可。
+    
+    Args:
+        since_id: 调用方已有的最大事件 ID
+        updated_since: 调用方已有的最新更新时间
+        fields: 只查询并返回这些字段（见 resolve_fields），None 表示全部字段；结果总是包含 updated_at
+        limit: 最多返回的事件数（同一 updated_at 的更新超过 limit 时除外）
+        filters: 过滤条件（见 resolve_filters），只返回满足条件的变化
+    
+    Returns:
+        tuple: (webhook 数据列表, 是否还有更多变化, 下一次调用的游标 (since_id, updated_since))
+    """
+    if since_id is None and updated_since is None:
+        return [], False, (None, None)
+    
+    if fields is not None and 'updated_at' not in fields:
+        fields = fields + ('updated_at',)
+    
+    with session_scope() as session:
+        query = apply_filters(session.query(WebhookEvent), filters)
+        if fields is not None:
+            query = query.options(load_only(*load_columns(fields), raiseload=True))
+        
+        created = []
+        if since_id is not None:
+            created = query.filter(WebhookEvent.id > since_id).order_by(WebhookEvent.id.asc()).limit(limit + 1).all()
+            if len(created) > limit:
+                # 新事件未取完：未返回的新事件 ID 都大于本批最大 ID，更新留到之后的批次
+                created = created[:limit]
+                attach_references(session, created, fields)
+                return [event.to_dict(fields) for event in created], True, (created[-1].id, updated_since)
+        
+        updated, truncated = [], False
+        if updated_since is not None:
+            updates = query.filter(WebhookEvent.updated_at > updated_since)
+            if since_id is not None:
+                updates = updates.filter(WebhookEvent.id <= since_id)
+            remaining = limit - len(created)
+            updated = updates.order_by(
+                WebhookEvent.updated_at.asc(), WebhookEvent.id.asc()
+            ).limit(remaining + 1).all()
+            if len(updated) > remaining:
+                truncated = True
+                boundary = updated[remaining].updated_at
+                updated = [event for event in updated[:remaining] if event.updated_at < boundary]
+                if not updated and not created:
+                    # 同一 updated_at 的更新超过 limit：一次全部返回，否则游标无法前进
+                    updated = updates.filter(WebhookEvent.updated_at == boundary).order_by(WebhookEvent.id.asc()).all()
+        
+        events = created + updated
+        attach_references(session, events, fields)
+        webhooks = [event.to_dict(fields) for event in events]
+        
+        if truncated:
+            # 未返回的更新 updated_at 都不早于边界；新事件已取完，since_id 推进到其中最大的 ID
+            if created:
+                since_id = created[-1].id
+            if updated:
+                updated_since = max(updated_since, updated[-1].updated_at)
+            return webhooks, True, (since_id, updated_since)
+        
+        # 全部变化都已返回
+        for event in events:
+            if since_id is None or event.id > since_id:
+                since_id = event.id
+            if event.updated_at is not None and (updated_since is None or event.updated_at > updated_since):
+                updated_since = event.updated_at
+        return webhooks, False, (since_id, updated_since)
+
+
+def get_webhook_by_id(webhook_id: int) -> Optional[dict]:
+    """获取单条 webhook 的完整数据（列表摘要视图的详情）"""
+    with session_scope() as session:
+        event = session.get(WebhookEvent, webhook_id)
+        return event.to_dict() if event else None
 
 
 def get_webhooks_from_files(limit: int = 50) -> list[dict]:  